@@ -69,6 +69,8 @@ MODIFY role ENUM('attendee', 'organizer', 'participant') NOT NULL;
 # to add a poster_path column to the events table to store the file path of the uploaded poster.
 ALTER TABLE events ADD COLUMN poster_path VARCHAR(255) DEFAULT NULL;
 
+# NOTE: schema changes after this point live in migrations/ (applied by `python migrate.py` or on app startup)
+
 SELECT * from users;
 DESCRIBE users;
 SELECT * from events;
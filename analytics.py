@@ -0,0 +1,186 @@
+"""Event analytics computed in the database.
+
+Replaces the R notebook's ``dbReadTable`` pulls: every metric is a
+``GROUP BY`` in MySQL (or a read of ``event_sales_rollup``), so only
+aggregates cross the wire, and the small result sets are shaped with NumPy
+for charting.
+"""
+import numpy as np
+
+PRICE_BINS = 10
+HEATMAP_USERS = 20
+HEATMAP_EVENTS = 20
+TOP_EVENTS = 25
+SCATTER_POINTS = 2000
+
+
+def _scope(organizer_id, alias="e"):
+    if organizer_id is None:
+        return "", ()
+    return f" AND {alias}.user_id = %s", (organizer_id,)
+
+
+def role_distribution(cursor):
+    cursor.execute("SELECT role, COUNT(*) AS users FROM users GROUP BY role ORDER BY role")
+    rows = cursor.fetchall()
+    return {
+        "role": [row["role"] for row in rows],
+        "users": np.array([row["users"] for row in rows], dtype=np.int64),
+    }
+
+
+def tickets_per_event(cursor, organizer_id=None, limit=TOP_EVENTS):
+    where, params = _scope(organizer_id)
+    cursor.execute(f"""
+        SELECT e.id, e.title, s.vip_sold AS vip_total, s.general_sold AS general_total
+        FROM event_sales_rollup s
+        JOIN events e ON e.id = s.event_id
+        WHERE s.bookings > 0{where}
+        ORDER BY s.vip_sold + s.general_sold DESC
+        LIMIT %s
+    """, params + (limit,))
+    rows = cursor.fetchall()
+    vip = np.array([row["vip_total"] or 0 for row in rows], dtype=np.int64)
+    general = np.array([row["general_total"] or 0 for row in rows], dtype=np.int64)
+    return {
+        "title": [row["title"] for row in rows],
+        "vip_total": vip,
+        "general_total": general,
+        "total": vip + general,
+    }
+
+
+def capacity_vs_booked(cursor, organizer_id=None, points=SCATTER_POINTS):
+    """Capacity vs tickets sold: trend fitted from SQL sums, plus a bounded scatter sample."""
+    where, params = _scope(organizer_id)
+    per_event = f"""
+        SELECT e.id, e.capacity, COALESCE(s.vip_sold + s.general_sold, 0) AS booked
+        FROM events e
+        LEFT JOIN event_sales_rollup s ON s.event_id = e.id
+        WHERE 1 = 1{where}
+    """
+    cursor.execute(f"""
+        SELECT COUNT(*) AS n, SUM(capacity) AS sx, SUM(booked) AS sy,
+               SUM(capacity * capacity) AS sxx, SUM(capacity * booked) AS sxy,
+               AVG(CASE WHEN capacity > 0 THEN booked / capacity END) AS fill
+        FROM ({per_event}) t
+    """, params)
+    sums = cursor.fetchone()
+    n = int(sums["n"] or 0)
+    stats = np.array([float(sums[k] or 0) for k in ("sx", "sy", "sxx", "sxy")])
+    sx, sy, sxx, sxy = stats
+    denominator = n * sxx - sx * sx
+    if n >= 2 and denominator:
+        slope = (n * sxy - sx * sy) / denominator
+        intercept = (sy - slope * sx) / n
+    else:
+        slope, intercept = 0.0, (sy / n if n else 0.0)
+
+    cursor.execute(f"{per_event} ORDER BY e.id DESC LIMIT %s", params + (points,))
+    rows = cursor.fetchall()
+    capacity = np.fromiter((row["capacity"] for row in rows), dtype=np.float64, count=len(rows))
+    booked = np.fromiter((row["booked"] for row in rows), dtype=np.float64, count=len(rows))
+    return {
+        "events": n,
+        "capacity": capacity,
+        "booked": booked,
+        "trend": slope * capacity + intercept,
+        "slope": float(slope),
+        "intercept": float(intercept),
+        "mean_fill_rate": float(sums["fill"] or 0),
+    }
+
+
+def price_distribution(cursor, organizer_id=None, bins=PRICE_BINS):
+    """Histogram of VIP and general prices, bucketed by MySQL."""
+    where, params = _scope(organizer_id)
+    cursor.execute(f"""
+        SELECT LEAST(MIN(vip_price), MIN(general_price)) AS lo,
+               GREATEST(MAX(vip_price), MAX(general_price)) AS hi
+        FROM events e WHERE 1 = 1{where}
+    """, params)
+    bounds = cursor.fetchone()
+    if not bounds or bounds["lo"] is None:
+        return {"edges": np.zeros(0), "vip_price": np.zeros(0, dtype=np.int64), "general_price": np.zeros(0, dtype=np.int64)}
+    lo, hi = float(bounds["lo"]), float(bounds["hi"])
+    width = (hi - lo) / bins or 1.0
+    edges = lo + width * np.arange(bins + 1)
+
+    counts = {}
+    for column in ("vip_price", "general_price"):
+        cursor.execute(f"""
+            SELECT LEAST(FLOOR((e.{column} - %s) / %s), %s) AS bucket, COUNT(*) AS n
+            FROM events e WHERE 1 = 1{where}
+            GROUP BY bucket
+        """, (lo, width, bins - 1) + params)
+        histogram = np.zeros(bins, dtype=np.int64)
+        rows = cursor.fetchall()
+        if rows:
+            buckets = np.array([int(row["bucket"]) for row in rows])
+            histogram[buckets] = [row["n"] for row in rows]
+        counts[column] = histogram
+    return {"edges": edges, **counts}
+
+
+def booking_heatmap(cursor, organizer_id=None, users=HEATMAP_USERS, events=HEATMAP_EVENTS):
+    """Tickets per (user, event) for the heaviest buyers and busiest events."""
+    where, params = _scope(organizer_id)
+    cursor.execute(f"""
+        SELECT b.event_id, e.title
+        FROM bookings b JOIN events e ON e.id = b.event_id
+        WHERE 1 = 1{where}
+        GROUP BY b.event_id, e.title
+        ORDER BY SUM(b.vip_tickets_booked + b.general_tickets_booked) DESC
+        LIMIT %s
+    """, params + (events,))
+    top_events = cursor.fetchall()
+    if not top_events:
+        return {"users": [], "events": [], "matrix": np.zeros((0, 0), dtype=np.int64)}
+    event_ids = [row["event_id"] for row in top_events]
+    marks = ", ".join(["%s"] * len(event_ids))
+
+    cursor.execute(f"""
+        SELECT b.user_id, u.name
+        FROM bookings b JOIN users u ON u.id = b.user_id
+        WHERE b.event_id IN ({marks})
+        GROUP BY b.user_id, u.name
+        ORDER BY SUM(b.vip_tickets_booked + b.general_tickets_booked) DESC
+        LIMIT %s
+    """, tuple(event_ids) + (users,))
+    top_users = cursor.fetchall()
+    user_ids = [row["user_id"] for row in top_users]
+    if not user_ids:
+        return {"users": [], "events": [], "matrix": np.zeros((0, 0), dtype=np.int64)}
+
+    cursor.execute(f"""
+        SELECT user_id, event_id, SUM(vip_tickets_booked + general_tickets_booked) AS tickets
+        FROM bookings
+        WHERE event_id IN ({marks}) AND user_id IN ({", ".join(["%s"] * len(user_ids))})
+        GROUP BY user_id, event_id
+    """, tuple(event_ids) + tuple(user_ids))
+    cells = cursor.fetchall()
+
+    user_pos = {user_id: i for i, user_id in enumerate(user_ids)}
+    event_pos = {event_id: j for j, event_id in enumerate(event_ids)}
+    matrix = np.zeros((len(user_ids), len(event_ids)), dtype=np.int64)
+    if cells:
+        rows = np.array([user_pos[c["user_id"]] for c in cells])
+        cols = np.array([event_pos[c["event_id"]] for c in cells])
+        matrix[rows, cols] = [int(c["tickets"]) for c in cells]
+    return {
+        "users": [row["name"] for row in top_users],
+        "events": [row["title"] for row in top_events],
+        "matrix": matrix,
+    }
+
+
+def insights(pool, organizer_id=None):
+    """All notebook metrics in one connection checkout, on a replica when there is one."""
+    with pool.read_connection(session=organizer_id) as conn, conn.cursor() as cursor:
+        return {
+            "roles": role_distribution(cursor),
+            "tickets": tickets_per_event(cursor, organizer_id),
+            "capacity": capacity_vs_booked(cursor, organizer_id),
+            "prices": price_distribution(cursor, organizer_id),
+            "heatmap": booking_heatmap(cursor, organizer_id),
+        }
@@ -0,0 +1,462 @@
+"""JSON HTTP API over the service layer, as a plain ASGI application.
+
+Serve it with any ASGI server, e.g. ``uvicorn api:app --workers 4``. Each
+worker process has its own connection pool and events snapshot. Blocking
+service calls run on a thread pool the size of the connection pool, so the
+event loop keeps accepting requests while MySQL works.
+
+Authentication: ``POST /login`` returns a bearer token (HMAC-signed, no
+server-side session); send it as ``Authorization: Bearer <token>``.
+
+    POST   /users                         sign up {name, email, password, role}
+    POST   /login                         {email, password} -> {token, user_id, role}
+    GET    /events?after=&limit=          active events, keyset paginated
+    GET    /events/search?q=&location=&from=&to=&price=&available=&after=&limit=
+                                          full-text + facets; location/price may repeat
+    GET    /events/{id}
+    POST   /events                        organizer: create
+    PATCH  /events/{id}                   organizer: update own event
+    DELETE /events/{id}                   organizer: cancel own event; refunds run as a background job
+    GET    /cancellations/{job_id}        organizer: progress of that job
+    POST   /events/{id}/checkins          organizer: {code} -> admitted / already_used / unknown / ...
+    GET    /events/{id}/checkins          organizer: this gate's check-in counters
+    POST   /events/{id}/bookings          attendee: {vip_tickets, general_tickets}
+    POST   /events/{id}/registrations     participant: register, or join the waitlist when full
+    DELETE /events/{id}/registrations     participant: give up a place / waitlist spot
+    GET    /me/bookings?before=&limit=    ticket wallet, newest first, keyset paginated
+    GET    /me/registrations
+    GET    /metrics                       admin: Prometheus text of the per-route and per-query metrics
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from urllib.parse import parse_qs
+
+import booking_engine
+import cache_bus
+import db_router
+import instrumentation
+from auth_service import AuthThrottled
+from db_pool import POOL_SIZE, ConnectionPool, PoolTimeout
+from event_snapshot import parse_time
+from services import Conflict, Forbidden, InvalidInput, NotFound, ServiceError, Services
+
+# Signing key for bearer tokens; set it so tokens survive restarts and work across workers
+API_SECRET = os.environ.get("EMS_API_SECRET", "").encode() or secrets.token_bytes(32)
+TOKEN_TTL = int(os.environ.get("EMS_API_TOKEN_TTL", "3600"))
+MAX_BODY = 1 << 20
+MAX_PAGE = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+# ✅ Tokens
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def issue_token(user_id, role, ttl=TOKEN_TTL):
+    payload = _b64(json.dumps({"uid": user_id, "role": role, "exp": int(time.time()) + ttl}).encode())
+    signature = _b64(hmac.new(API_SECRET, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+
+def read_token(token):
+    """``(user_id, role)`` for a valid, unexpired token, else ``None``."""
+    payload, _, signature = token.partition(".")
+    expected = _b64(hmac.new(API_SECRET, payload.encode(), hashlib.sha256).digest())
+    if not signature or not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        claims = json.loads(_unb64(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims["uid"], claims["role"]
+
+
+# ✅ Request / response plumbing
+class Request:
+    def __init__(self, scope, body, params):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.params = params
+        self.query_lists = parse_qs(scope.get("query_string", b"").decode())
+        self.query = {k: v[-1] for k, v in self.query_lists.items()}
+        self.headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+        self._body = body
+
+    def json(self):
+        if not self._body:
+            return {}
+        try:
+            data = json.loads(self._body)
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON.") from None
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object.")
+        return data
+
+    def user(self, *roles):
+        """The authenticated ``(user_id, role)``, optionally restricted to ``roles``."""
+        scheme, _, token = self.headers.get("authorization", "").partition(" ")
+        identity = read_token(token) if scheme.lower() == "bearer" else None
+        if identity is None:
+            raise HTTPError(401, "Missing or invalid bearer token.", [(b"www-authenticate", b"Bearer")])
+        if roles and identity[1] not in roles:
+            raise HTTPError(403, f"Only {' or '.join(roles)} accounts can do this.")
+        return identity
+
+
+def _plain(value):
+    if isinstance(value, timedelta):
+        return parse_time(value).strftime("%H:%M:%S")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _record(row):
+    return {key: _plain(row[key]) for key in row.keys()}
+
+
+def _field(data, name, kind, required=True):
+    value = data.get(name)
+    if value is None:
+        if required:
+            raise HTTPError(400, f"'{name}' is required.")
+        return None
+    try:
+        if kind is date:
+            return date.fromisoformat(value)
+        return kind(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' has an invalid value.") from None
+
+
+# ✅ Handlers (run on the worker threads)
+def sign_up(services, request):
+    data = request.json()
+    user_id = services.sign_up(data.get("name"), data.get("email"), data.get("password"), data.get("role") or "")
+    return 201, {"user_id": user_id}
+
+
+def login(services, request):
+    data = request.json()
+    user = services.login(data.get("email"), data.get("password"))
+    if not user:
+        raise HTTPError(401, "Invalid credentials!")
+    return 200, {"token": issue_token(user["id"], user["role"]), "user_id": user["id"], "role": user["role"]}
+
+
+def _parse_cursor(after):
+    """``date_time_id`` cursor from a previous page, or ``None``."""
+    if not after:
+        return None
+    try:
+        day, moment, event_id = after.split("_")
+        return (date.fromisoformat(day), parse_time(moment), int(event_id))
+    except ValueError:
+        raise HTTPError(400, "Invalid 'after' cursor.") from None
+
+
+def _format_cursor(key):
+    return f"{key[0].isoformat()}_{key[1].strftime('%H:%M:%S')}_{key[2]}" if key else None
+
+
+def list_events(services, request):
+    limit = min(_field(request.query, "limit", int, required=False) or 20, MAX_PAGE)
+    rows, next_key = services.list_events(after=_parse_cursor(request.query.get("after")), limit=limit)
+    return 200, {"events": [_record(row) for row in rows], "next": _format_cursor(next_key)}
+
+
+def search_events(services, request):
+    query = request.query
+    result = services.search_events(
+        text=query.get("q"),
+        locations=request.query_lists.get("location"),
+        date_from=_field(query, "from", date, required=False),
+        date_to=_field(query, "to", date, required=False),
+        price_bands=request.query_lists.get("price"),
+        available_only=query.get("available", "").lower() in ("1", "true", "yes"),
+        after=_parse_cursor(query.get("after")),
+        limit=min(_field(query, "limit", int, required=False) or 20, MAX_PAGE),
+    )
+    return 200, {
+        "events": [_record(row) for row in result.rows],
+        "total": result.total,
+        "facets": result.facets,
+        "next": _format_cursor(result.next_cursor),
+    }
+
+
+def get_event(services, request):
+    return 200, _record(services.get_event(int(request.params["event_id"])))
+
+
+def create_event(services, request):
+    organizer_id, _ = request.user("organizer")
+    data = request.json()
+    event_id = services.create_event(
+        organizer_id, data.get("title"), data.get("location"),
+        _field(data, "date", date), _field(data, "time", parse_time), _field(data, "duration_minutes", int, False) or 60,
+        data.get("description"), _field(data, "capacity", int),
+        _field(data, "vip_price", float), _field(data, "general_price", float),
+    )
+    return 201, {"event_id": event_id}
+
+
+def update_event(services, request):
+    organizer_id, _ = request.user("organizer")
+    event_id = int(request.params["event_id"])
+    event = services.get_event(event_id)
+    data = request.json()
+    capacity = _field(data, "capacity", int, required=False)
+    warnings = services.update_event(
+        organizer_id, event_id,
+        data.get("title", event["title"]), data.get("location", event["location"]),
+        data.get("description", event["description"]),
+        event["capacity"] if capacity is None else capacity,
+    )
+    return 200, {"event_id": event_id, "warnings": warnings}
+
+
+def cancel_event(services, request):
+    organizer_id, _ = request.user("organizer")
+    job_id = services.cancel_event(organizer_id, int(request.params["event_id"]))
+    return 202, {"event_id": int(request.params["event_id"]), "status": "canceled", "job_id": job_id}
+
+
+def cancellation_job(services, request):
+    organizer_id, _ = request.user("organizer")
+    job = services.cancellation_job(organizer_id, int(request.params["job_id"]))
+    return 200, _record({key: value for key, value in job.items() if key not in ("lease_owner", "lease_until")})
+
+
+def check_in(services, request):
+    organizer_id, _ = request.user("organizer")
+    result = services.check_in(organizer_id, int(request.params["event_id"]), _field(request.json(), "code", str))
+    return 200, _record(result._asdict())
+
+
+def checkin_stats(services, request):
+    organizer_id, _ = request.user("organizer")
+    return 200, services.checkin_gate(organizer_id, int(request.params["event_id"])).stats()
+
+
+def book(services, request):
+    user_id, _ = request.user("attendee")
+    data = request.json()
+    booking = services.book(
+        user_id, int(request.params["event_id"]),
+        _field(data, "vip_tickets", int, required=False) or 0,
+        _field(data, "general_tickets", int, required=False) or 0,
+    )
+    return 201, booking._asdict()
+
+
+def register(services, request):
+    user_id, _ = request.user("participant")
+    outcome = services.register(user_id, int(request.params["event_id"]))
+    return 201, {"event_id": int(request.params["event_id"]), "status": outcome}
+
+
+def unregister(services, request):
+    user_id, _ = request.user("participant")
+    services.cancel_registration(user_id, int(request.params["event_id"]))
+    return 200, {"event_id": int(request.params["event_id"]), "status": "canceled"}
+
+
+def metrics(services, request):
+    request.user("admin")
+    return 200, instrumentation.REGISTRY.prometheus()
+
+
+def my_bookings(services, request):
+    user_id, _ = request.user()
+    rows, next_before = services.my_bookings(
+        user_id, _field(request.query, "before", int, required=False),
+        min(_field(request.query, "limit", int, required=False) or 20, MAX_PAGE),
+    )
+    return 200, {"bookings": [_record(row) for row in rows], "next": next_before}
+
+
+def my_registrations(services, request):
+    user_id, _ = request.user()
+    return 200, {
+        "registrations": [_record(row) for row in services.my_registrations(user_id)],
+        "waitlist": [_record(row) for row in services.my_waitlist(user_id)],
+    }
+
+
+ROUTES = [
+    ("POST", r"/users", sign_up),
+    ("POST", r"/login", login),
+    ("GET", r"/events", list_events),
+    ("GET", r"/events/search", search_events),
+    ("POST", r"/events", create_event),
+    ("GET", r"/events/(?P<event_id>\d+)", get_event),
+    ("PATCH", r"/events/(?P<event_id>\d+)", update_event),
+    ("DELETE", r"/events/(?P<event_id>\d+)", cancel_event),
+    ("GET", r"/cancellations/(?P<job_id>\d+)", cancellation_job),
+    ("POST", r"/events/(?P<event_id>\d+)/checkins", check_in),
+    ("GET", r"/events/(?P<event_id>\d+)/checkins", checkin_stats),
+    ("POST", r"/events/(?P<event_id>\d+)/bookings", book),
+    ("POST", r"/events/(?P<event_id>\d+)/registrations", register),
+    ("DELETE", r"/events/(?P<event_id>\d+)/registrations", unregister),
+    ("GET", r"/me/bookings", my_bookings),
+    ("GET", r"/me/registrations", my_registrations),
+    ("GET", r"/metrics", metrics),
+]
+_ROUTES = [(method, re.compile(pattern + r"/?\Z"), handler) for method, pattern, handler in ROUTES]
+
+# Service exceptions -> HTTP status
+ERROR_STATUS = [
+    (InvalidInput, 400),
+    (booking_engine.EventUnavailable, 404),
+    (NotFound, 404),
+    (Forbidden, 403),
+    (booking_engine.SoldOut, 409),
+    (Conflict, 409),
+    (booking_engine.BookingError, 400),
+    (ServiceError, 400),
+    (AuthThrottled, 429),
+    (PoolTimeout, 503),
+]
+
+
+def _route(method, path):
+    allowed = False
+    for route_method, pattern, handler in _ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, match.groupdict()
+            allowed = True
+    raise HTTPError(405 if allowed else 404, "Method not allowed." if allowed else "Not found.")
+
+
+def _dispatch(services, scope, body):
+    """Run one request synchronously; returns ``(status, payload, headers)``."""
+    try:
+        handler, params = _route(scope["method"], scope["path"])
+        with instrumentation.REGISTRY.page(f"api:{handler.__name__}"):
+            status, payload = handler(services, Request(scope, body, params))
+        return status, payload, []
+    except HTTPError as e:
+        return e.status, {"error": str(e)}, e.headers
+    except Exception as e:
+        for kind, status in ERROR_STATUS:
+            if isinstance(e, kind):
+                headers = [(b"retry-after", b"5")] if isinstance(e, AuthThrottled) else []
+                return status, {"error": str(e)}, headers
+        raise
+
+
+class App:
+    def __init__(self, services_factory=None, workers=POOL_SIZE):
+        self._factory = services_factory or self._default_services
+        self._workers = workers
+        self.services = None
+        self._executor = None
+        self._startup_lock = threading.Lock()
+
+    @staticmethod
+    def _default_services():
+        pool = db_router.from_env(instrumentation.InstrumentedPool if instrumentation.ENABLED else ConnectionPool)
+        return Services(pool, bus=cache_bus.from_env(pool))
+
+    def startup(self):
+        """Build the services once, from the lifespan handler or the first request."""
+        with self._startup_lock:
+            if self.services is not None:
+                return
+            services = self._factory()
+            services.start_workers()
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="api")
+            # Published last: a request that sees ``services`` also sees the executor
+            self.services = services
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self.services is not None:
+            self.services.shutdown()
+            self.services.pool.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if self.services is None:
+            self.startup()
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY:
+                await self._respond(send, 413, {"error": "Request body too large."})
+                return
+            if not message.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        try:
+            status, payload, headers = await loop.run_in_executor(
+                self._executor, _dispatch, self.services, scope, body
+            )
+        except Exception as e:
+            status, payload, headers = 500, {"error": f"Internal error: {type(e).__name__}"}, []
+        await self._respond(send, status, payload, headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _respond(send, status, payload, headers=()):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), b"text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=_plain).encode(), b"application/json"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+app = App()
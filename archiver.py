@@ -0,0 +1,248 @@
+"""Archival of finished and canceled events.
+
+The live ``events`` table and its children (bookings, registrations, refunds)
+only need the events that can still be booked, edited or canceled. Every
+``status = 'active'`` scan, snapshot reload and per-event join touches them,
+so they should not grow with history. ``archive()`` moves these events into
+the ``*_archive`` tables, ``ARCHIVE_BATCH`` events per transaction:
+- events that took place more than ``ARCHIVE_AFTER_DAYS`` ago;
+- events canceled more than ``ARCHIVE_AFTER_DAYS`` ago whose refund job has
+  finished.
+
+Archived events keep their status, except that past active events become
+``finished``. Their waitlist, price and sales-rollup rows are dropped.
+
+The archive tables are range-partitioned by event date, one partition per
+year. A year of history can be exported to gzipped JSON lines and its
+partitions dropped, without touching live rows:
+
+    python archiver.py                        # one archival run
+    python archiver.py --dry-run              # count what would move
+    python archiver.py --export 2024 --dir /backups [--drop]
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+from datetime import date
+
+import pymysql
+
+from event_snapshot import EVENT_COLUMNS
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("EMS_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH = int(os.environ.get("EMS_ARCHIVE_BATCH", "100"))
+INTERVAL = float(os.environ.get("EMS_ARCHIVE_INTERVAL", "3600"))
+LOCK_NAME = "event_management_archiver"
+# Yearly partitions are kept this many years ahead of today
+PARTITIONS_AHEAD = 1
+
+# (live table, archive table, columns copied); refunds first, they reference bookings
+CHILD_TABLES = (
+    ("refunds", "refunds_archive", ("id", "user_id", "booking_id", "event_id", "request_date", "status")),
+    ("bookings", "bookings_archive", ("id", "user_id", "event_id", "vip_tickets_booked", "general_tickets_booked",
+                                      "amount", "created_at", "ticket_code")),
+    ("registrations", "registrations_archive", ("id", "user_id", "event_id", "registration_date")),
+)
+# Per-event state with no use once the event is over
+DROPPED_TABLES = ("registration_waitlist", "event_prices", "event_sales_rollup")
+# (archive table, partitioning column)
+ARCHIVE_TABLES = (
+    ("events_archive", "date"),
+    ("bookings_archive", "event_date"),
+    ("registrations_archive", "event_date"),
+    ("refunds_archive", "event_date"),
+)
+
+# Events ready to move; refunds of a canceled event must have finished first
+_ARCHIVABLE = """
+    ((e.status = 'active' AND e.date < CURDATE() - INTERVAL %s DAY)
+     OR (e.status = 'canceled' AND e.updated_at < NOW() - INTERVAL %s DAY))
+    AND NOT EXISTS (SELECT 1 FROM cancellation_jobs j WHERE j.event_id = e.id AND j.status <> 'done')
+"""
+
+
+def _marks(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def ensure_partitions(cursor, ahead=PARTITIONS_AHEAD, first_year=None):
+    """Split ``pmax`` so every archive table has a partition per year up to ``ahead`` years from now."""
+    cursor.execute(f"""
+        SELECT TABLE_NAME AS table_name, PARTITION_NAME AS partition_name
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND PARTITION_NAME IS NOT NULL
+          AND TABLE_NAME IN ({_marks(ARCHIVE_TABLES)})
+    """, [table for table, _ in ARCHIVE_TABLES])
+    years = {}
+    for row in cursor.fetchall():
+        name = row["partition_name"]
+        if name[1:].isdigit():
+            years.setdefault(row["table_name"], []).append(int(name[1:]))
+    last = date.today().year + ahead
+    for table, _ in ARCHIVE_TABLES:
+        existing = years.get(table)
+        start = max(existing) + 1 if existing else min(first_year or last, date.today().year)
+        if start > last:
+            continue
+        # Reorganizing pmax only rewrites rows dated after the last year partition: none in practice
+        new = ", ".join(f"PARTITION p{year} VALUES LESS THAN ('{year + 1}-01-01')" for year in range(start, last + 1))
+        cursor.execute(
+            f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({new}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        )
+
+
+def _move(cursor, ids):
+    """Copy the events and their children into the archive tables, then delete them; one transaction."""
+    marks = _marks(ids)
+    columns = ", ".join(EVENT_COLUMNS)
+    values = ", ".join("IF(status = 'active', 'finished', status)" if c == "status" else c for c in EVENT_COLUMNS)
+    cursor.execute(f"INSERT INTO events_archive ({columns}) SELECT {values} FROM events WHERE id IN ({marks})", ids)
+    moved = {"events": cursor.rowcount}
+    for table, archive, child_columns in CHILD_TABLES:
+        cursor.execute(f"""
+            INSERT INTO {archive} ({", ".join(child_columns)}, event_date)
+            SELECT {", ".join(f"t.{c}" for c in child_columns)}, e.date
+            FROM {table} t JOIN events e ON e.id = t.event_id
+            WHERE t.event_id IN ({marks})
+        """, ids)
+        moved[table] = cursor.rowcount
+    for table, _, _ in CHILD_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE event_id IN ({marks})", ids)
+    for table in DROPPED_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE event_id IN ({marks})", ids)
+    cursor.execute(f"DELETE FROM events WHERE id IN ({marks})", ids)
+    return moved
+
+
+def archive(pool, days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH, dry_run=False, log=print):
+    """Move every archivable event; returns ``{table: rows moved}`` (events only for a dry run)."""
+    totals = {"events": 0}
+    with pool.connection() as conn, conn.cursor() as cursor:
+        # One archiver at a time across processes; others skip this round
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,))
+        if not cursor.fetchone()["acquired"]:
+            return totals
+        try:
+            if dry_run:
+                cursor.execute(f"SELECT COUNT(*) AS n FROM events e WHERE {_ARCHIVABLE}", (days, days))
+                totals["events"] = cursor.fetchone()["n"]
+                log(f"{totals['events']} event(s) would be archived.")
+                return totals
+            ensure_partitions(cursor)
+            last_id = 0
+            while True:
+                cursor.execute(
+                    f"SELECT e.id FROM events e WHERE e.id > %s AND {_ARCHIVABLE} ORDER BY e.id LIMIT %s",
+                    (last_id, days, days, batch),
+                )
+                ids = [row["id"] for row in cursor.fetchall()]
+                if not ids:
+                    break
+                last_id = ids[-1]
+                conn.begin()
+                # Re-check under row locks: an organizer may have moved the date since
+                cursor.execute(
+                    f"SELECT e.id FROM events e WHERE e.id IN ({_marks(ids)}) AND {_ARCHIVABLE} FOR UPDATE",
+                    (*ids, days, days),
+                )
+                locked = [row["id"] for row in cursor.fetchall()]
+                if not locked:
+                    conn.rollback()
+                    continue
+                for table, rows in _move(cursor, locked).items():
+                    totals[table] = totals.get(table, 0) + rows
+                conn.commit()
+                if len(ids) < batch:
+                    break
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    if totals["events"]:
+        log("Archived " + ", ".join(f"{rows} {table}" for table, rows in totals.items()) + ".")
+    return totals
+
+
+def export_year(pool, year, directory, drop=False, log=print):
+    """Write one year of every archive table to ``<table>-<year>.jsonl.gz``; optionally drop those partitions.
+
+    The oldest year partition also holds anything dated before it, so its
+    export (and drop) covers those rows too.
+    """
+    if year >= date.today().year:
+        raise ValueError("Only past years can be exported.")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with pool.connection() as conn:
+        for table, _ in ARCHIVE_TABLES:
+            path = os.path.join(directory, f"{table}-{year}.jsonl.gz")
+            rows = 0
+            # Unbuffered, so a year of bookings streams instead of loading into memory
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cursor, gzip.open(path, "wt", encoding="utf-8") as f:
+                cursor.execute(f"SELECT * FROM {table} PARTITION (p{year})")
+                for row in cursor:
+                    f.write(json.dumps(row, default=str) + "\n")
+                    rows += 1
+            paths.append(path)
+            log(f"{table}: {rows} row(s) -> {path}")
+        if drop:
+            with conn.cursor() as cursor:
+                for table, _ in ARCHIVE_TABLES:
+                    cursor.execute(f"ALTER TABLE {table} DROP PARTITION p{year}")
+            log(f"Dropped partition p{year}.")
+    return paths
+
+
+class ArchiveJob:
+    """Background thread running ``archive()`` every ``interval`` seconds."""
+
+    def __init__(self, pool, interval=INTERVAL, on_change=None):
+        self.pool = pool
+        self.interval = interval
+        self.on_change = on_change
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="archive-job", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if archive(self.pool, log=lambda message: None)["events"] and self.on_change:
+                    self.on_change()
+            except Exception as e:
+                print(f"Archive job error: {e}")
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Archive finished and canceled events")
+    parser.add_argument("--dry-run", action="store_true", help="count the events that would be archived")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help="archive events this many days after they took place or were canceled")
+    parser.add_argument("--export", type=int, metavar="YEAR", help="export one year of the archive instead")
+    parser.add_argument("--dir", default=".", help="directory for --export files")
+    parser.add_argument("--drop", action="store_true", help="drop the year's partitions after --export")
+    args = parser.parse_args()
+    pool = ConnectionPool(size=1)
+    try:
+        if args.export is not None:
+            export_year(pool, args.export, args.dir, drop=args.drop)
+        else:
+            archive(pool, days=args.days, dry_run=args.dry_run)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("EMS_BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.environ.get("EMS_AUTH_WORKERS", str(os.cpu_count() or 2)))
+# Hash jobs allowed to run or wait at once; beyond that callers are throttled
+AUTH_MAX_IN_FLIGHT = int(os.environ.get("EMS_AUTH_MAX_IN_FLIGHT", str(AUTH_WORKERS * 4)))
+AUTH_QUEUE_TIMEOUT = float(os.environ.get("EMS_AUTH_QUEUE_TIMEOUT", "2"))
+# Login attempts allowed per email address in the rate-limit window
+LOGIN_ATTEMPTS = int(os.environ.get("EMS_LOGIN_ATTEMPTS", "5"))
+LOGIN_WINDOW = float(os.environ.get("EMS_LOGIN_WINDOW", "60"))
+
+
+class AuthThrottled(Exception):
+    """The hashing pool is saturated; the caller should retry shortly."""
+
+
+class RateLimited(AuthThrottled):
+    """Too many attempts for one email address."""
+
+
+# Run inside the worker processes
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password, hashed):
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        # Not a bcrypt hash (e.g. plain-text seed rows)
+        return False
+
+
+def hash_cost(hashed):
+    """Cost factor of a ``$2b$12$...`` hash, or ``None`` if it isn't bcrypt."""
+    parts = hashed.split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Sliding-window counter of attempts per key."""
+
+    def __init__(self, attempts=LOGIN_ATTEMPTS, window=LOGIN_WINDOW):
+        self.attempts = attempts
+        self.window = window
+        self._lock = threading.Lock()
+        self._hits = {}
+
+    def hit(self, key):
+        """Record an attempt; returns seconds to wait if over the limit, else 0."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and now - hits[0] > self.window:
+                hits.popleft()
+            if len(hits) >= self.attempts:
+                return self.window - (now - hits[0])
+            hits.append(now)
+            if len(self._hits) > 10000:
+                self._prune(now)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _prune(self, now):
+        for key in [k for k, hits in self._hits.items() if not hits or now - hits[-1] > self.window]:
+            del self._hits[key]
+
+
+class AuthService:
+    """Password hashing off the Streamlit script thread.
+
+    bcrypt runs in a process pool with a cap on queued work: when the cap is
+    reached for longer than ``queue_timeout`` seconds, callers get
+    ``AuthThrottled`` instead of piling up. Logins are rate limited per email,
+    and hashes made with a different cost than ``rounds`` are replaced on the
+    next successful login.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=AUTH_WORKERS, max_in_flight=AUTH_MAX_IN_FLIGHT,
+                 queue_timeout=AUTH_QUEUE_TIMEOUT, rate_limiter=None):
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # spawn: never fork a multi-threaded server process
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise AuthThrottled("Too many sign-ins right now. Please try again in a few seconds.")
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash_password(self, password):
+        return self._run(_hash, password.encode(), self.rounds)
+
+    def verify_password(self, password, hashed):
+        return self._run(_check, password.encode(), hashed.encode())
+
+    def login(self, pool, email, password):
+        """Return the user row for valid credentials, else ``None``."""
+        wait = self.rate_limiter.hit(email.strip().lower())
+        if wait:
+            raise RateLimited(f"Too many login attempts. Try again in {int(wait) + 1} seconds.")
+
+        with pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT id, password, role FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
+
+        if not user or not self.verify_password(password, user["password"]):
+            return None
+        self.rate_limiter.reset(email.strip().lower())
+
+        if hash_cost(user["password"]) != self.rounds:
+            self._upgrade_hash(pool, user, password)
+        return user
+
+    def _upgrade_hash(self, pool, user, password):
+        """Rehash at the configured cost; best effort, so a later login retries if it fails."""
+        try:
+            new_hash = self.hash_password(password)
+            with pool.connection() as conn, conn.cursor() as cursor:
+                # Only replace the hash we verified, in case the password changed meanwhile
+                cursor.execute(
+                    "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                    (new_hash, user["id"], user["password"]),
+                )
+        except Exception as e:
+            print(f"Password rehash error: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
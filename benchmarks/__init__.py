@@ -0,0 +1,14 @@
+"""Load generation and benchmarks for the event workflows.
+
+Run from the repository root against a scratch database (EMS_DB_* variables)
+with the migrations applied:
+
+    python -m benchmarks generate --users 5000 --events 20000 --bookings 100000 --registrations 50000
+    python -m benchmarks run --sessions 50 --duration 60 --label baseline
+    python -m benchmarks compare benchmarks/results/baseline.json benchmarks/results/candidate.json
+
+``run`` drives the page logic of Home, View Events, Buy Ticket, Register for
+Event and Login from many concurrent simulated sessions. It reports p50,
+p95 and p99 latency, queries per page and database round-trips per page,
+and writes the results to ``benchmarks/results/`` for later comparison.
+"""
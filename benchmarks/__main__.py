@@ -0,0 +1,78 @@
+import argparse
+import sys
+import time
+
+import instrumentation
+from benchmarks import dataset, report, workload
+from benchmarks.instrument import Recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Event workflow benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="insert a synthetic dataset")
+    gen.add_argument("--users", type=int, default=2000)
+    gen.add_argument("--events", type=int, default=10000)
+    gen.add_argument("--bookings", type=int, default=50000)
+    gen.add_argument("--registrations", type=int, default=20000)
+    gen.add_argument("--past-share", type=float, default=0.5, help="fraction of events already finished")
+    gen.add_argument("--seed", type=int)
+
+    run = commands.add_parser("run", help="drive the pages with concurrent sessions")
+    run.add_argument("--sessions", type=int, default=20)
+    run.add_argument("--duration", type=float, default=30, help="seconds")
+    run.add_argument("--think-time", type=float, default=0, help="mean seconds between page views")
+    run.add_argument("--pool-size", type=int, help="default: EMS_DB_POOL_SIZE")
+    run.add_argument("--label", help="results file name (default: timestamp)")
+    run.add_argument("--baseline", help="results file to compare against")
+    run.add_argument("--seed", type=int)
+
+    cmp = commands.add_parser("compare", help="compare two results files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("candidate")
+    cmp.add_argument("--tolerance", type=float, default=report.P95_TOLERANCE)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        problems = report.compare(report.load(args.baseline), report.load(args.candidate), args.tolerance)
+        for line in problems:
+            print(f"REGRESSION  {line}")
+        sys.exit(1 if problems else 0)
+
+    pool_kwargs = {"size": args.pool_size} if getattr(args, "pool_size", None) else {}
+    # A registry of its own, so the samples are not mixed into the process-wide one or EMS_METRICS_LOG
+    registry = instrumentation.Registry(log_path=None)
+    pool = instrumentation.InstrumentedPool(registry=registry, **pool_kwargs)
+    try:
+        if args.command == "generate":
+            dataset.generate(pool, args.users, args.events, args.bookings, args.registrations,
+                             past_share=args.past_share, seed=args.seed)
+            return
+
+        ctx = workload.Context(pool)
+        recorder = Recorder(registry)
+        started = time.monotonic()
+        try:
+            views = workload.run(ctx, recorder, sessions=args.sessions, duration=args.duration,
+                                 think_time=args.think_time, seed=args.seed)
+        finally:
+            ctx.services.shutdown()
+        config = {key: value for key, value in vars(args).items() if key not in ("command", "baseline")}
+        result = report.build(recorder, config, time.monotonic() - started, views, pool.stats())
+        report.print_table(result)
+        print(f"Saved {report.save(result, args.label)}")
+
+        if args.baseline:
+            problems = report.compare(report.load(args.baseline), result)
+            for line in problems:
+                print(f"REGRESSION  {line}")
+            if problems:
+                sys.exit(1)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
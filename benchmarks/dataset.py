@@ -0,0 +1,114 @@
+"""Synthetic users, events, bookings and registrations for benchmark runs."""
+import random
+from datetime import date, time, timedelta
+
+import bcrypt
+
+import sales_rollup
+import tickets
+from auth_service import BCRYPT_ROUNDS
+from explain_check import LOCATIONS, booking_time
+
+# Every generated user signs in with this password
+BENCH_PASSWORD = "bench-password"
+EMAIL_PATTERN = "bench{}@example.com"
+DESCRIPTION = "Synthetic benchmark event"
+BATCH = 5000
+# Share of generated users per role
+ROLE_MIX = (("attendee", 0.7), ("participant", 0.2), ("organizer", 0.1))
+
+
+def _batches(count, size=BATCH):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+def generate(pool, users, events, bookings, registrations, past_share=0.5, seed=None, log=print):
+    """Append a synthetic dataset; ids continue after whatever is already there."""
+    rng = random.Random(seed)
+    today = date.today()
+    password = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+    roles = [role for role, _ in ROLE_MIX]
+    weights = [share for _, share in ROLE_MIX]
+
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM users")
+        first_user = cursor.fetchone()["max_id"] + 1
+        for start, size in _batches(users):
+            cursor.executemany(
+                "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s)",
+                [
+                    (f"Bench User {first_user + start + i}", EMAIL_PATTERN.format(first_user + start + i),
+                     password, rng.choices(roles, weights)[0])
+                    for i in range(size)
+                ],
+            )
+        log(f"Users: {users}")
+
+        cursor.execute("SELECT id, role FROM users WHERE email LIKE %s", (EMAIL_PATTERN.format("%"),))
+        by_role = {}
+        for row in cursor.fetchall():
+            by_role.setdefault(row["role"], []).append(row["id"])
+        organizers = by_role.get("organizer") or [None]
+        attendees = by_role.get("attendee", [])
+        participants = by_role.get("participant", [])
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM events")
+        last_event = cursor.fetchone()["max_id"]
+        for start, size in _batches(events):
+            rows = []
+            for i in range(size):
+                past = rng.random() < past_share
+                day = today - timedelta(days=rng.randint(1, 3 * 365)) if past else today + timedelta(days=rng.randint(1, 180))
+                capacity = rng.randint(50, 1000)
+                vip = int(capacity * 0.3)
+                rows.append((
+                    f"Bench Event {last_event + start + i + 1}", rng.choice(LOCATIONS), day,
+                    time(rng.randint(8, 21), rng.choice((0, 15, 30, 45))), rng.choice((60, 90, 120)),
+                    DESCRIPTION, capacity, vip, capacity - vip, round(rng.uniform(20, 120), 2),
+                    round(rng.uniform(5, 60), 2), rng.choice(organizers), "finished" if past else "active",
+                ))
+            cursor.executemany("""
+                INSERT INTO events (title, location, date, time, duration_minutes, description, capacity,
+                                    vip_tickets, general_tickets, vip_price, general_price, user_id, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, rows)
+        # Read the ids back: with auto_increment_increment > 1 they are not consecutive
+        cursor.execute(
+            "SELECT id, date, vip_price, general_price FROM events WHERE id > %s AND description = %s ORDER BY id",
+            (last_event, DESCRIPTION),
+        )
+        created = cursor.fetchall()
+        log(f"Events: {len(created)}")
+
+        if attendees and created:
+            for start, size in _batches(bookings):
+                rows = []
+                for _ in range(size):
+                    event = rng.choice(created)
+                    vip, general = rng.choice((0, 0, 1, 2)), rng.randint(1, 4)
+                    rows.append((
+                        rng.choice(attendees), event["id"], vip, general,
+                        vip * event["vip_price"] + general * event["general_price"],
+                        tickets.issue(event["id"]), booking_time(rng, event["date"], today),
+                    ))
+                cursor.executemany("""
+                    INSERT INTO bookings (user_id, event_id, vip_tickets_booked, general_tickets_booked, amount,
+                                          ticket_code, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, rows)
+            log(f"Bookings: {bookings}")
+
+        if participants and created:
+            for start, size in _batches(registrations):
+                cursor.executemany(
+                    "INSERT IGNORE INTO registrations (user_id, event_id) VALUES (%s, %s)",
+                    [(rng.choice(participants), rng.choice(created)["id"]) for _ in range(size)],
+                )
+            log(f"Registrations: up to {registrations} (duplicates skipped)")
+
+    sales_rollup.reconcile(pool, fix=True, log=lambda message: None)
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("ANALYZE TABLE users, events, bookings, registrations, event_sales_rollup")
+        cursor.fetchall()
+    log("Sales rollup rebuilt and tables analyzed.")
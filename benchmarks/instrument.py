@@ -0,0 +1,27 @@
+import threading
+from contextlib import contextmanager
+
+
+class Recorder:
+    """Per-page samples of ``(seconds, queries, round_trips, ok)``.
+
+    Each page view is one run of ``registry``, an ``instrumentation.Registry``
+    shared with the ``instrumentation.InstrumentedPool`` the pages query.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    @contextmanager
+    def measure(self, page):
+        self.registry.begin(page)
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            run = self.registry.end()
+            with self._lock:
+                self.samples.setdefault(page, []).append((run.seconds, run.queries, run.round_trips, ok))
@@ -0,0 +1,90 @@
+"""Summaries of a run, stored as JSON, and comparison between two runs."""
+import json
+import os
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+# A page regresses when its p95 grows by more than this fraction
+P95_TOLERANCE = 0.20
+
+
+def summarise(recorder):
+    pages = {}
+    for page, samples in sorted(recorder.samples.items()):
+        data = np.array([s[:3] for s in samples], dtype=np.float64)
+        ok = np.array([s[3] for s in samples], dtype=bool)
+        latency_ms = data[:, 0] * 1000
+        p50, p95, p99 = np.percentile(latency_ms, [50, 95, 99])
+        pages[page] = {
+            "count": len(samples),
+            "errors": int((~ok).sum()),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(latency_ms.mean()), 2),
+            "queries_per_page": round(float(data[:, 1].mean()), 2),
+            "round_trips_per_page": round(float(data[:, 2].mean()), 2),
+        }
+    return pages
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build(recorder, config, duration, views, pool_stats):
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "config": config,
+        "duration_s": round(duration, 2),
+        "page_views": views,
+        "throughput_per_s": round(views / duration, 2) if duration else 0,
+        "pages": summarise(recorder),
+        "pool": pool_stats,
+    }
+
+
+def save(result, label=None, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    name = label or datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+    return path
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, tolerance=P95_TOLERANCE):
+    """Regressions of ``candidate`` against ``baseline`` as readable lines."""
+    problems = []
+    for page, before in baseline["pages"].items():
+        after = candidate["pages"].get(page)
+        if after is None:
+            continue
+        if before["p95_ms"] and after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            problems.append(f"{page}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+        if after["queries_per_page"] > before["queries_per_page"] + 0.5:
+            problems.append(f"{page}: queries/page {before['queries_per_page']} -> {after['queries_per_page']}")
+    return problems
+
+
+def print_table(result):
+    print(f"{'page':<14}{'views':>8}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'trips':>8}")
+    for page, s in result["pages"].items():
+        print(f"{page:<14}{s['count']:>8}{s['errors']:>6}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+              f"{s['queries_per_page']:>9}{s['round_trips_per_page']:>8}")
+    print(f"{result['page_views']} page views in {result['duration_s']} s ({result['throughput_per_s']}/s)")
@@ -0,0 +1,149 @@
+"""Concurrent simulated sessions driving the page logic of the app."""
+import random
+import threading
+import time
+from datetime import date
+
+import booking_engine
+from benchmarks.dataset import BENCH_PASSWORD, EMAIL_PATTERN
+from calendar_service import CalendarService
+from services import ServiceError, Services
+
+# Relative frequency of each page in the simulated traffic
+PAGE_MIX = {"home": 30, "view_events": 25, "buy_ticket": 20, "register": 15, "login": 10}
+PAGE_SIZE = 10
+
+
+class Context:
+    """Process-wide objects, shared by all sessions as ``st.cache_resource`` shares them in the app."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.services = Services(pool)
+        self.snapshot = self.services.snapshot
+        self.calendar = CalendarService()
+        self._event_ids = (None, [])
+        self._lock = threading.Lock()
+
+    def event_ids(self):
+        version, ids = self._event_ids
+        if version != self.snapshot.version:
+            with self._lock:
+                ids = [row.id for row in self.snapshot.active()]
+                self._event_ids = (self.snapshot.version, ids)
+        return ids
+
+    def load_snapshot(self):
+        return self.services.load_snapshot()
+
+
+class Session:
+    def __init__(self, user, rng):
+        self.user_id = user["id"]
+        self.email = user["email"]
+        self.role = user["role"]
+        self.rng = rng
+
+
+# ✅ Pages: the same service calls the Streamlit pages make, without rendering
+def home(ctx, session):
+    rows, _ = ctx.services.list_events(limit=PAGE_SIZE)
+    return rows
+
+
+def view_events(ctx, session):
+    snapshot = ctx.load_snapshot()
+    if session.role == "organizer":
+        today = date.today()
+        return ctx.calendar.month_weeks(snapshot, today.year, today.month)
+    rows, _ = snapshot.page(limit=PAGE_SIZE)
+    return rows
+
+
+def buy_ticket(ctx, session):
+    ctx.load_snapshot()
+    event_ids = ctx.event_ids()
+    if not event_ids:
+        return None
+    try:
+        return ctx.services.book(session.user_id, session.rng.choice(event_ids), 0, 1)
+    except booking_engine.BookingError:
+        return None
+
+
+def register(ctx, session):
+    ctx.load_snapshot()
+    event_ids = ctx.event_ids()
+    if not event_ids:
+        return None
+    event_id = session.rng.choice(event_ids)
+    if ctx.services.is_registered(session.user_id, event_id):
+        return None
+    try:
+        ctx.services.register(session.user_id, event_id)
+    except ServiceError:
+        return None
+    return event_id
+
+
+def login(ctx, session):
+    return ctx.services.login(session.email, BENCH_PASSWORD)
+
+
+PAGES = {"home": home, "view_events": view_events, "buy_ticket": buy_ticket, "register": register, "login": login}
+# Pages each role can reach in the app
+ROLE_PAGES = {
+    "attendee": ("home", "view_events", "buy_ticket", "login"),
+    "participant": ("home", "view_events", "register", "login"),
+    "organizer": ("home", "view_events", "login"),
+}
+
+
+def load_users(pool, count, seed=None):
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, email, role FROM users WHERE email LIKE %s ORDER BY id LIMIT %s",
+            (EMAIL_PATTERN.format("%"), count * 20),
+        )
+        users = cursor.fetchall()
+    if not users:
+        raise SystemExit("No benchmark users found; run `python -m benchmarks generate` first.")
+    random.Random(seed).shuffle(users)
+    return users[:count]
+
+
+def run(ctx, recorder, sessions=20, duration=30.0, think_time=0.0, mix=PAGE_MIX, seed=None):
+    """Run ``sessions`` threads for ``duration`` seconds; returns the number of page views."""
+    users = load_users(ctx.pool, sessions, seed)
+    ctx.load_snapshot()
+    deadline = time.monotonic() + duration
+    errors = []
+    views = [0]
+    views_lock = threading.Lock()
+
+    def session_loop(index):
+        rng = random.Random(None if seed is None else seed + index)
+        session = Session(users[index % len(users)], rng)
+        pages = [page for page in ROLE_PAGES[session.role] if mix.get(page)]
+        weights = [mix[page] for page in pages]
+        while time.monotonic() < deadline:
+            page = rng.choices(pages, weights)[0]
+            try:
+                with recorder.measure(page):
+                    PAGES[page](ctx, session)
+            except Exception as e:
+                if len(errors) < 20:
+                    errors.append(f"{page}: {e!r}")
+            with views_lock:
+                views[0] += 1
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=session_loop, args=(i,), name=f"bench-session-{i}") for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        print(f"error  {error}")
+    return views[0]
@@ -0,0 +1,296 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+
+import pymysql
+
+import sales_rollup
+import tickets
+
+MAX_RETRIES = int(os.environ.get("EMS_BOOKING_RETRIES", "3"))
+# MySQL error codes worth retrying: deadlock found, lock wait timeout
+RETRYABLE_ERRORS = (1213, 1205)
+
+Booking = namedtuple("Booking", ["booking_id", "user_id", "event_id", "vip_tickets", "general_tickets", "amount",
+                                 "ticket_code"])
+
+
+class BookingError(Exception):
+    """Base class for bookings that could not be made."""
+
+
+class EventUnavailable(BookingError):
+    """The event does not exist or is no longer active."""
+
+
+class SoldOut(BookingError):
+    """Not enough tickets left for the requested quantity."""
+
+
+def _is_retryable(error):
+    return isinstance(error, pymysql.err.OperationalError) and error.args and error.args[0] in RETRYABLE_ERRORS
+
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, 0.02 * (2 ** attempt)))
+
+
+def _validate(vip_tickets, general_tickets):
+    if vip_tickets < 0 or general_tickets < 0:
+        raise BookingError("Ticket quantities cannot be negative.")
+    if vip_tickets + general_tickets == 0:
+        raise BookingError("Please select at least one ticket.")
+
+
+def _explain_failure(cursor, event_id, vip_tickets, general_tickets):
+    cursor.execute("SELECT status, vip_tickets, general_tickets FROM events WHERE id = %s", (event_id,))
+    event = cursor.fetchone()
+    if event is None or event["status"] != "active":
+        return EventUnavailable("Event not found or already canceled.")
+    return SoldOut(
+        f"Not enough tickets left (VIP: {event['vip_tickets']}, General: {event['general_tickets']})."
+    )
+
+
+# Effective prices: the pricing job's current price when there is one, else the base price
+_PRICES = """
+    SELECT e.status, e.vip_tickets, e.general_tickets,
+           COALESCE(p.vip_price, e.vip_price) AS vip_price,
+           COALESCE(p.general_price, e.general_price) AS general_price
+    FROM events e LEFT JOIN event_prices p ON p.event_id = e.id
+    WHERE e.id = %s
+"""
+
+
+def _amount(prices, vip_tickets, general_tickets):
+    return vip_tickets * prices["vip_price"] + general_tickets * prices["general_price"]
+
+
+def book_tickets(pool, user_id, event_id, vip_tickets, general_tickets, max_retries=MAX_RETRIES):
+    """Atomically decrement inventory and record the booking.
+
+    The guarded UPDATE only matches while enough tickets remain, so inventory
+    can never go negative; the decrement and the ``bookings`` insert commit or
+    roll back together, along with the event's sales rollup. Deadlocks and lock wait timeouts are retried.
+    """
+    _validate(vip_tickets, general_tickets)
+    attempt = 0
+    while True:
+        with pool.connection() as conn:
+            try:
+                conn.begin()
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE events
+                        SET vip_tickets = vip_tickets - %s, general_tickets = general_tickets - %s
+                        WHERE id = %s AND status = 'active' AND vip_tickets >= %s AND general_tickets >= %s
+                    """, (vip_tickets, general_tickets, event_id, vip_tickets, general_tickets))
+                    if cursor.rowcount == 0:
+                        conn.rollback()
+                        raise _explain_failure(cursor, event_id, vip_tickets, general_tickets)
+
+                    cursor.execute(_PRICES, (event_id,))
+                    amount = _amount(cursor.fetchone(), vip_tickets, general_tickets)
+                    ticket_code = tickets.issue(event_id)
+                    cursor.execute("""
+                        INSERT INTO bookings (user_id, event_id, vip_tickets_booked, general_tickets_booked, amount, ticket_code)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """, (user_id, event_id, vip_tickets, general_tickets, amount, ticket_code))
+                    booking_id = cursor.lastrowid
+                    sales_rollup.record_bookings(cursor, event_id, 1, vip_tickets, general_tickets, amount)
+                conn.commit()
+                return Booking(booking_id, user_id, event_id, vip_tickets, general_tickets, amount, ticket_code)
+            except BookingError:
+                raise
+            except Exception as e:
+                conn.rollback()
+                if not _is_retryable(e) or attempt >= max_retries:
+                    raise
+        attempt += 1
+        _backoff(attempt)
+
+
+class _Request:
+    __slots__ = ("user_id", "event_id", "vip_tickets", "general_tickets", "future")
+
+    def __init__(self, user_id, event_id, vip_tickets, general_tickets):
+        self.user_id = user_id
+        self.event_id = event_id
+        self.vip_tickets = vip_tickets
+        self.general_tickets = general_tickets
+        self.future = Future()
+
+
+class BookingQueue:
+    """Queued booking mode for flash sales.
+
+    Requests are grouped per event. While one batch for an event is being
+    committed, new buyers for that event accumulate, and the next batch takes
+    them all with a single row lock, a single inventory UPDATE, a single
+    multi-row INSERT and a single rollup update. Buyers are served first-come first-served; a request
+    that no longer fits is rejected with ``SoldOut`` without failing the rest.
+    """
+
+    def __init__(self, pool, workers=4, max_batch=200, max_retries=MAX_RETRIES):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self._pending = OrderedDict()
+        self._busy = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.batches = 0
+        self.requests = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"booking-queue-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, user_id, event_id, vip_tickets, general_tickets):
+        """Queue a booking request and return a Future resolving to a ``Booking``"""
+        _validate(vip_tickets, general_tickets)
+        request = _Request(user_id, event_id, vip_tickets, general_tickets)
+        with self._cond:
+            if self._stopped:
+                raise BookingError("Booking queue is shut down.")
+            self._pending.setdefault(event_id, []).append(request)
+            self.requests += 1
+            self._cond.notify()
+        return request.future
+
+    def book(self, user_id, event_id, vip_tickets, general_tickets, timeout=30):
+        return self.submit(user_id, event_id, vip_tickets, general_tickets).result(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._stopped and not self._pending:
+                    return None, None
+                for event_id in self._pending:
+                    if event_id not in self._busy:
+                        queue = self._pending[event_id]
+                        batch, rest = queue[:self.max_batch], queue[self.max_batch:]
+                        if rest:
+                            self._pending[event_id] = rest
+                            self._pending.move_to_end(event_id)
+                        else:
+                            del self._pending[event_id]
+                        self._busy.add(event_id)
+                        return event_id, batch
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            event_id, batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._process(event_id, batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy.discard(event_id)
+                    self._cond.notify_all()
+
+    def _process(self, event_id, batch):
+        attempt = 0
+        while True:
+            with self.pool.connection() as conn:
+                try:
+                    conn.begin()
+                    results = self._commit_batch(conn, event_id, batch)
+                    conn.commit()
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    if not _is_retryable(e) or attempt >= self.max_retries:
+                        raise
+            attempt += 1
+            _backoff(attempt)
+
+        with self._cond:
+            self.batches += 1
+        for request, outcome in zip(batch, results):
+            if isinstance(outcome, Exception):
+                request.future.set_exception(outcome)
+            else:
+                request.future.set_result(outcome)
+
+    def _commit_batch(self, conn, event_id, batch):
+        with conn.cursor() as cursor:
+            cursor.execute(_PRICES + " FOR UPDATE", (event_id,))
+            event = cursor.fetchone()
+            if event is None or event["status"] != "active":
+                return [EventUnavailable("Event not found or already canceled.") for _ in batch]
+
+            vip_left, general_left = event["vip_tickets"], event["general_tickets"]
+            results, accepted = [], []
+            for request in batch:
+                if request.vip_tickets <= vip_left and request.general_tickets <= general_left:
+                    vip_left -= request.vip_tickets
+                    general_left -= request.general_tickets
+                    booking = Booking(None, request.user_id, event_id, request.vip_tickets, request.general_tickets,
+                                      _amount(event, request.vip_tickets, request.general_tickets),
+                                      tickets.issue(event_id))
+                    accepted.append(booking)
+                    results.append(booking)
+                else:
+                    results.append(SoldOut(
+                        f"Not enough tickets left (VIP: {vip_left}, General: {general_left})."
+                    ))
+            if not accepted:
+                return results
+
+            vip_total = event["vip_tickets"] - vip_left
+            general_total = event["general_tickets"] - general_left
+            cursor.execute("""
+                UPDATE events
+                SET vip_tickets = vip_tickets - %s, general_tickets = general_tickets - %s
+                WHERE id = %s AND vip_tickets >= %s AND general_tickets >= %s
+            """, (vip_total, general_total, event_id, vip_total, general_total))
+            if cursor.rowcount == 0:
+                raise BookingError("Inventory changed while the event row was locked.")
+
+            rows = [
+                (b.user_id, event_id, b.vip_tickets, b.general_tickets, b.amount, b.ticket_code) for b in accepted
+            ]
+            # pymysql rewrites this into one multi-row INSERT
+            cursor.executemany("""
+                INSERT INTO bookings (user_id, event_id, vip_tickets_booked, general_tickets_booked, amount, ticket_code)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, rows)
+            # Read the ids back by their unique ticket codes: with auto_increment_increment > 1
+            # (multi-primary setups) a multi-row INSERT's ids are not consecutive
+            codes = [b.ticket_code for b in accepted]
+            cursor.execute(
+                f"SELECT id, ticket_code FROM bookings WHERE ticket_code IN ({', '.join(['%s'] * len(codes))})",
+                codes,
+            )
+            booking_ids = {row["ticket_code"]: row["id"] for row in cursor.fetchall()}
+            sales_rollup.record_bookings(
+                cursor, event_id, len(rows), vip_total, general_total, sum(row[4] for row in rows),
+            )
+            return [
+                outcome._replace(booking_id=booking_ids[outcome.ticket_code]) if isinstance(outcome, Booking) else outcome
+                for outcome in results
+            ]
+
+    def stats(self):
+        with self._cond:
+            pending = sum(len(queue) for queue in self._pending.values())
+        return {"requests": self.requests, "batches": self.batches, "pending": pending}
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
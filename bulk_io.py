@@ -0,0 +1,486 @@
+"""Streaming bulk import and export for events, bookings and registrations.
+
+Files are read row by row (CSV, JSON Lines or a JSON array) and handled in
+chunks: each chunk is validated, checked against the database set-wise and
+written with one multi-row INSERT in its own transaction. Bad rows are
+reported with their line number and never block the rest of the file.
+
+    python bulk_io.py import events programme.csv --organizer 2
+    python bulk_io.py import bookings legacy_bookings.jsonl
+    python bulk_io.py export events events.csv [--organizer 2]
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+import pymysql
+
+import sales_rollup
+import services
+import tickets
+from event_snapshot import parse_time
+from venue_index import MAX_DURATION_MINUTES, VenueSchedule
+
+CHUNK_SIZE = 500
+EXPORT_BATCH = 1000
+TABLES = ("events", "bookings", "registrations")
+EVENT_STATUSES = ("active", "canceled", "finished")
+# A JSON array element still undecodable after this many buffered characters is malformed, not incomplete
+MAX_ROW_CHARS = 1 << 20
+
+
+class RowError(ValueError):
+    """A row the reader could not decode; yielded in its place and reported like a bad row."""
+
+
+class ImportReport:
+    """Outcome of one import: rows written and ``(line, message)`` per rejected row."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def __repr__(self):
+        return f"ImportReport(inserted={self.inserted}, errors={len(self.errors)})"
+
+
+# ✅ Readers
+def read_rows(stream, fmt):
+    """Yield ``(line, row_dict)`` from a CSV or JSON text stream without reading it whole."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+    elif fmt == "json":
+        yield from _read_json(stream)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _read_json(stream, block=65536):
+    """JSON Lines, or a top-level array decoded one element at a time."""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first != "[":
+        for number, line in enumerate(_prepend(first, stream), 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, RowError(f"invalid JSON: {e.msg} (column {e.colno})")
+        return
+
+    decoder = json.JSONDecoder()
+    buffer, number = "", 0
+    while True:
+        chunk = stream.read(block)
+        buffer = (buffer + chunk).lstrip(" \t\r\n,")
+        while buffer and buffer[0] != "]":
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                if chunk and len(buffer) < MAX_ROW_CHARS:
+                    break
+                # No element boundary to resume from: report it and stop reading
+                yield number + 1, RowError(f"invalid JSON: {e.msg}; the rest of the file was not read")
+                return
+            number += 1
+            yield number, row
+            buffer = buffer[end:].lstrip(" \t\r\n,")
+        if not chunk or buffer.startswith("]"):
+            return
+
+
+def _prepend(first, stream):
+    rest = stream.readline()
+    yield first + rest
+    yield from stream
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ✅ Field parsing
+def _text(row, field, required=True):
+    value = row.get(field)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{field} is required")
+    return value
+
+
+def _int(row, field, default=None, minimum=0):
+    value = row.get(field)
+    if value in (None, ""):
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{field} must be a whole number") from None
+    if number < minimum:
+        raise ValueError(f"{field} must be at least {minimum}")
+    return number
+
+
+def _money(row, field, default=None):
+    value = row.get(field)
+    if value in (None, ""):
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} must be a number") from None
+    if amount < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return amount.quantize(Decimal("0.01"))
+
+
+def _date(row, field):
+    value = _text(row, field)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} must be YYYY-MM-DD") from None
+
+
+def _time(row, field):
+    value = _text(row, field)
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} must be HH:MM") from None
+
+
+def parse_event(row, organizer_id=None, allow_past=False):
+    """Validate one event row into the tuple written by ``import_rows``."""
+    event_date, event_time = _date(row, "date"), _time(row, "time")
+    if not allow_past and event_date <= date.today():
+        raise ValueError("date must be in the future")
+    duration = _int(row, "duration_minutes", default=60, minimum=15)
+    if duration > MAX_DURATION_MINUTES:
+        raise ValueError(f"duration_minutes cannot exceed {MAX_DURATION_MINUTES}")
+    capacity = _int(row, "capacity", minimum=1)
+    vip_tickets = _int(row, "vip_tickets", default=int(capacity * services.VIP_SHARE))
+    general_tickets = _int(row, "general_tickets", default=capacity - vip_tickets)
+    if vip_tickets + general_tickets > capacity:
+        raise ValueError("vip_tickets + general_tickets exceeds capacity")
+    user_id = organizer_id if organizer_id is not None else _int(row, "user_id", minimum=1)
+    status = _text(row, "status", required=False) or "active"
+    if status not in EVENT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(EVENT_STATUSES)}")
+    return (
+        _text(row, "title"), _text(row, "location"), event_date, event_time, duration,
+        _text(row, "description"), capacity, vip_tickets, general_tickets,
+        _money(row, "vip_price"), _money(row, "general_price"), user_id, status,
+    )
+
+
+# ✅ Imports
+EVENT_COLUMNS = (
+    "title", "location", "date", "time", "duration_minutes", "description", "capacity",
+    "vip_tickets", "general_tickets", "vip_price", "general_price", "user_id", "status",
+)
+
+
+def _insert_many(cursor, table, columns, rows):
+    """One multi-row INSERT; returns the first generated id.
+
+    Built here rather than with ``executemany`` so the chunk is always a
+    single statement. Its other ids are not necessarily ``first + 1, ...``:
+    they depend on ``auto_increment_increment`` and the AUTO_INCREMENT lock mode.
+    """
+    marks = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    cursor.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([marks] * len(rows)),
+        [value for row in rows for value in row],
+    )
+    return cursor.lastrowid
+
+
+def _venue_schedules(cursor, events):
+    """Active events at the chunk's venues and dates, locked until commit."""
+    locations = sorted({event[1] for event in events})
+    first = min(event[2] for event in events) - timedelta(days=1)
+    last = max(event[2] for event in events) + timedelta(days=1)
+    cursor.execute(f"""
+        SELECT id, location, date, time, duration_minutes FROM events
+        WHERE location IN ({", ".join(["%s"] * len(locations))}) AND date BETWEEN %s AND %s AND status = 'active'
+        FOR UPDATE
+    """, (*locations, first, last))
+    schedules = defaultdict(VenueSchedule)
+    for row in cursor.fetchall():
+        start = datetime.combine(row["date"], parse_time(row["time"]))
+        schedules[row["location"]].add(start, start + timedelta(minutes=row["duration_minutes"]), row["id"])
+    return schedules
+
+
+def _import_events_chunk(conn, chunk, report):
+    with conn.cursor() as cursor:
+        schedules = _venue_schedules(cursor, [event for _, event in chunk])
+        accepted = []
+        for line, event in chunk:
+            if event[12] == "active":
+                start = datetime.combine(event[2], event[3])
+                end = start + timedelta(minutes=event[4])
+                schedule = schedules[event[1]]
+                if schedule.overlaps(start, end):
+                    report.error(line, f"{event[1]} is already booked for an overlapping time")
+                    continue
+                # Later rows in the file must not clash with this one either
+                schedule.add(start, end, -line)
+            accepted.append(event)
+        if not accepted:
+            return []
+        first_id = _insert_many(cursor, "events", EVENT_COLUMNS, accepted)
+        sales_rollup.record_events_since(cursor, first_id)
+        return accepted
+
+
+def _import_bookings_chunk(conn, chunk, report):
+    with conn.cursor() as cursor:
+        prices = _existing(cursor, "SELECT id, vip_price, general_price FROM events WHERE id IN ({})",
+                           {row[1] for _, row in chunk})
+        users = _existing(cursor, "SELECT id FROM users WHERE id IN ({})", {row[0] for _, row in chunk})
+        accepted = []
+        for line, (user_id, event_id, vip, general, amount) in chunk:
+            if event_id not in prices:
+                report.error(line, f"event {event_id} does not exist")
+            elif user_id not in users:
+                report.error(line, f"user {user_id} does not exist")
+            else:
+                if amount is None:
+                    amount = vip * prices[event_id]["vip_price"] + general * prices[event_id]["general_price"]
+                accepted.append((user_id, event_id, vip, general, amount))
+        if not accepted:
+            return []
+        _insert_many(cursor, "bookings",
+                     ("user_id", "event_id", "vip_tickets_booked", "general_tickets_booked", "amount", "ticket_code"),
+                     [row + (tickets.issue(row[1]),) for row in accepted])
+        totals = defaultdict(lambda: [0, 0, 0, Decimal(0)])
+        for _, event_id, vip, general, amount in accepted:
+            total = totals[event_id]
+            total[0] += 1
+            total[1] += vip
+            total[2] += general
+            total[3] += amount
+        for event_id, (count, vip, general, revenue) in totals.items():
+            sales_rollup.record_bookings(cursor, event_id, count, vip, general, revenue)
+        return accepted
+
+
+def _import_registrations_chunk(conn, chunk, report):
+    with conn.cursor() as cursor:
+        events = _existing(cursor, "SELECT id FROM events WHERE id IN ({})", {row[1] for _, row in chunk})
+        users = _existing(cursor, "SELECT id FROM users WHERE id IN ({})", {row[0] for _, row in chunk})
+        event_ids = sorted(events)
+        taken = set()
+        if event_ids:
+            cursor.execute(
+                f"SELECT user_id, event_id FROM registrations WHERE event_id IN ({', '.join(['%s'] * len(event_ids))})",
+                event_ids,
+            )
+            taken = {(row["user_id"], row["event_id"]) for row in cursor.fetchall()}
+        accepted = []
+        for line, (user_id, event_id, registered_at) in chunk:
+            if event_id not in events:
+                report.error(line, f"event {event_id} does not exist")
+            elif user_id not in users:
+                report.error(line, f"user {user_id} does not exist")
+            elif (user_id, event_id) in taken:
+                report.error(line, f"user {user_id} is already registered for event {event_id}")
+            else:
+                taken.add((user_id, event_id))
+                accepted.append((user_id, event_id, registered_at or datetime.now()))
+        if not accepted:
+            return []
+        _insert_many(cursor, "registrations", ("user_id", "event_id", "registration_date"), accepted)
+        for event_id, count in Counter(event_id for _, event_id, _ in accepted).items():
+            sales_rollup.record_registrations(cursor, event_id, count)
+        return accepted
+
+
+def _existing(cursor, sql, ids):
+    ids = sorted(ids)
+    if not ids:
+        return {}
+    cursor.execute(sql.format(", ".join(["%s"] * len(ids))), ids)
+    return {row["id"]: row for row in cursor.fetchall()}
+
+
+def _parse_booking(row):
+    vip, general = _int(row, "vip_tickets_booked", default=0), _int(row, "general_tickets_booked", default=0)
+    if vip + general == 0:
+        raise ValueError("a booking needs at least one ticket")
+    amount = _money(row, "amount") if row.get("amount") not in (None, "") else None
+    return _int(row, "user_id", minimum=1), _int(row, "event_id", minimum=1), vip, general, amount
+
+
+def _parse_registration(row):
+    registered_at = _text(row, "registration_date", required=False)
+    try:
+        registered_at = datetime.fromisoformat(registered_at) if registered_at else None
+    except ValueError:
+        raise ValueError("registration_date must be an ISO date-time") from None
+    return _int(row, "user_id", minimum=1), _int(row, "event_id", minimum=1), registered_at
+
+
+def import_rows(pool, table, rows, organizer_id=None, allow_past=False, chunk_size=CHUNK_SIZE):
+    """Validate and insert ``(line, row_dict)`` pairs chunk by chunk.
+
+    Events get the same venue-overlap rule as Create Event, checked against
+    the database and against earlier rows of the file. Bookings are imported
+    as history: prices fill in a missing ``amount``, inventory is left as is.
+    Every chunk also updates the sales rollup in the same transaction.
+    """
+    if table == "events":
+        parse, write = (lambda row: parse_event(row, organizer_id, allow_past)), _import_events_chunk
+    elif table == "bookings":
+        parse, write = _parse_booking, _import_bookings_chunk
+    elif table == "registrations":
+        parse, write = _parse_registration, _import_registrations_chunk
+    else:
+        raise ValueError(f"Unsupported table: {table}")
+
+    report = ImportReport()
+    for chunk in _chunks(rows, chunk_size):
+        valid = []
+        for line, row in chunk:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                if not isinstance(row, dict):
+                    raise ValueError("expected an object per row")
+                valid.append((line, parse(row)))
+            except ValueError as e:
+                report.error(line, str(e))
+        if not valid:
+            continue
+
+        with pool.connection() as conn:
+            try:
+                conn.begin()
+                written = write(conn, valid, report)
+                conn.commit()
+            except pymysql.MySQLError as e:
+                conn.rollback()
+                for line, _ in valid:
+                    report.error(line, f"chunk rolled back: {e.args[-1] if e.args else e}")
+                continue
+        report.inserted += len(written)
+    return report
+
+
+def import_file(pool, table, stream, fmt, **kwargs):
+    return import_rows(pool, table, read_rows(stream, fmt), **kwargs)
+
+
+# ✅ Exports
+EXPORT_QUERIES = {
+    "events": "SELECT id, {} FROM events".format(", ".join(EVENT_COLUMNS)),
+    "bookings": "SELECT b.id, b.user_id, b.event_id, b.vip_tickets_booked, b.general_tickets_booked, b.amount "
+                "FROM bookings b JOIN events e ON e.id = b.event_id",
+    "registrations": "SELECT r.id, r.user_id, r.event_id, r.registration_date "
+                     "FROM registrations r JOIN events e ON e.id = r.event_id",
+}
+
+
+def _plain(value):
+    if isinstance(value, timedelta):
+        return parse_time(value).strftime("%H:%M:%S")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def export_rows(pool, table, out, fmt="csv", organizer_id=None, batch=EXPORT_BATCH):
+    """Stream a table to ``out`` through an unbuffered cursor; returns the row count."""
+    if table not in EXPORT_QUERIES:
+        raise ValueError(f"Unsupported table: {table}")
+    sql, params = EXPORT_QUERIES[table], ()
+    if organizer_id is not None:
+        sql += (" WHERE user_id = %s" if table == "events" else " WHERE e.user_id = %s")
+        params = (organizer_id,)
+
+    count = 0
+    with pool.connection() as conn, conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(sql, params)
+        writer = None
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            for row in rows:
+                row = {key: _plain(value) for key, value in row.items()}
+                if fmt == "csv":
+                    if writer is None:
+                        writer = csv.DictWriter(out, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(row) + "\n")
+            count += len(rows)
+    return count
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "json"
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Bulk import/export for the event database")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("path", help="file to read or write ('-' for stdin/stdout)")
+    parser.add_argument("--format", choices=("csv", "json"), help="default: from the file extension")
+    parser.add_argument("--organizer", type=int, help="owner of imported events / export only this organizer's data")
+    parser.add_argument("--allow-past", action="store_true", help="accept past event dates (history migrations)")
+    args = parser.parse_args()
+    fmt = _format_for(args.path, args.format)
+
+    pool = ConnectionPool(size=1)
+    try:
+        if args.action == "import":
+            stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+            with stream:
+                report = import_file(pool, args.table, stream, fmt,
+                                     organizer_id=args.organizer, allow_past=args.allow_past)
+            for line, message in report.errors:
+                print(f"line {line}: {message}", file=sys.stderr)
+            print(f"Imported {report.inserted} row(s), rejected {len(report.errors)}.")
+        else:
+            stream = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+            with stream:
+                count = export_rows(pool, args.table, stream, fmt, organizer_id=args.organizer)
+            print(f"Exported {count} row(s).", file=sys.stderr)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Cache invalidation across the app's processes.
+
+Each Streamlit or API process keeps its own ``QueryCache``, ``EventSnapshot``
+and ``PriceBook``. When a write in one process drops its local entries, the
+other processes hold stale copies until their TTLs or refresh intervals expire.
+A ``CacheBus`` broadcasts every invalidation to every process, and each one
+applies it to its own caches:
+- ``keys`` / ``tags``: the exact query-cache keys and tags that were dropped
+  (a user's registrations, a user's wallet pages, an event's rows);
+- ``events``: ids of changed events (none listed after an import or an
+  archival run); the snapshot re-reads changed rows on its next read instead
+  of waiting for its refresh interval;
+- ``prices``: the pricing job wrote new effective prices.
+
+Every process numbers its messages (``origin``, ``seq``). A receiver that sees
+a gap in an origin's numbers missed something: a publish failed, it was
+disconnected, or the outbox was pruned before it polled. It then resyncs by
+clearing its query cache and marking the snapshot and prices stale. A resync
+costs some cache misses but never serves stale data.
+
+Backends, chosen with EMS_CACHE_BUS:
+- ``mysql``: an outbox table (``cache_invalidations``) that every process
+  polls every ``POLL_INTERVAL`` seconds. It needs nothing beyond the database.
+  Rows older than ``RETENTION`` seconds are pruned.
+- ``redis://[:password@]host[:port]`` or ``unix:///path/to/socket``: PUBLISH
+  and SUBSCRIBE on ``CHANNEL``, over the Redis protocol. Any compatible
+  server works (Redis, Valkey, KeyDB). Delivery takes milliseconds, but
+  messages are not stored; a reconnect therefore resyncs.
+- unset: no bus. A single process needs none.
+"""
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import Counter
+from urllib.parse import unquote, urlsplit
+
+BUS = os.environ.get("EMS_CACHE_BUS", "")
+CHANNEL = os.environ.get("EMS_CACHE_BUS_CHANNEL", "ems:cache")
+POLL_INTERVAL = float(os.environ.get("EMS_CACHE_BUS_POLL", "0.5"))
+# Outbox rows are kept this long; a process that polls less often than this resyncs
+RETENTION = float(os.environ.get("EMS_CACHE_BUS_RETENTION", "600"))
+PRUNE_INTERVAL = 60
+PRUNE_BATCH = 5000
+# Re-read outbox rows this far behind the watermark: an insert can commit after a later one
+OVERLAP = 5.0
+RECONNECT_DELAY = 1.0
+# Origins not heard from for this long are forgotten
+ORIGIN_TTL = 3600
+
+
+def _tuples(value):
+    """JSON turns the cache's tuple keys into lists; turn them back."""
+    return tuple(_tuples(item) for item in value) if isinstance(value, list) else value
+
+
+class CacheBus:
+    """Numbering, gap detection and dispatch; backends implement ``_send`` and ``_run``."""
+
+    backend = None
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.counters = Counter()
+        self.last_resync = None
+        self._seq = 0
+        self._publish_lock = threading.Lock()
+        self._handlers = {}
+        self._resync_handlers = []
+        self._seen = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, topic, handler):
+        """Call ``handler(items)`` for every message on ``topic`` from another process."""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def on_resync(self, handler):
+        """Call ``handler()`` when messages may have been missed."""
+        self._resync_handlers.append(handler)
+
+    def publish(self, topic, items):
+        """Broadcast ``items`` on ``topic``; call it after the write has committed.
+
+        Errors are counted, not raised: the write itself succeeded. The
+        lost sequence number shows up as a gap at the receivers, which resync.
+        """
+        items = list(items)
+        with self._publish_lock:
+            # Serialized so that each origin's messages are stored and delivered in seq order
+            self._seq += 1
+            message = {"origin": self.origin, "seq": self._seq, "topic": topic, "items": items}
+            try:
+                self._send(message)
+                self.counters["published"] += 1
+            except Exception as e:
+                self.counters["publish errors"] += 1
+                print(f"Cache bus publish error: {e}")
+
+    def _receive(self, message):
+        origin, seq = message["origin"], message["seq"]
+        if origin == self.origin:
+            return
+        last = self._seen.get(origin)
+        if last is not None and seq <= last[0]:
+            return
+        self._seen[origin] = (seq, time.monotonic())
+        if last is not None and seq > last[0] + 1:
+            self.resync(f"missed {seq - last[0] - 1} message(s) from {origin}")
+            return
+        self.counters["received"] += 1
+        items = [_tuples(item) for item in message["items"]]
+        for handler in self._handlers.get(message["topic"], ()):
+            try:
+                handler(items)
+            except Exception as e:
+                self.counters["handler errors"] += 1
+                print(f"Cache bus handler error: {e}")
+
+    def resync(self, reason):
+        """Drop everything this process caches; it reloads from the database on demand."""
+        self.counters["resyncs"] += 1
+        self.last_resync = (time.strftime("%H:%M:%S"), reason)
+        for handler in self._resync_handlers:
+            try:
+                handler()
+            except Exception as e:
+                self.counters["handler errors"] += 1
+                print(f"Cache bus resync handler error: {e}")
+
+    def _forget_origins(self):
+        cutoff = time.monotonic() - ORIGIN_TTL
+        self._seen = {origin: entry for origin, entry in self._seen.items() if entry[1] > cutoff}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"cache-bus-{self.backend}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def status(self):
+        """Counters for the Performance page."""
+        return {
+            "backend": self.backend,
+            "origin": self.origin,
+            "published": self.counters["published"],
+            "received": self.counters["received"],
+            "resyncs": self.counters["resyncs"],
+            "errors": self.counters["publish errors"] + self.counters["handler errors"] + self.counters["receive errors"],
+            "last resync": " ".join(self.last_resync) if self.last_resync else None,
+            "peers": len(self._seen),
+        }
+
+    def _send(self, message):
+        raise NotImplementedError
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class MySQLBus(CacheBus):
+    """Outbox table polled by every process; see the module docstring."""
+
+    backend = "mysql"
+
+    def __init__(self, pool, poll_interval=POLL_INTERVAL, retention=RETENTION):
+        super().__init__()
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._watermark = None
+        self._applied = {}
+
+    def _send(self, message):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO cache_invalidations (origin, seq, topic, items) VALUES (%s, %s, %s, %s)",
+                (message["origin"], message["seq"], message["topic"], json.dumps(message["items"])),
+            )
+
+    def poll(self):
+        """Apply every outbox row committed since the last poll."""
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT NOW(6) AS now")
+            now = cursor.fetchone()["now"]
+            if self._watermark is None:
+                # Messages from before this process started concern caches it does not have yet
+                self._watermark = now
+                return
+            if (now - self._watermark).total_seconds() > self.retention - OVERLAP:
+                # Rows we never read may have been pruned
+                self._watermark, self._applied = now, {}
+                self.resync("outbox not polled within the retention period")
+                return
+            cursor.execute("""
+                SELECT id, origin, seq, topic, items, created_at FROM cache_invalidations
+                WHERE created_at >= %s - INTERVAL %s SECOND
+                ORDER BY id
+            """, (self._watermark, OVERLAP))
+            rows = cursor.fetchall()
+        for row in rows:
+            if row["id"] in self._applied:
+                continue
+            self._applied[row["id"]] = row["created_at"]
+            self._watermark = max(self._watermark, row["created_at"])
+            try:
+                self._receive({**row, "items": json.loads(row["items"])})
+            except ValueError as e:
+                self.counters["receive errors"] += 1
+                print(f"Cache bus: bad outbox row {row['id']}: {e}")
+        horizon = self._watermark.timestamp() - 2 * OVERLAP
+        self._applied = {id_: at for id_, at in self._applied.items() if at.timestamp() >= horizon}
+
+    def prune(self):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM cache_invalidations WHERE created_at < NOW(6) - INTERVAL %s SECOND LIMIT %s",
+                (self.retention, PRUNE_BATCH),
+            )
+
+    def _run(self):
+        next_prune = time.monotonic() + PRUNE_INTERVAL
+        while True:
+            try:
+                self.poll()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+                    self.prune()
+                    self._forget_origins()
+            except Exception as e:
+                self.counters["receive errors"] += 1
+                print(f"Cache bus poll error: {e}")
+            if self._stopped.wait(self.poll_interval):
+                return
+
+
+class BusError(Exception):
+    pass
+
+
+def _encode(*args):
+    """A Redis protocol command: an array of bulk strings."""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise BusError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("connection closed")
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [_read_reply(reader) for _ in range(length)]
+    raise BusError(f"unexpected reply {line!r}")
+
+
+class RespBus(CacheBus):
+    """PUBLISH/SUBSCRIBE over the Redis protocol; see the module docstring."""
+
+    backend = "resp"
+
+    def __init__(self, url, channel=CHANNEL):
+        super().__init__()
+        parts = urlsplit(url)
+        if parts.scheme == "unix":
+            self._address = (socket.AF_UNIX, parts.path)
+        elif parts.scheme == "redis":
+            self._address = (socket.AF_INET, (parts.hostname or "127.0.0.1", parts.port or 6379))
+        else:
+            raise ValueError(f"Unsupported cache bus URL: {url}")
+        self._password = unquote(parts.password) if parts.password else None
+        self.channel = channel
+        self._publisher = None
+        self._subscriber = None
+
+    def _connect(self):
+        family, address = self._address
+        if family == socket.AF_UNIX:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(address, timeout=5)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(5)
+        reader = sock.makefile("rb")
+        if self._password is not None:
+            sock.sendall(_encode("AUTH", self._password))
+            _read_reply(reader)
+        return sock, reader
+
+    def _send(self, message):
+        payload = json.dumps(message)
+        # One retry on a fresh connection: the server may have closed an idle one
+        for attempt in (1, 2):
+            try:
+                if self._publisher is None:
+                    self._publisher = self._connect()
+                sock, reader = self._publisher
+                sock.sendall(_encode("PUBLISH", self.channel, payload))
+                _read_reply(reader)
+                return
+            except OSError:
+                self._close_publisher()
+                if attempt == 2:
+                    raise
+
+    def _close_publisher(self):
+        if self._publisher is not None:
+            self._publisher[0].close()
+            self._publisher = None
+
+    def _listen(self):
+        sock, reader = self._connect()
+        self._subscriber = sock
+        try:
+            sock.sendall(_encode("SUBSCRIBE", self.channel))
+            _read_reply(reader)
+            # Messages are only delivered while subscribed: anything sent before now is lost
+            self.resync("subscribed")
+            # Block on reads; stop() unblocks them by shutting the socket down
+            sock.settimeout(None)
+            while not self._stopped.is_set():
+                reply = _read_reply(reader)
+                if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                    try:
+                        self._receive(json.loads(reply[2]))
+                    except (ValueError, KeyError) as e:
+                        self.counters["receive errors"] += 1
+                        print(f"Cache bus: bad message: {e}")
+        finally:
+            self._subscriber = None
+            sock.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except (OSError, BusError) as e:
+                if self._stopped.is_set():
+                    return
+                self.counters["receive errors"] += 1
+                print(f"Cache bus connection error: {e}")
+            self._forget_origins()
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        self._stopped.set()
+        subscriber = self._subscriber
+        if subscriber is not None:
+            try:
+                subscriber.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        super().stop()
+        with self._publish_lock:
+            self._close_publisher()
+
+
+def from_env(pool, bus=BUS):
+    """The bus named by EMS_CACHE_BUS, or ``None``."""
+    if not bus:
+        return None
+    if bus == "mysql":
+        return MySQLBus(pool)
+    return RespBus(bus)
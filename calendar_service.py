@@ -0,0 +1,82 @@
+import calendar
+import html
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# Rendered months kept per process; keys include the snapshot version, so
+# stale months simply stop being hit and age out
+MAX_CACHED_MONTHS = 48
+
+EVENT_CARD = (
+    '<div style="background-color: #e8f0fe; border-left: 5px solid #4285f4; padding: 8px; '
+    'margin-bottom: 10px; border-radius: 6px; color: #0b5394;">'
+    "<strong>{title}</strong><br>🕒 {time}<br>📍 {location}<br>"
+    '<span style="font-size: small;">{description}</span></div>'
+)
+EMPTY_DAY = "<span style='color: gray;'>No events</span>"
+
+
+def get_month_dates(year, month):
+    """Returns all dates in a given month"""
+    num_days = calendar.monthrange(year, month)[1]
+    return [date(year, month, day) for day in range(1, num_days + 1)]
+
+
+def _render_day(day, events):
+    cards = "".join(
+        EVENT_CARD.format(
+            title=html.escape(str(ev.title)),
+            time=ev.time.strftime("%I:%M %p"),
+            location=html.escape(str(ev.location)),
+            description=html.escape(str(ev.description or "")),
+        )
+        for ev in events
+    ) or EMPTY_DAY
+    return f'<div style="min-width: 0;"><h3>{day.strftime("%d %a")}</h3>{cards}</div>'
+
+
+def _render_week(week, by_day):
+    cells = "".join(_render_day(day, by_day.get(day, ())) for day in week)
+    return (
+        '<div style="display: grid; grid-template-columns: repeat(7, minmax(0, 1fr)); '
+        f'gap: 12px; margin-bottom: 12px;">{cells}</div>'
+    )
+
+
+class CalendarService:
+    """Month grids for the organizer calendar, cached per (year, month, data version).
+
+    A month is built from the snapshot's date-ordered index for that month
+    only, grouped by day in one pass, and rendered to one HTML block per
+    week.
+    """
+
+    def __init__(self, max_months=MAX_CACHED_MONTHS):
+        self.max_months = max_months
+        self._lock = threading.Lock()
+        self._months = OrderedDict()
+
+    def month_weeks(self, snapshot, year, month):
+        """Rendered HTML for each week row of the month."""
+        key = (year, month, snapshot.version)
+        with self._lock:
+            weeks = self._months.get(key)
+            if weeks is not None:
+                self._months.move_to_end(key)
+                return weeks
+
+        month_dates = get_month_dates(year, month)
+        by_day = {}
+        for row in snapshot.between(month_dates[0], month_dates[-1] + timedelta(days=1)):
+            by_day.setdefault(row.date, []).append(row)
+        weeks = [
+            _render_week(month_dates[i:i + 7], by_day)
+            for i in range(0, len(month_dates), 7)
+        ]
+
+        with self._lock:
+            self._months[key] = weeks
+            while len(self._months) > self.max_months:
+                self._months.popitem(last=False)
+        return weeks
@@ -0,0 +1,223 @@
+"""Background fan-out when an organizer cancels an event.
+
+Canceling flips the event's status and inserts a ``cancellation_jobs`` row in
+one transaction, then returns. ``CancellationWorker`` walks the event's
+bookings in id order, ``JOB_BATCH`` at a time. Each batch is one transaction:
+- it bulk-inserts the ``refunds`` rows;
+- it puts the tickets back in the event's inventory;
+- it updates the sales rollup;
+- it queues holder notifications in the outbox;
+- it advances the job's ``last_booking_id`` cursor.
+
+A batch either happens entirely or not at all. A worker that dies loses its
+lease, and the next worker resumes from the cursor.
+"""
+import os
+import socket
+import threading
+import uuid
+
+import notifications
+import sales_rollup
+
+JOB_BATCH = int(os.environ.get("EMS_CANCEL_BATCH", "1000"))
+LEASE_SECONDS = int(os.environ.get("EMS_CANCEL_LEASE", "60"))
+POLL_INTERVAL = float(os.environ.get("EMS_CANCEL_POLL", "2"))
+# Consecutive failures before a job is marked failed
+MAX_FAILURES = 5
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def request(cursor, event_id, organizer_id):
+    """Cancel an organizer's active event and queue its refunds; returns the job id, or ``None``."""
+    cursor.execute(
+        "UPDATE events SET status = 'canceled' WHERE id = %s AND user_id = %s AND status = 'active'",
+        (event_id, organizer_id),
+    )
+    if cursor.rowcount == 0:
+        return None
+    total = sales_rollup.get(cursor, event_id)["bookings"]
+    cursor.execute(
+        "INSERT INTO cancellation_jobs (event_id, requested_by, total_bookings) VALUES (%s, %s, %s)",
+        (event_id, organizer_id, total),
+    )
+    return cursor.lastrowid
+
+
+def _marks(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def process_batch(pool, job_id, owner, batch=JOB_BATCH):
+    """Refund the next batch of bookings; returns ``False`` once the job is finished or no longer ours."""
+    with pool.connection() as conn, conn.cursor() as cursor:
+        conn.begin()
+        cursor.execute(
+            "SELECT * FROM cancellation_jobs WHERE id = %s AND lease_owner = %s AND status = %s FOR UPDATE",
+            (job_id, owner, RUNNING),
+        )
+        job = cursor.fetchone()
+        if job is None:
+            conn.rollback()
+            return False
+
+        cursor.execute("""
+            SELECT b.id, b.user_id, b.vip_tickets_booked, b.general_tickets_booked, b.amount
+            FROM bookings b
+            WHERE b.event_id = %s AND b.id > %s
+            ORDER BY b.id
+            LIMIT %s
+        """, (job["event_id"], job["last_booking_id"], batch))
+        bookings = cursor.fetchall()
+        if not bookings:
+            cursor.execute(
+                "UPDATE cancellation_jobs SET status = %s, lease_owner = NULL, lease_until = NULL, error = NULL WHERE id = %s",
+                (DONE, job_id),
+            )
+            conn.commit()
+            return False
+
+        ids = [b["id"] for b in bookings]
+        cursor.execute(f"SELECT booking_id, status FROM refunds WHERE booking_id IN ({_marks(ids)})", ids)
+        existing = {row["booking_id"]: row["status"] for row in cursor.fetchall()}
+        new = [b for b in bookings if b["id"] not in existing]
+        # Pending refunds are already counted in the rollup; rejected ones are granted now
+        revived = [b for b in bookings if existing.get(b["id"]) == "rejected"]
+
+        if new:
+            cursor.executemany(
+                "INSERT INTO refunds (user_id, booking_id, event_id, status) VALUES (%s, %s, %s, 'approved')",
+                [(b["user_id"], b["id"], job["event_id"]) for b in new],
+            )
+        pending = [booking_id for booking_id, status in existing.items() if status != "approved"]
+        if pending:
+            cursor.execute(f"UPDATE refunds SET status = 'approved' WHERE booking_id IN ({_marks(pending)})", pending)
+
+        refunded = new + revived
+        if refunded:
+            sales_rollup.record_refunds(cursor, job["event_id"], len(refunded), sum(b["amount"] for b in refunded))
+        cursor.execute(
+            "UPDATE events SET vip_tickets = vip_tickets + %s, general_tickets = general_tickets + %s WHERE id = %s",
+            (sum(b["vip_tickets_booked"] for b in bookings), sum(b["general_tickets_booked"] for b in bookings),
+             job["event_id"]),
+        )
+        notifications.enqueue(cursor, [
+            (b["user_id"], "event_canceled", {"event_id": job["event_id"], "booking_id": b["id"], "refund": b["amount"]})
+            for b in bookings
+        ])
+        # A short batch was the last one; close the job in the same transaction
+        more = len(bookings) == batch
+        cursor.execute("""
+            UPDATE cancellation_jobs
+            SET processed = processed + %s, refunds_created = refunds_created + %s, last_booking_id = %s,
+                lease_until = IF(%s, NOW() + INTERVAL %s SECOND, NULL),
+                lease_owner = IF(%s, lease_owner, NULL), status = IF(%s, status, %s), error = NULL
+            WHERE id = %s
+        """, (len(bookings), len(refunded), ids[-1], more, LEASE_SECONDS, more, more, DONE, job_id))
+        conn.commit()
+    return more
+
+
+class CancellationWorker:
+    """Background thread that runs cancellation jobs and drains the notification outbox."""
+
+    def __init__(self, pool, batch=JOB_BATCH, poll_interval=POLL_INTERVAL, sender=None):
+        self.pool = pool
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.sender = sender or notifications.default_sender()
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._failures = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cancellation-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _claim(self):
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            # Pending jobs, or running ones whose worker stopped renewing its lease
+            cursor.execute("""
+                UPDATE cancellation_jobs
+                SET status = %s, lease_owner = %s, lease_until = NOW() + INTERVAL %s SECOND
+                WHERE status IN (%s, %s) AND (lease_until IS NULL OR lease_until < NOW())
+                ORDER BY id LIMIT 1
+            """, (RUNNING, self.owner, LEASE_SECONDS, PENDING, RUNNING))
+            if cursor.rowcount == 0:
+                return None
+            cursor.execute(
+                "SELECT id FROM cancellation_jobs WHERE lease_owner = %s AND status = %s ORDER BY id LIMIT 1",
+                (self.owner, RUNNING),
+            )
+            row = cursor.fetchone()
+            return row["id"] if row else None
+
+    def _fail(self, job_id, error):
+        failures = self._failures.get(job_id, 0) + 1
+        self._failures[job_id] = failures
+        status = FAILED if failures >= MAX_FAILURES else RUNNING
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            # Releasing the lease lets the next poll (here or elsewhere) retry from the cursor
+            cursor.execute(
+                "UPDATE cancellation_jobs SET status = %s, error = %s, lease_owner = NULL, lease_until = NULL "
+                "WHERE id = %s AND lease_owner = %s",
+                (status, str(error)[:1000], job_id, self.owner),
+            )
+
+    def run_once(self):
+        """Finish one claimable job, if any; returns whether there was one."""
+        job_id = self._claim()
+        if job_id is None:
+            return False
+        try:
+            while not self._stopped.is_set() and process_batch(self.pool, job_id, self.owner, self.batch):
+                pass
+            self._failures.pop(job_id, None)
+        except Exception as e:
+            self._fail(job_id, e)
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                busy = self.run_once()
+                while notifications.deliver_pending(self.pool, self.sender):
+                    pass
+            except Exception as e:
+                print(f"Cancellation worker error: {e}")
+                busy = False
+            if not busy:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+def jobs_for(pool, organizer_id, limit=10):
+    with pool.read_connection(session=organizer_id) as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT j.*, COALESCE(e.title, a.title) AS title FROM cancellation_jobs j
+            LEFT JOIN events e ON e.id = j.event_id
+            LEFT JOIN events_archive a ON a.id = j.event_id
+            WHERE j.requested_by = %s
+            ORDER BY j.id DESC LIMIT %s
+        """, (organizer_id, limit))
+        return cursor.fetchall()
+
+
+def get_job(pool, job_id, session=None):
+    with pool.read_connection(session=session) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT * FROM cancellation_jobs WHERE id = %s", (job_id,))
+        return cursor.fetchone()
@@ -0,0 +1,427 @@
+"""Door check-in: ticket validation at the gate, with or without MySQL.
+
+A ``Gate`` keeps every admissible code of one event in memory. These are the
+booking codes from ``bookings`` (refunded bookings excluded) and the derived
+registration codes (``tickets.registration_code``). Each code is kept as a
+64-bit BLAKE2b hash in a sorted ``array('Q')``, 8 bytes per ticket, with one
+redeemed flag per ticket in a ``bytearray``.
+
+A scan does three things and never waits for MySQL:
+- it checks the code's HMAC, so forged codes are rejected exactly before the
+  hash lookup;
+- it bisects the hash array;
+- it tests and sets the redeemed flag, so a second scan of the same code is
+  caught at once.
+
+Admissions are appended to a local journal (fsynced JSON lines). A background
+thread writes them to ``checkins`` in batches. The same thread pulls in
+tickets sold since the load and codes admitted at other gates; the table's
+primary key makes a code redeemable once across gates.
+
+Each running gate locks its files. A second gate started with the same name
+on the same host (two app workers, say) takes the next free slot, ``<name>-2``
+and so on, and records its admissions under that name. Its journal and
+``checkins.gate`` therefore stay its own. A slot freed by a crashed process is
+taken over, unsynced journal included, by the next gate started.
+
+Every load from MySQL also saves the ticket set to a local snapshot. If MySQL
+is unreachable at startup, the gate starts from the snapshot and its journal.
+It keeps admitting while offline and catches up when the connection returns.
+Refunds and canceled registrations made after the load take effect at the
+next load.
+
+    python checkin.py --event 7 --gate north   # codes from a scanner, one per line on stdin
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from datetime import datetime
+
+import pymysql
+
+import tickets
+from db_pool import PoolTimeout
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, slots are per process instead
+    fcntl = None
+
+CHECKIN_DIR = os.environ.get(
+    "EMS_CHECKIN_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkin_data"))
+GATE_NAME = os.environ.get("EMS_CHECKIN_GATE") or socket.gethostname()
+FLUSH_BATCH = int(os.environ.get("EMS_CHECKIN_BATCH", "500"))
+SYNC_INTERVAL = float(os.environ.get("EMS_CHECKIN_SYNC", "2"))
+# The local snapshot is rewritten at most this often while syncing
+SNAPSHOT_INTERVAL = 30.0
+# Gates with the same name running at once on one host
+MAX_SLOTS = 64
+
+ADMITTED, ALREADY_USED, UNKNOWN, WRONG_EVENT, INVALID = "admitted", "already_used", "unknown", "wrong_event", "invalid"
+
+ScanResult = namedtuple("ScanResult", ["status", "code", "scanned_at"])
+
+# Errors that mean MySQL can't be reached right now
+_OFFLINE_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError, PoolTimeout, OSError)
+_UNSAFE_FILENAME = re.compile(r"[^\w-]")
+
+
+def normalize(code):
+    return (code or "").strip().upper()
+
+
+def ticket_hash(code):
+    return int.from_bytes(hashlib.blake2b(code.encode(), digest_size=8).digest(), "little")
+
+
+class TicketSet:
+    """Sorted 64-bit code hashes with one redeemed flag per ticket."""
+
+    def __init__(self, hashes=(), redeemed=None):
+        self.hashes = array("Q", sorted(set(hashes)) if redeemed is None else hashes)
+        self.redeemed = bytearray(len(self.hashes)) if redeemed is None else bytearray(redeemed)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def find(self, code_hash):
+        i = bisect_left(self.hashes, code_hash)
+        return i if i < len(self.hashes) and self.hashes[i] == code_hash else -1
+
+    def redeem(self, code_hash):
+        """``ADMITTED`` (and mark it), ``ALREADY_USED`` or ``UNKNOWN``."""
+        i = self.find(code_hash)
+        if i < 0:
+            return UNKNOWN
+        if self.redeemed[i]:
+            return ALREADY_USED
+        self.redeemed[i] = 1
+        return ADMITTED
+
+    def mark(self, code_hash):
+        i = self.find(code_hash)
+        if i >= 0:
+            self.redeemed[i] = 1
+
+    def add(self, new_hashes):
+        """Merge tickets sold since the load, keeping the redeemed flags."""
+        new = {h for h in new_hashes if self.find(h) < 0}
+        if not new:
+            return
+        merged = sorted([*zip(self.hashes, self.redeemed), *((h, 0) for h in new)])
+        self.hashes = array("Q", (h for h, _ in merged))
+        self.redeemed = bytearray(flag for _, flag in merged)
+
+    def redeemed_count(self):
+        return self.redeemed.count(1)
+
+
+class Gate:
+    """Check-in for one event at one gate; see the module docstring.
+
+    The journal and snapshot files are named after the event and the gate;
+    ``gate`` is the name's first free slot (see the module docstring).
+    """
+
+    def __init__(self, pool, event_id, gate=GATE_NAME, directory=CHECKIN_DIR,
+                 flush_batch=FLUSH_BATCH, sync_interval=SYNC_INTERVAL):
+        self.pool = pool
+        self.event_id = event_id
+        self.flush_batch = flush_batch
+        self.sync_interval = sync_interval
+        self.tickets = TicketSet()
+        self.online = False
+        self.last_sync = None
+        self.counts = Counter()
+        self._after = {"booking": 0, "registration": 0, "checkin": None}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._snapshot_saved = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self.gate, base, self._slot_lock = self._claim_slot(directory, gate)
+        self.snapshot_path = base + ".snapshot.json"
+        self.journal_path = base + ".journal.jsonl"
+        self._journal = None
+
+    def _claim_slot(self, directory, gate):
+        """``(name, file prefix, lock file)`` of the first slot of ``gate`` no running gate holds."""
+        if fcntl is None:
+            gate = f"{gate}-{os.getpid()}"
+        for n in range(1, MAX_SLOTS + 1):
+            name = gate if n == 1 else f"{gate}-{n}"
+            base = os.path.join(directory, f"event-{self.event_id}-{_UNSAFE_FILENAME.sub('_', name)}")
+            if fcntl is None:
+                return name, base, None
+            lock = open(base + ".lock", "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue
+            return name, base, lock
+        raise RuntimeError(f"More than {MAX_SLOTS} gates named {gate!r} are running for event {self.event_id}.")
+
+    # Loading
+    def load(self):
+        """Fill the ticket set from MySQL, or from the local snapshot when MySQL is unreachable."""
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                hashes, redeemed, after = self._fetch_new(cursor)
+            self.tickets = TicketSet(hashes)
+            for code_hash in redeemed:
+                self.tickets.mark(code_hash)
+            self._after = after
+            self.online, self.last_sync = True, time.time()
+            self._save_snapshot()
+        except _OFFLINE_ERRORS:
+            if not self._load_snapshot():
+                raise
+            self.online = False
+        # Admissions at this gate that may not have reached MySQL yet
+        self._pending = self._read_journal()
+        for code, _ in self._pending:
+            self.tickets.mark(ticket_hash(code))
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self
+
+    def _fetch_new(self, cursor):
+        """Tickets and other gates' check-ins since the last fetch: ``(hashes, redeemed, after)``."""
+        after = dict(self._after)
+        cursor.execute("""
+            SELECT b.id, b.ticket_code FROM bookings b
+            LEFT JOIN refunds r ON r.booking_id = b.id AND r.status = 'approved'
+            WHERE b.event_id = %s AND b.id > %s AND b.ticket_code IS NOT NULL AND r.id IS NULL
+            ORDER BY b.id
+        """, (self.event_id, after["booking"]))
+        rows = cursor.fetchall()
+        hashes = [ticket_hash(row["ticket_code"]) for row in rows]
+        if rows:
+            after["booking"] = rows[-1]["id"]
+
+        cursor.execute(
+            "SELECT id FROM registrations WHERE event_id = %s AND id > %s ORDER BY id",
+            (self.event_id, after["registration"]),
+        )
+        rows = cursor.fetchall()
+        hashes += [ticket_hash(tickets.registration_code(self.event_id, row["id"])) for row in rows]
+        if rows:
+            after["registration"] = rows[-1]["id"]
+
+        # >= so rows committed in the same microsecond as the watermark aren't missed
+        if after["checkin"] is None:
+            cursor.execute("SELECT ticket_code, recorded_at FROM checkins WHERE event_id = %s", (self.event_id,))
+        else:
+            cursor.execute(
+                "SELECT ticket_code, recorded_at FROM checkins WHERE event_id = %s AND recorded_at >= %s",
+                (self.event_id, after["checkin"]),
+            )
+        rows = cursor.fetchall()
+        redeemed = [ticket_hash(row["ticket_code"]) for row in rows]
+        if rows:
+            after["checkin"] = max(row["recorded_at"] for row in rows)
+        return hashes, redeemed, after
+
+    # Scanning
+    def scan(self, code):
+        """Admit or refuse one scanned code; never touches MySQL."""
+        code = normalize(code)
+        scanned_at = datetime.now()
+        event_id = tickets.verify(code)
+        with self._lock:
+            if event_id is None:
+                status = INVALID
+            elif event_id != self.event_id:
+                status = WRONG_EVENT
+            else:
+                status = self.tickets.redeem(ticket_hash(code))
+                if status == ADMITTED:
+                    self._pending.append((code, scanned_at))
+                    self._journal.write(json.dumps({"code": code, "scanned_at": scanned_at.isoformat()}) + "\n")
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+            self.counts[status] += 1
+            pending = len(self._pending)
+        if pending >= self.flush_batch:
+            self._wake.set()
+        return ScanResult(status, code, scanned_at)
+
+    # Syncing with MySQL
+    def sync(self):
+        """Write a batch of admissions and fetch new tickets and check-ins; returns whether MySQL answered."""
+        with self._sync_lock:
+            with self._lock:
+                batch = self._pending[:self.flush_batch]
+            conflicts = 0
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cursor:
+                    if batch:
+                        # pymysql rewrites this into one multi-row INSERT
+                        cursor.executemany(
+                            "INSERT IGNORE INTO checkins (event_id, ticket_code, gate, scanned_at) VALUES (%s, %s, %s, %s)",
+                            [(self.event_id, code, self.gate, scanned_at) for code, scanned_at in batch],
+                        )
+                        if cursor.rowcount < len(batch):
+                            conflicts = self._conflicts(cursor, [code for code, _ in batch])
+                    hashes, redeemed, after = self._fetch_new(cursor)
+            except _OFFLINE_ERRORS:
+                self.online = False
+                return False
+
+            with self._lock:
+                if batch:
+                    del self._pending[:len(batch)]
+                    self._rewrite_journal()
+                self.tickets.add(hashes)
+                for code_hash in redeemed:
+                    self.tickets.mark(code_hash)
+                self._after = after
+                self.counts["conflicts"] += conflicts
+                self.online, self.last_sync = True, time.time()
+            if (hashes or redeemed) and time.monotonic() - self._snapshot_saved > SNAPSHOT_INTERVAL:
+                self._save_snapshot()
+            return True
+
+    def _conflicts(self, cursor, codes):
+        """How many of ``codes`` another gate had already admitted (both gates let the holder in)."""
+        marks = ", ".join(["%s"] * len(codes))
+        cursor.execute(
+            f"SELECT COUNT(*) AS n FROM checkins WHERE event_id = %s AND gate <> %s AND ticket_code IN ({marks})",
+            [self.event_id, self.gate, *codes],
+        )
+        return cursor.fetchone()["n"]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"checkin-{self.event_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop syncing after one last attempt to write what is pending."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        while self._pending and self.sync():
+            pass
+        self._save_snapshot()
+        if self._journal is not None:
+            self._journal.close()
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            try:
+                while self.sync() and len(self._pending) >= self.flush_batch:
+                    pass
+            except Exception as e:
+                print(f"Check-in sync error: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "event_id": self.event_id, "gate": self.gate, "tickets": len(self.tickets),
+                "checked_in": self.tickets.redeemed_count(), "pending": len(self._pending),
+                "online": self.online, "last_sync": self.last_sync,
+                **{status: self.counts[status] for status in (ADMITTED, ALREADY_USED, UNKNOWN, WRONG_EVENT,
+                                                              INVALID, "conflicts")},
+            }
+
+    # Local files
+    def _save_snapshot(self):
+        with self._lock:
+            state = {
+                "event_id": self.event_id,
+                "saved_at": time.time(),
+                "after": {key: value.isoformat() if isinstance(value, datetime) else value
+                          for key, value in self._after.items()},
+                "hashes": self.tickets.hashes.tobytes().hex(),
+                "redeemed": bytes(self.tickets.redeemed).hex(),
+            }
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.snapshot_path)
+        self._snapshot_saved = time.monotonic()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        hashes = array("Q")
+        hashes.frombytes(bytes.fromhex(state["hashes"]))
+        self.tickets = TicketSet(hashes, bytes.fromhex(state["redeemed"]))
+        after = state["after"]
+        self._after = dict(after, checkin=after["checkin"] and datetime.fromisoformat(after["checkin"]))
+        self.last_sync = state["saved_at"]
+        return True
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        return [(entry["code"], datetime.fromisoformat(entry["scanned_at"])) for entry in entries]
+
+    def _rewrite_journal(self):
+        # Callers hold the lock; the journal keeps exactly the admissions not yet in MySQL
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for code, scanned_at in self._pending:
+                f.write(json.dumps({"code": code, "scanned_at": scanned_at.isoformat()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Validate ticket codes at a gate (one code per line on stdin)")
+    parser.add_argument("--event", type=int, required=True, help="event id")
+    parser.add_argument("--gate", default=GATE_NAME, help="gate name (default: EMS_CHECKIN_GATE or the host name)")
+    parser.add_argument("--dir", default=CHECKIN_DIR, help="snapshot and journal directory")
+    args = parser.parse_args()
+    # Fail fast on venue Wi-Fi instead of holding up the line
+    pool = ConnectionPool(size=1, timeout=3, connect_timeout=3)
+    gate = Gate(pool, args.event, args.gate, args.dir).load().start()
+    stats = gate.stats()
+    print(f"Gate {gate.gate}: {stats['tickets']} tickets, {stats['checked_in']} already checked in "
+          f"({'online' if gate.online else 'offline, from the local snapshot'}).")
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                result = gate.scan(line)
+                print(f"{result.status.upper():<13} {result.code}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gate.stop()
+        pool.close()
+        stats = gate.stats()
+        print(f"{stats['admitted']} admitted, {stats['pending']} not yet written to MySQL.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+# Connection settings (same database the Streamlit app has always used)
+DB_CONFIG = {
+    "host": os.environ.get("EMS_DB_HOST", "localhost"),
+    "port": int(os.environ.get("EMS_DB_PORT", "3306")),
+    "user": os.environ.get("EMS_DB_USER", "root"),
+    "password": os.environ.get("EMS_DB_PASSWORD", "akshay_babu_007"),
+    "database": os.environ.get("EMS_DB_NAME", "event_management"),
+}
+
+POOL_SIZE = int(os.environ.get("EMS_DB_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.environ.get("EMS_DB_POOL_TIMEOUT", "10"))
+# Connections idle for longer than this are pinged before being handed out
+PRE_PING_AFTER = float(os.environ.get("EMS_DB_PRE_PING_AFTER", "5"))
+# Connections older than this are closed and replaced on checkin
+MAX_LIFETIME = float(os.environ.get("EMS_DB_MAX_LIFETIME", "3600"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class PoolMetrics:
+    """Counters used to size the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.failed_pings = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def record_checkin(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "failed_pings": self.failed_pings,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": (self.total_wait / self.checkouts * 1000) if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+            }
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Thread-safe pool of pymysql connections.
+
+    Connections are opened lazily up to ``size`` and handed out through
+    ``connection()``, a context manager that returns them to the pool on exit.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, pre_ping_after=PRE_PING_AFTER,
+                 max_lifetime=MAX_LIFETIME, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.pre_ping_after = pre_ping_after
+        self.max_lifetime = max_lifetime
+        self.connect_kwargs = dict(DB_CONFIG, **connect_kwargs)
+        self.connect_kwargs.setdefault("autocommit", True)
+        self.connect_kwargs.setdefault("cursorclass", pymysql.cursors.DictCursor)
+        self.metrics = PoolMetrics()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self):
+        conn = pymysql.connect(**self.connect_kwargs)
+        self.metrics.incr("connections_created")
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        self.metrics.incr("connections_closed")
+        with self._lock:
+            self._opened -= 1
+
+    def _is_healthy(self, pooled):
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used < self.pre_ping_after:
+            return True
+        try:
+            pooled.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            self.metrics.incr("failed_pings")
+            return False
+
+    def _acquire(self):
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                pooled = None
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        pooled = self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.metrics.incr("timeouts")
+                        raise PoolTimeout(f"No database connection available after {self.timeout:.1f}s")
+                    try:
+                        pooled = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+
+            if pooled is not None and not self._is_healthy(pooled):
+                self._discard(pooled)
+                continue
+
+            self.metrics.record_checkout(time.monotonic() - started)
+            return pooled
+
+    def _release(self, pooled, broken=False):
+        self.metrics.record_checkin()
+        if broken or self._closed:
+            self._discard(pooled)
+            return
+        conn = pooled.conn
+        try:
+            # Never hand a half-finished transaction to the next borrower
+            if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                conn.rollback()
+            if conn.get_autocommit() != self.connect_kwargs["autocommit"]:
+                conn.autocommit(self.connect_kwargs["autocommit"])
+        except Exception:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a ``with`` block."""
+        pooled = self._acquire()
+        broken = False
+        try:
+            yield pooled.conn
+        except pymysql.err.InterfaceError:
+            broken = True
+            raise
+        except pymysql.err.OperationalError as e:
+            # 2xxx codes are client-side (lost connection, server gone away)
+            broken = bool(e.args) and isinstance(e.args[0], int) and e.args[0] >= 2000
+            raise
+        finally:
+            self._release(pooled, broken=broken)
+
+    def read_connection(self, session=None):
+        """Connection for read-only queries; ``db_router.RoutedPool`` sends these to replicas."""
+        return self.connection()
+
+    def note_write(self, *sessions):
+        """Hook for read-your-writes routing; a single server needs nothing."""
+
+    def stats(self):
+        stats = self.metrics.snapshot()
+        stats["size"] = self.size
+        stats["opened"] = self._opened
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
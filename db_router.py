@@ -0,0 +1,311 @@
+"""Read/write splitting across a primary and its replicas.
+
+``RoutedPool`` looks like the primary ``ConnectionPool``: ``connection()``,
+``stats()`` and the rest go to the primary, so writes and existing callers
+are unchanged. ``read_connection(session)`` serves a read-only query from a
+replica when:
+- the replica is healthy, meaning it is reachable and its replication lag is
+  at most ``MAX_LAG`` seconds (a ``ReplicaMonitor`` thread polls
+  ``SHOW REPLICA STATUS``);
+- it has applied the last write of ``session``.
+
+Otherwise the read falls back to the primary.
+
+Read-your-writes: after a session (a user id) writes, ``note_write(session)``
+records a token for it. The token depends on ``CONSISTENCY``:
+- ``gtid``: the primary's executed GTID set. A replica is used once it
+  contains that set (``GTID_SUBSET``, or ``MASTER_GTID_WAIT`` on MariaDB).
+- ``time``: the write time. A replica is used once its last measured lag
+  puts it past that time. This mode suits servers without GTIDs.
+- ``auto`` (the default): GTIDs when the primary has them.
+
+If the token can't be read (the primary is briefly unreachable after the
+commit), the session reads from the primary instead. Tokens expire after
+``SESSION_TTL`` seconds. By then every replica that
+counts as healthy has applied the write.
+
+Configure replicas with EMS_DB_REPLICAS="host[:port],..."; they use the
+primary's user, password and database. Without replicas ``from_env()``
+returns a plain pool, whose ``read_connection()`` is ``connection()``.
+
+A local two-instance setup (MariaDB shown; MySQL 8 works the same with
+``gtid_mode=ON``, ``enforce_gtid_consistency=ON``):
+
+    mariadbd --port 3306 --server-id 1 --log-bin --datadir ./primary ...
+    mariadbd --port 3307 --server-id 2 --read-only --datadir ./replica ...
+    # on the replica:
+    CHANGE MASTER TO MASTER_HOST='127.0.0.1', MASTER_PORT=3306, MASTER_USER='root',
+        MASTER_PASSWORD='...', MASTER_USE_GTID=slave_pos;
+    START SLAVE;
+    EMS_DB_REPLICAS=127.0.0.1:3307 streamlit run streamlit_ui.py
+"""
+import contextlib
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+
+import pymysql
+
+from db_pool import ConnectionPool, PoolTimeout
+
+REPLICAS = os.environ.get("EMS_DB_REPLICAS", "")
+MAX_LAG = float(os.environ.get("EMS_REPLICA_MAX_LAG", "5"))
+CHECK_INTERVAL = float(os.environ.get("EMS_REPLICA_CHECK_INTERVAL", "2"))
+CONSISTENCY = os.environ.get("EMS_READ_CONSISTENCY", "auto")
+SESSION_TTL = float(os.environ.get("EMS_READ_YOUR_WRITES_TTL", "60"))
+# Seconds a replica read may wait for a session's GTIDs before going to the primary
+GTID_WAIT = float(os.environ.get("EMS_REPLICA_GTID_WAIT", "0"))
+# Replica pools are smaller than the primary's by default; reads are short
+REPLICA_POOL_SIZE = int(os.environ.get("EMS_REPLICA_POOL_SIZE", "5"))
+MAX_SESSIONS = 100_000
+
+# Errors that take a replica out of rotation until the next health check
+_UNAVAILABLE = (pymysql.err.OperationalError, pymysql.err.InterfaceError, PoolTimeout)
+
+
+def parse_hosts(value):
+    """``"host[:port],..."`` -> ``[(host, port)]``."""
+    hosts = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            host, _, port = item.partition(":")
+            hosts.append((host, int(port) if port else 3306))
+    return hosts
+
+
+class Replica:
+    """One replica's pool and its last health check."""
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.lag = None
+        self.checked_at = 0.0
+        self.error = None
+
+    def mark_down(self, error):
+        self.healthy = False
+        self.error = str(error)
+
+    def check(self, max_lag):
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.ProgrammingError:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+        except Exception as e:
+            self.mark_down(e)
+            return
+        checked_at = time.time()
+        if status is None:
+            self.lag, self.error = None, "not configured as a replica"
+        else:
+            self.lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+            # NULL lag: the SQL or I/O thread is not running
+            self.error = None if self.lag is not None else status.get("Last_Error") or "replication stopped"
+        self.checked_at = checked_at
+        self.healthy = self.lag is not None and self.lag <= max_lag
+
+
+class ReplicaMonitor:
+    """Background thread re-checking every replica each ``interval`` seconds."""
+
+    def __init__(self, replicas, max_lag=MAX_LAG, interval=CHECK_INTERVAL):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def check_all(self):
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+
+    def start(self):
+        if self._thread is None:
+            self.check_all()
+            self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check_all()
+
+
+class RoutedPool:
+    """Primary pool plus replica pools; see the module docstring."""
+
+    def __init__(self, primary, replicas, consistency=CONSISTENCY, max_lag=MAX_LAG,
+                 check_interval=CHECK_INTERVAL, session_ttl=SESSION_TTL, gtid_wait=GTID_WAIT):
+        self.primary = primary
+        self.replicas = replicas
+        self.consistency = consistency
+        self.session_ttl = session_ttl
+        self.gtid_wait = gtid_wait
+        self.reads = Counter()
+        self._flavor = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        self.monitor = ReplicaMonitor(replicas, max_lag, check_interval).start()
+
+    def __getattr__(self, name):
+        # connection(), stats(), metrics, size, ...: the primary's
+        return getattr(self.primary, name)
+
+    # Read-your-writes tokens
+    def _mode(self):
+        """``(mode, flavor)``: ``("gtid", "mysql" | "mariadb")`` or ``("time", None)``, detected once."""
+        if self._flavor is None:
+            flavor = "none"
+            if self.consistency != "time":
+                with self.primary.connection() as conn, conn.cursor() as cursor:
+                    cursor.execute("SELECT @@version AS version")
+                    if "MariaDB" in cursor.fetchone()["version"]:
+                        flavor = "mariadb"
+                    else:
+                        cursor.execute("SELECT @@GLOBAL.gtid_mode AS mode")
+                        if cursor.fetchone()["mode"] == "ON":
+                            flavor = "mysql"
+                if flavor == "none" and self.consistency == "gtid":
+                    raise RuntimeError("EMS_READ_CONSISTENCY=gtid but the primary has no GTIDs")
+            self._flavor = flavor
+        return ("time", None) if self._flavor == "none" else ("gtid", self._flavor)
+
+    def _write_token(self):
+        mode, flavor = self._mode()
+        if mode == "time":
+            return time.time()
+        variable = "@@GLOBAL.gtid_binlog_pos" if flavor == "mariadb" else "@@GLOBAL.gtid_executed"
+        with self.primary.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"SELECT {variable} AS gtid")
+            return cursor.fetchone()["gtid"]
+
+    def note_write(self, *sessions):
+        """Record that each session just committed a write; call it after the commit.
+
+        Never raises: if the token can't be read, the sessions read from the
+        primary until their entry expires.
+        """
+        sessions = [session for session in sessions if session is not None]
+        if not sessions:
+            return
+        try:
+            token = self._write_token()
+        except Exception as e:
+            print(f"Read-your-writes token error: {e}")
+            token = None
+        expires = time.monotonic() + self.session_ttl
+        with self._lock:
+            if len(self._sessions) >= MAX_SESSIONS:
+                now = time.monotonic()
+                self._sessions = {key: entry for key, entry in self._sessions.items() if entry[1] > now}
+            for session in sessions:
+                self._sessions[session] = (token, expires, set())
+
+    def _caught_up(self, replica, session):
+        with self._lock:
+            entry = self._sessions.get(session)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._sessions[session]
+                entry = None
+        if entry is None:
+            return True
+        token, _, confirmed = entry
+        if token is None:
+            return False
+        if replica.name in confirmed:
+            return True
+        mode, flavor = self._mode()
+        if mode == "time":
+            # The replica had applied everything up to checked_at - lag (lag is whole seconds)
+            caught_up = token <= replica.checked_at - replica.lag - 1
+        else:
+            with replica.pool.connection() as conn, conn.cursor() as cursor:
+                if flavor == "mariadb":
+                    cursor.execute("SELECT MASTER_GTID_WAIT(%s, %s) = 0 AS ok", (token, self.gtid_wait))
+                elif self.gtid_wait > 0:
+                    cursor.execute("SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s) = 0 AS ok", (token, self.gtid_wait))
+                else:
+                    cursor.execute("SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed) AS ok", (token,))
+                caught_up = bool(cursor.fetchone()["ok"])
+        if caught_up:
+            with self._lock:
+                confirmed.add(replica.name)
+        return caught_up
+
+    # Routing
+    def _choose(self, session):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.reads["primary: no healthy replica"] += 1
+            return self.primary
+        start = next(self._next)
+        for i in range(len(healthy)):
+            replica = healthy[(start + i) % len(healthy)]
+            try:
+                if self._caught_up(replica, session):
+                    self.reads[f"replica {replica.name}"] += 1
+                    return replica.pool
+            except _UNAVAILABLE as e:
+                replica.mark_down(e)
+        self.reads["primary: read-your-writes"] += 1
+        return self.primary
+
+    @contextlib.contextmanager
+    def read_connection(self, session=None):
+        """A connection for read-only queries: a suitable replica's, else the primary's."""
+        pool = self._choose(session)
+        with contextlib.ExitStack() as stack:
+            try:
+                conn = stack.enter_context(pool.connection())
+            except _UNAVAILABLE as e:
+                # Only a failed checkout is retried on the primary; errors from the caller's queries propagate
+                if pool is self.primary:
+                    raise
+                next(replica for replica in self.replicas if replica.pool is pool).mark_down(e)
+                self.reads["primary: replica failed"] += 1
+                conn = stack.enter_context(self.primary.connection())
+            yield conn
+
+    def status(self):
+        """Per-replica health and the read routing counters, for the Performance page."""
+        return {
+            "mode": self._flavor and ("time" if self._flavor == "none" else f"gtid ({self._flavor})"),
+            "replicas": [
+                {"replica": r.name, "healthy": r.healthy, "lag_s": r.lag, "error": r.error,
+                 "checked": time.strftime("%H:%M:%S", time.localtime(r.checked_at)) if r.checked_at else None}
+                for r in self.replicas
+            ],
+            "reads": dict(self.reads),
+        }
+
+    def close(self):
+        self.monitor.stop()
+        for replica in self.replicas:
+            replica.pool.close()
+        self.primary.close()
+
+
+def from_env(pool_class=ConnectionPool, replicas=REPLICAS, **kwargs):
+    """The app's pool: a ``RoutedPool`` when EMS_DB_REPLICAS is set, else a plain ``pool_class`` pool."""
+    primary = pool_class(**kwargs)
+    hosts = parse_hosts(replicas)
+    if not hosts:
+        return primary
+    kwargs.setdefault("size", REPLICA_POOL_SIZE)
+    return RoutedPool(primary, [
+        Replica(f"{host}:{port}", pool_class(host=host, port=port, **kwargs)) for host, port in hosts
+    ])
@@ -0,0 +1,275 @@
+import os
+import threading
+import time as _time
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, time, timedelta
+
+# Minimum seconds between two refresh queries, however many sessions are reading
+REFRESH_INTERVAL = float(os.environ.get("EMS_SNAPSHOT_REFRESH", "2"))
+# Re-read rows this far behind the watermark: a transaction that commits late can
+# carry an updated_at slightly older than rows we have already seen
+WATERMARK_OVERLAP = timedelta(seconds=float(os.environ.get("EMS_SNAPSHOT_OVERLAP", "5")))
+
+EVENT_COLUMNS = (
+    "id", "title", "location", "date", "time", "description", "capacity",
+    "vip_tickets", "general_tickets", "vip_price", "general_price",
+    "user_id", "status", "poster_path", "updated_at", "duration_minutes",
+)
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+def parse_time(value):
+    """MySQL TIME columns arrive from pymysql as ``timedelta``"""
+    if isinstance(value, time):
+        return value
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, timedelta):
+        seconds = int(value.total_seconds()) % 86400
+        return time(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    text = str(value)
+    try:
+        return datetime.strptime(text, "%H:%M:%S").time()
+    except ValueError:
+        return datetime.strptime(text, "%H:%M").time()
+
+
+class EventRow:
+    """One active event. Immutable once built; supports ``event['title']`` access."""
+
+    __slots__ = EVENT_COLUMNS
+
+    def __init__(self, record):
+        for column in EVENT_COLUMNS:
+            setattr(self, column, record.get(column))
+        self.date = parse_date(self.date)
+        self.time = parse_time(self.time)
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+    def keys(self):
+        return EVENT_COLUMNS
+
+    def sort_key(self):
+        return (self.date, self.time, self.id)
+
+
+class EventSnapshot:
+    """In-process snapshot of active events shared by every session.
+
+    Secondary indexes by id, organizer, date and location are kept in step
+    with the rows. ``refresh()`` only reads events whose ``updated_at`` moved
+    past the last watermark, so a refresh costs one small query however many
+    sessions read the snapshot.
+
+    Listeners are notified under ``_notify_lock`` rather than ``_lock``, so
+    they see changes in order while readers are not held up by a listener
+    rebuilding its index.
+    """
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._lock = threading.RLock()
+        self._notify_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._by_id = {}
+        self._by_organizer = {}
+        self._by_date = {}
+        self._by_location = {}
+        self._order = []
+        self._watermark = None
+        self._last_refresh = 0.0
+        self._loaded = False
+        self._listeners = []
+        self.refreshes = 0
+
+    # ---- maintenance -------------------------------------------------
+
+    def _index_add(self, row):
+        self._by_id[row.id] = row
+        self._by_organizer.setdefault(row.user_id, set()).add(row.id)
+        self._by_date.setdefault(row.date, set()).add(row.id)
+        self._by_location.setdefault(row.location, set()).add(row.id)
+        insort(self._order, row.sort_key())
+
+    def _index_remove(self, event_id):
+        row = self._by_id.pop(event_id, None)
+        if row is None:
+            return None
+        for index, key in ((self._by_organizer, row.user_id), (self._by_date, row.date), (self._by_location, row.location)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del index[key]
+        pos = bisect_left(self._order, row.sort_key())
+        if pos < len(self._order) and self._order[pos] == row.sort_key():
+            del self._order[pos]
+        return row
+
+    def add_listener(self, listener):
+        """Keep a derived index in sync.
+
+        ``listener.snapshot_reset(rows)`` is called with every active row now
+        and after each full reload; ``listener.snapshot_changed(old, new)`` is
+        called for each row change (``old`` or ``new`` is ``None`` for
+        inserts and removals).
+        """
+        with self._notify_lock:
+            with self._lock:
+                self._listeners.append(listener)
+                rows = list(self._by_id.values())
+            listener.snapshot_reset(rows)
+
+    def apply(self, records, notify=True):
+        """Upsert changed event rows; rows that are no longer active are dropped."""
+        changed = []
+        with self._notify_lock:
+            with self._lock:
+                self._apply(records, changed)
+            if notify:
+                for old, row in changed:
+                    for listener in self._listeners:
+                        listener.snapshot_changed(old, row)
+        return len(changed)
+
+    def _apply(self, records, changed):
+        # Callers hold both locks
+        for record in records:
+            old = self._by_id.get(record["id"])
+            if record.get("status") != "active":
+                row = None
+                if self._index_remove(record["id"]) is None:
+                    continue
+            else:
+                row = EventRow(record)
+                if old is not None and row.updated_at is not None and old.updated_at == row.updated_at:
+                    continue  # re-read inside the watermark overlap
+                self._index_remove(record["id"])
+                self._index_add(row)
+            changed.append((old, row))
+            stamp = record.get("updated_at")
+            if stamp is not None and (self._watermark is None or stamp > self._watermark):
+                self._watermark = stamp
+        if changed:
+            self.version += 1
+
+    def _load_all(self, cursor):
+        cursor.execute(f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE status = 'active'")
+        records = cursor.fetchall()
+        with self._notify_lock:
+            with self._lock:
+                self._by_id.clear()
+                self._by_organizer.clear()
+                self._by_date.clear()
+                self._by_location.clear()
+                self._order.clear()
+                self._watermark = None
+                self._apply(records, [])
+                self.version += 1
+                self._loaded = True
+                rows = list(self._by_id.values())
+            for listener in self._listeners:
+                listener.snapshot_reset(rows)
+
+    def _load_changes(self, cursor):
+        since = self._watermark - WATERMARK_OVERLAP
+        cursor.execute(f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE updated_at >= %s", (since,))
+        records = cursor.fetchall()
+        # Archived events are deleted from ``events``; the archive says which ones left
+        cursor.execute("SELECT id, archived_at AS updated_at FROM events_archive WHERE archived_at >= %s", (since,))
+        self.apply(records + list(cursor.fetchall()))
+
+    def refresh(self, pool, force=False):
+        """Bring the snapshot up to date if it is older than the refresh interval."""
+        if not force and self._loaded and _time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        # Only one session refreshes; the others keep reading the current rows,
+        # unless nothing has been loaded yet
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not force and self._loaded and _time.monotonic() - self._last_refresh < self.refresh_interval:
+                return
+            with pool.connection() as conn, conn.cursor() as cursor:
+                if not self._loaded or self._watermark is None:
+                    self._load_all(cursor)
+                else:
+                    self._load_changes(cursor)
+            self._last_refresh = _time.monotonic()
+            self.refreshes += 1
+        finally:
+            self._refresh_lock.release()
+
+    def mark_stale(self):
+        """Force the next read to refresh (call after writing to ``events``)."""
+        self._last_refresh = 0.0
+
+    def reset(self):
+        """Drop everything; the next refresh reloads all active events."""
+        with self._lock:
+            self._loaded = False
+            self._watermark = None
+
+    # ---- reads -------------------------------------------------------
+
+    def _rows(self, ids):
+        rows = [self._by_id[event_id] for event_id in ids]
+        rows.sort(key=EventRow.sort_key)
+        return rows
+
+    def active(self):
+        """All active events ordered by date, time and id."""
+        with self._lock:
+            return [self._by_id[key[2]] for key in self._order]
+
+    def between(self, start_date, end_date):
+        """Active events with ``start_date <= date < end_date``, in order."""
+        with self._lock:
+            lo = bisect_left(self._order, (start_date,))
+            hi = bisect_left(self._order, (end_date,))
+            return [self._by_id[key[2]] for key in self._order[lo:hi]]
+
+    def page(self, after=None, limit=20):
+        """Keyset page of active events ordered by (date, time, id).
+
+        ``after`` is the cursor returned with the previous page (``None`` for
+        the first page). Returns ``(rows, next_cursor)``; ``next_cursor`` is
+        ``None`` on the last page. Costs O(log n + limit) whatever the page.
+        """
+        with self._lock:
+            start = 0 if after is None else bisect_right(self._order, tuple(after))
+            keys = self._order[start:start + limit]
+            rows = [self._by_id[key[2]] for key in keys]
+            more = start + limit < len(self._order)
+        return rows, (keys[-1] if keys and more else None)
+
+    def get(self, event_id):
+        return self._by_id.get(event_id)
+
+    def by_organizer(self, user_id):
+        with self._lock:
+            return self._rows(self._by_organizer.get(user_id, ()))
+
+    def on_date(self, day):
+        with self._lock:
+            return self._rows(self._by_date.get(day, ()))
+
+    def at_location(self, location):
+        with self._lock:
+            return self._rows(self._by_location.get(location, ()))
+
+    def __len__(self):
+        return len(self._by_id)
@@ -0,0 +1,206 @@
+"""EXPLAIN-based check that the app's hot queries never scan a whole table.
+
+Run against a database with the migrations applied. ``--seed`` first fills it
+with a synthetic history (1,000,000 events below), because on the 20-row
+seed data the optimizer happily scans everything:
+
+    python explain_check.py --seed 1000000
+    python explain_check.py
+
+Exits with status 1 if any query's plan contains an access type of ``ALL``.
+"""
+import argparse
+import random
+import sys
+from datetime import date, datetime, time, timedelta
+
+import sales_rollup
+import tickets
+from db_pool import ConnectionPool
+from pricing import WINDOW_HOURS
+
+LOCATIONS = [
+    "Main Auditorium", "Mini Auditorium", "Synergy Square", "Gazebo",
+    "B-block Basement", "Discussion Room", "Finance Lab", "Seminar Hall",
+]
+
+# (caller, SQL, sample params) for every query issued on the page hot paths
+HOT_QUERIES = [
+    ("Home / View Events: snapshot full load",
+     "SELECT * FROM events WHERE status = 'active'", ()),
+    ("Snapshot incremental refresh",
+     "SELECT * FROM events WHERE updated_at >= NOW() - INTERVAL 5 SECOND", ()),
+    ("Update / Cancel Event: organizer's events",
+     "SELECT * FROM events WHERE user_id = %s AND status = 'active'", (2,)),
+    ("Create Event: venue overlap",
+     "SELECT id FROM events WHERE location = %s AND date BETWEEN %s AND %s AND status = 'active' "
+     "AND TIMESTAMP(date, time) < %s AND TIMESTAMP(date, time) + INTERVAL duration_minutes MINUTE > %s",
+     ("Main Auditorium", date.today() + timedelta(days=29), date.today() + timedelta(days=30),
+      datetime.combine(date.today() + timedelta(days=30), time(11, 0)),
+      datetime.combine(date.today() + timedelta(days=30), time(10, 0)))),
+    ("Buy Ticket: guarded decrement",
+     "UPDATE events SET vip_tickets = vip_tickets - 1 WHERE id = %s AND status = 'active' AND vip_tickets >= 1", (1,)),
+    ("Buy Ticket: effective prices",
+     "SELECT COALESCE(p.vip_price, e.vip_price), COALESCE(p.general_price, e.general_price) "
+     "FROM events e LEFT JOIN event_prices p ON p.event_id = e.id WHERE e.id = %s", (1,)),
+    ("Pricing job: recent sales",
+     "SELECT event_id, SUM(vip_tickets_booked), SUM(general_tickets_booked) FROM bookings "
+     "WHERE created_at >= NOW() - INTERVAL 1440 MINUTE GROUP BY event_id", ()),
+    ("Price book refresh",
+     "SELECT * FROM event_prices WHERE updated_at >= NOW() - INTERVAL 10 SECOND", ()),
+    ("Cancel Event: booking count",
+     "SELECT * FROM event_sales_rollup WHERE event_id = %s", (1,)),
+    ("Insights: tickets per event",
+     "SELECT e.id, e.title, s.vip_sold, s.general_sold FROM event_sales_rollup s "
+     "JOIN events e ON e.id = s.event_id WHERE s.bookings > 0 AND e.user_id = %s "
+     "ORDER BY s.vip_sold + s.general_sold DESC LIMIT 25", (2,)),
+    ("Register for Event: guarded place claim",
+     "UPDATE event_sales_rollup r JOIN events e ON e.id = r.event_id SET r.registrations = r.registrations + 1 "
+     "WHERE r.event_id = %s AND e.status = 'active' AND r.registrations < e.capacity", (1,)),
+    ("Waitlist promotion: head of queue",
+     "SELECT id, user_id FROM registration_waitlist WHERE event_id = %s ORDER BY id LIMIT 200", (1,)),
+    ("Cancellation job: next booking batch",
+     "SELECT b.id, b.user_id, b.vip_tickets_booked, b.general_tickets_booked, b.amount FROM bookings b "
+     "WHERE b.event_id = %s AND b.id > %s ORDER BY b.id LIMIT 1000", (1, 0)),
+    ("Cancellation worker: claim",
+     "SELECT id FROM cancellation_jobs WHERE status IN ('pending', 'running') "
+     "AND (lease_until IS NULL OR lease_until < NOW()) ORDER BY id LIMIT 1", ()),
+    ("Notification outbox: pending",
+     "SELECT id, user_id, kind, payload, attempts FROM notification_outbox WHERE delivered_at IS NULL "
+     "AND failed_at IS NULL AND next_attempt_at <= CURRENT_TIMESTAMP(6) ORDER BY next_attempt_at, id LIMIT 500", ()),
+    ("View My Registrations: waitlist",
+     "SELECT w.event_id, e.title FROM registration_waitlist w JOIN events e ON e.id = w.event_id "
+     "WHERE w.user_id = %s ORDER BY w.id", (3,)),
+    ("View My Registrations",
+     "SELECT r.*, e.title, e.location, e.date, e.time, e.status FROM registrations r "
+     "JOIN events e ON r.event_id = e.id WHERE r.user_id = %s", (3,)),
+    ("View My Tickets: wallet page",
+     "SELECT b.id, b.ticket_code, e.title, e.location, e.date, e.time, e.status FROM bookings b "
+     "JOIN events e ON b.event_id = e.id WHERE b.user_id = %s AND b.id < %s ORDER BY b.id DESC LIMIT 21",
+     (1, 10 ** 9)),
+    ("Check-in: gate preload",
+     "SELECT b.id, b.ticket_code FROM bookings b LEFT JOIN refunds r ON r.booking_id = b.id AND r.status = 'approved' "
+     "WHERE b.event_id = %s AND b.id > %s AND b.ticket_code IS NOT NULL AND r.id IS NULL ORDER BY b.id", (1, 0)),
+    ("Check-in: other gates",
+     "SELECT ticket_code, recorded_at FROM checkins WHERE event_id = %s AND recorded_at >= %s",
+     (1, "2025-01-01")),
+    ("Archiver: candidates",
+     "SELECT e.id FROM events e WHERE e.id > %s AND ((e.status = 'active' AND e.date < CURDATE() - INTERVAL 30 DAY) "
+     "OR (e.status = 'canceled' AND e.updated_at < NOW() - INTERVAL 30 DAY)) ORDER BY e.id LIMIT 100", (0,)),
+    ("Snapshot: archived since watermark",
+     "SELECT id, archived_at AS updated_at FROM events_archive WHERE archived_at >= %s", ("2025-01-01",)),
+    ("View My Tickets: archived page",
+     "SELECT b.id, e.title FROM bookings_archive b JOIN events_archive e ON e.id = b.event_id AND e.date = b.event_date "
+     "WHERE b.user_id = %s AND b.id < %s ORDER BY b.id DESC LIMIT 21", (1, 10 ** 9)),
+    ("Update Event: poster still used",
+     "SELECT EXISTS (SELECT 1 FROM events WHERE poster_path = %s) "
+     "OR EXISTS (SELECT 1 FROM events_archive WHERE poster_path = %s) AS used", ("posters/x.png", "posters/x.png")),
+    ("Cache bus: outbox poll",
+     "SELECT id, origin, seq, topic, items, created_at FROM cache_invalidations "
+     "WHERE created_at >= %s - INTERVAL 5 SECOND ORDER BY id", ("2025-01-01",)),
+    ("Login", "SELECT id, password, role FROM users WHERE email = %s", ("emma.w@example.com",)),
+]
+
+
+def booking_time(rng, day, today):
+    """A purchase time before ``day`` and outside the pricing window, so seeded
+    bookings don't count as recent demand."""
+    return datetime.combine(min(day, today), time(12)) - timedelta(hours=WINDOW_HOURS, days=rng.randint(1, 60))
+
+
+def seed(pool, events, batch=5000):
+    """Insert a synthetic event history: mostly finished events, some upcoming."""
+    today = date.today()
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM users WHERE role = 'organizer'")
+        organizers = [row["id"] for row in cursor.fetchall()] or [None]
+        cursor.execute("SELECT id FROM users WHERE role = 'attendee'")
+        attendees = [row["id"] for row in cursor.fetchall()]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM events")
+        last_id = cursor.fetchone()["max_id"]
+
+        for start in range(0, events, batch):
+            rows = []
+            for _ in range(min(batch, events - start)):
+                day = today + timedelta(days=random.randint(-9 * 365, 365))
+                if day >= today:
+                    status = "canceled" if random.random() < 0.05 else "active"
+                else:
+                    status = "finished" if random.random() < 0.98 else "active"
+                capacity = random.randint(50, 1000)
+                vip = int(capacity * 0.3)
+                rows.append((
+                    f"Event {start + len(rows)}", random.choice(LOCATIONS), day,
+                    time(random.randint(8, 21), random.choice((0, 15, 30, 45))),
+                    "Synthetic event", capacity, vip, capacity - vip,
+                    round(random.uniform(20, 120), 2), round(random.uniform(5, 60), 2),
+                    random.choice(organizers), status,
+                ))
+            cursor.executemany("""
+                INSERT INTO events (title, location, date, time, description, capacity, vip_tickets,
+                                    general_tickets, vip_price, general_price, user_id, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, rows)
+            # Read the ids back: with auto_increment_increment > 1 they are not consecutive
+            cursor.execute(
+                "SELECT id, date, vip_price, general_price FROM events WHERE id > %s ORDER BY id", (last_id,)
+            )
+            batch_events = cursor.fetchall()
+            last_id = batch_events[-1]["id"]
+            if attendees:
+                bookings = []
+                for _ in range(len(rows) * 2):
+                    event = random.choice(batch_events)
+                    vip = random.randint(0, 2)
+                    general = random.randint(0 if vip else 1, 4)
+                    bookings.append((
+                        random.choice(attendees), event["id"], vip, general,
+                        vip * event["vip_price"] + general * event["general_price"],
+                        tickets.issue(event["id"]), booking_time(random, event["date"], today),
+                    ))
+                cursor.executemany("""
+                    INSERT INTO bookings (user_id, event_id, vip_tickets_booked, general_tickets_booked, amount,
+                                          ticket_code, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, bookings)
+            print(f"Seeded {start + len(rows)} / {events} events")
+    sales_rollup.reconcile(pool, fix=True, log=lambda message: None)
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("ANALYZE TABLE events, bookings, registrations, event_sales_rollup")
+        cursor.fetchall()
+
+
+def check(pool, queries=HOT_QUERIES):
+    """Return ``[(caller, table)]`` for every full table scan in the plans."""
+    scans = []
+    with pool.connection() as conn, conn.cursor() as cursor:
+        for caller, sql, params in queries:
+            cursor.execute("EXPLAIN " + sql, params)
+            for step in cursor.fetchall():
+                if step.get("type") == "ALL":
+                    scans.append((caller, step.get("table")))
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, metavar="EVENTS", help="insert a synthetic dataset first")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(size=1)
+    try:
+        if args.seed:
+            seed(pool, args.seed)
+        scans = check(pool)
+    finally:
+        pool.close()
+
+    for caller, table in scans:
+        print(f"FULL SCAN  {caller}: table {table}")
+    if scans:
+        sys.exit(1)
+    print(f"OK: no full table scans in {len(HOT_QUERIES)} hot queries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""Lightweight per-page and per-query instrumentation.
+
+``InstrumentedPool`` is a ``ConnectionPool`` with three additions. Its cursors
+time every ``execute``/``executemany`` under the SQL template, before
+parameters are interpolated, so each query shape is one series. Its
+connections count every command sent to the server, and it times every
+connection checkout. Measurements are added to the run that is
+current on the calling thread, if any, and to a process-wide ``Registry``.
+
+A run is one Streamlit rerun or one API request: ``registry.begin(page)`` ...
+``registry.end()``, or the ``registry.page(page)`` context manager. For each
+run the registry records:
+- wall time;
+- the number of queries and of round trips to the server;
+- rows returned or affected;
+- time spent in MySQL;
+- time spent getting a connection.
+
+The figures can be exported as Prometheus text (``prometheus()``) and
+appended as JSON lines to EMS_METRICS_LOG. ``SamplingProfiler`` samples one
+thread's stack, for the optional profile of a script run.
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import pymysql
+
+from db_pool import ConnectionPool, _PooledConnection
+
+ENABLED = os.environ.get("EMS_INSTRUMENT", "1") == "1"
+METRICS_LOG = os.environ.get("EMS_METRICS_LOG")
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005
+
+_WHITESPACE = re.compile(r"\s+")
+# IN lists are built with one placeholder per value; fold them so they are one series
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+
+
+def fingerprint(sql):
+    text = sql.decode(errors="replace") if isinstance(sql, bytes) else str(sql)
+    return _PLACEHOLDER_LIST.sub("%s, ...", _WHITESPACE.sub(" ", text).strip())
+
+
+class Stat:
+    """Count, sum, max and bucketed histogram of one series."""
+
+    __slots__ = ("count", "total", "max", "buckets", "rows", "queries", "db_seconds", "connect_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.rows = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.connect_seconds = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-quantile (``max`` beyond the last bucket)."""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Run:
+    __slots__ = ("page", "started", "seconds", "queries", "round_trips", "rows", "db_seconds", "connect_seconds")
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.queries = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.connect_seconds = 0.0
+
+
+_current_run = contextvars.ContextVar("instrumentation_run", default=None)
+
+
+class Registry:
+    def __init__(self, log_path=METRICS_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._queries = {}
+        self.started_at = time.time()
+
+    # Runs
+    def begin(self, page):
+        """Start a run on this thread; an unfinished previous run (e.g. ``st.stop()``) is dropped."""
+        _current_run.set(Run(page))
+
+    def end(self):
+        """Finish this thread's run and return it, or ``None`` if none was started."""
+        run = _current_run.get()
+        if run is None:
+            return None
+        _current_run.set(None)
+        elapsed = run.seconds = time.perf_counter() - run.started
+        with self._lock:
+            stat = self._pages.setdefault(run.page, Stat())
+            stat.observe(elapsed)
+            stat.queries += run.queries
+            stat.rows += run.rows
+            stat.db_seconds += run.db_seconds
+            stat.connect_seconds += run.connect_seconds
+        if self.log_path:
+            record = {
+                "ts": time.time(), "page": run.page, "seconds": round(elapsed, 6), "queries": run.queries,
+                "round_trips": run.round_trips, "rows": run.rows, "db_seconds": round(run.db_seconds, 6),
+                "connect_seconds": round(run.connect_seconds, 6),
+            }
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return run
+
+    @contextmanager
+    def page(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    # Observations
+    def record_query(self, sql, seconds, rows):
+        run = _current_run.get()
+        if run is not None:
+            run.queries += 1
+            run.rows += max(rows, 0)
+            run.db_seconds += seconds
+        with self._lock:
+            stat = self._queries.get(sql)
+            if stat is None:
+                stat = self._queries[sql] = Stat()
+            stat.observe(seconds)
+            stat.rows += max(rows, 0)
+
+    def record_round_trip(self):
+        run = _current_run.get()
+        if run is not None:
+            run.round_trips += 1
+
+    def record_connect(self, seconds):
+        run = _current_run.get()
+        if run is not None:
+            run.connect_seconds += seconds
+
+    # Reports
+    def _rows(self, series, limit, key):
+        with self._lock:
+            items = [(name, stat) for name, stat in series.items() if stat.count]
+            items.sort(key=lambda item: key(item[1]), reverse=True)
+            return [
+                {
+                    "name": name, "count": stat.count, "avg_ms": stat.total / stat.count * 1000,
+                    "p95_ms": stat.quantile(0.95) * 1000, "max_ms": stat.max * 1000, "total_s": stat.total,
+                    "rows_per_call": stat.rows / stat.count, "queries_per_call": stat.queries / stat.count,
+                    "db_ms_per_call": stat.db_seconds / stat.count * 1000,
+                    "connect_ms_per_call": stat.connect_seconds / stat.count * 1000,
+                }
+                for name, stat in items[:limit]
+            ]
+
+    def slowest_pages(self, limit=20, key=lambda stat: stat.quantile(0.95)):
+        return self._rows(self._pages, limit, key)
+
+    def slowest_queries(self, limit=20, key=lambda stat: stat.total):
+        return [
+            {k: v for k, v in row.items() if k not in ("queries_per_call", "db_ms_per_call", "connect_ms_per_call")}
+            for row in self._rows(self._queries, limit, key)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._pages.clear()
+            self._queries.clear()
+            self.started_at = time.time()
+
+    def prometheus(self):
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, label, series, help_text in (
+                ("ems_page_seconds", "page", self._pages, "Wall time of a page run"),
+                ("ems_query_seconds", "query", self._queries, "Time spent in one SQL statement"),
+            ):
+                lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} histogram"]
+                for name, stat in series.items():
+                    labels = f'{label}="{_escape(name)}"'
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, stat.buckets):
+                        cumulative += n
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {stat.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {stat.total:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {stat.count}")
+            for metric, attribute, help_text in (
+                ("ems_page_queries_total", "queries", "Queries issued by page runs"),
+                ("ems_page_rows_total", "rows", "Rows returned or affected during page runs"),
+                ("ems_page_db_seconds_total", "db_seconds", "Time page runs spent in MySQL"),
+                ("ems_page_connect_seconds_total", "connect_seconds", "Time page runs spent getting a connection"),
+            ):
+                lines += [f"# HELP {metric} {help_text}.", f"# TYPE {metric} counter"]
+                for name, stat in self._pages.items():
+                    lines.append(f'{metric}{{page="{_escape(name)}"}} {getattr(stat, attribute)}')
+            lines += ["# HELP ems_query_rows_total Rows returned or affected by a SQL statement.",
+                      "# TYPE ems_query_rows_total counter"]
+            for name, stat in self._queries.items():
+                lines.append(f'ems_query_rows_total{{query="{_escape(name)}"}} {stat.rows}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = Registry()
+
+
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    registry = REGISTRY
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            self.registry.record_query(fingerprint(query), time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        # pymysql implements executemany with execute(); don't count those twice
+        registry, self.registry = self.registry, _NULL_REGISTRY
+        try:
+            return super().executemany(query, args)
+        finally:
+            self.registry = registry
+            registry.record_query(fingerprint(query), time.perf_counter() - started, self.rowcount)
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """Counts every command sent to the server, including ``BEGIN``/``COMMIT`` and pings."""
+
+    registry = REGISTRY
+
+    def _execute_command(self, command, sql):
+        self.registry.record_round_trip()
+        return super()._execute_command(command, sql)
+
+
+class _NullRegistry:
+    def record_query(self, sql, seconds, rows):
+        pass
+
+
+_NULL_REGISTRY = _NullRegistry()
+
+
+class InstrumentedPool(ConnectionPool):
+    """``ConnectionPool`` whose queries and checkouts are recorded in ``registry``."""
+
+    def __init__(self, *args, registry=REGISTRY, **kwargs):
+        if registry is not REGISTRY:
+            kwargs.setdefault("cursorclass", type("InstrumentedCursor", (InstrumentedCursor,), {"registry": registry}))
+        kwargs.setdefault("cursorclass", InstrumentedCursor)
+        super().__init__(*args, **kwargs)
+        self.registry = registry
+
+    def _connect(self):
+        conn = InstrumentedConnection(**self.connect_kwargs)
+        conn.registry = self.registry
+        self.metrics.incr("connections_created")
+        return _PooledConnection(conn)
+
+    def _acquire(self):
+        started = time.perf_counter()
+        try:
+            return super()._acquire()
+        finally:
+            self.registry.record_connect(time.perf_counter() - started)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every ``interval`` seconds from a helper thread.
+
+    ``top()`` reports the functions seen most often, both on top of the stack
+    (self time) and anywhere on it (inclusive time).
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self._self = Counter()
+        self._inclusive = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                key = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                if top:
+                    self._self[key] += 1
+                    top = False
+                if key not in seen:
+                    seen.add(key)
+                    self._inclusive[key] += 1
+                frame = frame.f_back
+
+    def top(self, limit=25):
+        total = self.samples or 1
+        return [
+            {"function": key, "self_pct": self._self[key] / total * 100, "inclusive_pct": count / total * 100}
+            for key, count in self._inclusive.most_common(limit)
+        ]
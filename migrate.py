@@ -0,0 +1,146 @@
+"""Versioned schema migrations.
+
+Migrations live in ``migrations/`` as ``NNNN_name.sql`` (statements separated
+by ``;``) or ``NNNN_name.py`` (defining ``upgrade(cursor)``). Applied versions
+are recorded in ``schema_migrations``. The Streamlit app applies pending
+migrations on startup; they can also be run by hand:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied / pending migrations
+"""
+import argparse
+import importlib.util
+import os
+import re
+
+import pymysql
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+LOCK_NAME = "event_management_migrations"
+LOCK_TIMEOUT = 60
+
+# Schema objects that already exist (e.g. added by hand from "CIA 3.sql") are
+# treated as applied: duplicate column, duplicate key name, table exists
+ALREADY_APPLIED_ERRORS = (1060, 1061, 1050)
+
+_FILENAME = re.compile(r"^(\d{4})_([\w-]+)\.(sql|py)$")
+
+
+class MigrationError(Exception):
+    pass
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Return ``[(version, name, path)]`` sorted by version."""
+    found = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            found.append((match.group(1), match.group(2), os.path.join(directory, filename)))
+    found.sort()
+    versions = [version for version, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Duplicate migration version numbers in migrations/")
+    return found
+
+
+def split_statements(sql):
+    statements = []
+    for statement in sql.split(";"):
+        lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+        statement = "\n".join(lines).strip()
+        if statement:
+            statements.append(statement)
+    return statements
+
+
+def _execute_tolerant(cursor, statement):
+    try:
+        cursor.execute(statement)
+    except pymysql.err.MySQLError as e:
+        if not (e.args and e.args[0] in ALREADY_APPLIED_ERRORS):
+            raise
+
+
+def _run_migration(cursor, path):
+    if path.endswith(".sql"):
+        with open(path, encoding="utf-8") as f:
+            for statement in split_statements(f.read()):
+                _execute_tolerant(cursor, statement)
+    else:
+        spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(cursor)
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(16) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    _ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+
+def pending(cursor, directory=MIGRATIONS_DIR):
+    done = applied_versions(cursor)
+    return [m for m in discover(directory) if m[0] not in done]
+
+
+def apply_pending(pool, directory=MIGRATIONS_DIR, log=print):
+    """Apply every pending migration in order; returns the versions applied.
+
+    A named lock keeps several app processes starting at once from running
+    the same migration twice.
+    """
+    applied = []
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, %s) AS got", (LOCK_NAME, LOCK_TIMEOUT))
+        row = cursor.fetchone()
+        if not (row["got"] if isinstance(row, dict) else row[0]):
+            raise MigrationError("Timed out waiting for the migration lock")
+        try:
+            for version, name, path in pending(cursor, directory):
+                log(f"Applying migration {version}_{name}")
+                _run_migration(cursor, path)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+                )
+                conn.commit()
+                applied.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    return applied
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Apply event_management schema migrations")
+    parser.add_argument("--status", action="store_true", help="show applied and pending migrations")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(size=1)
+    try:
+        if args.status:
+            with pool.connection() as conn, conn.cursor() as cursor:
+                done = applied_versions(cursor)
+            for version, name, _ in discover():
+                print(f"{'applied' if version in done else 'pending'}  {version}_{name}")
+        else:
+            applied = apply_pending(pool)
+            print(f"Applied {len(applied)} migration(s).")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
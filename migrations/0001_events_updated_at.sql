@@ -0,0 +1,3 @@
+-- Row change timestamp used by event_snapshot.EventSnapshot for incremental refreshes
+ALTER TABLE events ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+ALTER TABLE events ADD INDEX idx_events_updated_at (updated_at);
@@ -0,0 +1,11 @@
+-- Active event listings, ordered by date/time/id (Home, View Events, keyset pages)
+ALTER TABLE events ADD INDEX idx_events_status_date (status, date, time, id);
+
+-- Organizer's own active events (Update Event, Cancel Event)
+ALTER TABLE events ADD INDEX idx_events_user_status (user_id, status);
+
+-- Venue conflict check on Create Event
+ALTER TABLE events ADD INDEX idx_events_venue_slot (location, date, time, status);
+
+-- Per-event booking counts and ticket sums, answered from the index alone
+ALTER TABLE bookings ADD INDEX idx_bookings_event_tickets (event_id, vip_tickets_booked, general_tickets_booked);
@@ -0,0 +1,2 @@
+-- Events occupy their venue for a duration; venue conflicts are checked on overlapping intervals
+ALTER TABLE events ADD COLUMN duration_minutes INT NOT NULL DEFAULT 60;
@@ -0,0 +1,42 @@
+-- Price paid per booking, so revenue can be summed and reconciled
+ALTER TABLE bookings ADD COLUMN amount DECIMAL(10, 2) NOT NULL DEFAULT 0;
+
+UPDATE bookings b
+JOIN events e ON e.id = b.event_id
+SET b.amount = b.vip_tickets_booked * e.vip_price + b.general_tickets_booked * e.general_price
+WHERE b.amount = 0;
+
+-- Per-event sales figures maintained by the booking, registration and refund paths
+CREATE TABLE event_sales_rollup (
+    event_id INT PRIMARY KEY,
+    bookings INT NOT NULL DEFAULT 0,
+    vip_sold INT NOT NULL DEFAULT 0,
+    general_sold INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    registrations INT NOT NULL DEFAULT 0,
+    refunds INT NOT NULL DEFAULT 0,
+    refunded_amount DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO event_sales_rollup (event_id, bookings, vip_sold, general_sold, revenue, registrations, refunds, refunded_amount)
+SELECT e.id,
+       COALESCE(b.bookings, 0), COALESCE(b.vip_sold, 0), COALESCE(b.general_sold, 0), COALESCE(b.revenue, 0),
+       COALESCE(r.registrations, 0),
+       COALESCE(f.refunds, 0), COALESCE(f.refunded_amount, 0)
+FROM events e
+LEFT JOIN (
+    SELECT event_id, COUNT(*) AS bookings, SUM(vip_tickets_booked) AS vip_sold,
+           SUM(general_tickets_booked) AS general_sold, SUM(amount) AS revenue
+    FROM bookings GROUP BY event_id
+) b ON b.event_id = e.id
+LEFT JOIN (
+    SELECT event_id, COUNT(*) AS registrations FROM registrations GROUP BY event_id
+) r ON r.event_id = e.id
+LEFT JOIN (
+    SELECT rf.event_id, COUNT(*) AS refunds, SUM(bk.amount) AS refunded_amount
+    FROM refunds rf JOIN bookings bk ON bk.id = rf.booking_id
+    WHERE rf.status <> 'rejected'
+    GROUP BY rf.event_id
+) f ON f.event_id = e.id
+ON DUPLICATE KEY UPDATE event_id = event_sales_rollup.event_id;
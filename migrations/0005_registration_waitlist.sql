@@ -0,0 +1,13 @@
+-- FIFO waitlist for full events; promoted into registrations as places free up
+CREATE TABLE registration_waitlist (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_id INT NOT NULL,
+    user_id INT NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    UNIQUE KEY uq_waitlist_event_user (event_id, user_id),
+    KEY idx_waitlist_event_order (event_id, id),
+    KEY idx_waitlist_user (user_id)
+);
+
+-- Current waitlist length per event, maintained next to the registration counter
+ALTER TABLE event_sales_rollup ADD COLUMN waitlisted INT NOT NULL DEFAULT 0;
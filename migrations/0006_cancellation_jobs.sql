@@ -0,0 +1,34 @@
+-- Background refund fan-out for canceled events; last_booking_id is the resume cursor
+CREATE TABLE cancellation_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    event_id INT NOT NULL,
+    requested_by INT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    total_bookings INT NOT NULL DEFAULT 0,
+    processed INT NOT NULL DEFAULT 0,
+    refunds_created INT NOT NULL DEFAULT 0,
+    last_booking_id INT NOT NULL DEFAULT 0,
+    lease_owner VARCHAR(64) NULL,
+    lease_until DATETIME NULL,
+    error TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_cancellation_event (event_id),
+    KEY idx_cancellation_status (status, id),
+    KEY idx_cancellation_requested_by (requested_by, id)
+);
+
+-- Local notification outbox, drained by a pluggable sender
+CREATE TABLE notification_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    kind VARCHAR(40) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    delivered_at TIMESTAMP(6) NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    KEY idx_outbox_pending (delivered_at, id)
+);
+
+-- Batches walk one event's bookings in id order
+CREATE INDEX idx_bookings_event_id ON bookings (event_id, id);
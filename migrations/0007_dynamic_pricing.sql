@@ -0,0 +1,16 @@
+-- When each booking was made; the pricing job measures sell-through velocity from it.
+-- Bookings made before this migration get the migration time.
+ALTER TABLE bookings ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX idx_bookings_created_at ON bookings (created_at, event_id);
+
+-- Effective ticket prices written by the pricing job; events keep the organizer's base prices
+CREATE TABLE event_prices (
+    event_id INT PRIMARY KEY,
+    vip_price DECIMAL(10, 2) NOT NULL,
+    general_price DECIMAL(10, 2) NOT NULL,
+    vip_pressure DOUBLE NOT NULL DEFAULT 0,
+    general_pressure DOUBLE NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    KEY idx_event_prices_updated_at (updated_at)
+);
@@ -0,0 +1,3 @@
+-- Admin accounts see the Performance page; grant with
+--   UPDATE users SET role = 'admin' WHERE email = '...';
+ALTER TABLE users MODIFY role ENUM('attendee', 'organizer', 'participant', 'admin') NOT NULL;
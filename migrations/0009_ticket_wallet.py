@@ -0,0 +1,43 @@
+"""Ticket wallet: per-user booking index and a signed ticket code per booking.
+
+Existing bookings get their codes here, in primary-key batches; new bookings
+get one when they are made (booking_engine, bulk_io).
+"""
+import pymysql
+
+import tickets
+
+BATCH = 1000
+# Duplicate column / duplicate key name: already applied by hand
+ALREADY_APPLIED_ERRORS = (1060, 1061)
+
+DDL = (
+    "ALTER TABLE bookings ADD COLUMN ticket_code VARCHAR(64) NULL",
+    "CREATE UNIQUE INDEX uq_bookings_ticket_code ON bookings (ticket_code)",
+    # Wallet pages: WHERE user_id = ? AND id < ? ORDER BY id DESC
+    "CREATE INDEX idx_bookings_user_id ON bookings (user_id, id)",
+)
+
+
+def upgrade(cursor):
+    for statement in DDL:
+        try:
+            cursor.execute(statement)
+        except pymysql.err.MySQLError as e:
+            if not (e.args and e.args[0] in ALREADY_APPLIED_ERRORS):
+                raise
+
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, event_id FROM bookings WHERE id > %s AND ticket_code IS NULL ORDER BY id LIMIT %s",
+            (last_id, BATCH),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        codes = " UNION ALL ".join(["SELECT %s AS id, %s AS code"] * len(rows))
+        params = [value for row in rows for value in (row["id"], tickets.issue(row["event_id"]))]
+        cursor.execute(f"UPDATE bookings b JOIN ({codes}) c ON c.id = b.id SET b.ticket_code = c.code", params)
+        cursor.connection.commit()
+        last_id = rows[-1]["id"]
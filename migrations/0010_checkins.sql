@@ -0,0 +1,14 @@
+-- Door check-ins: one row per admitted ticket code. The primary key makes a
+-- code redeemable once per event across every gate
+CREATE TABLE checkins (
+    event_id INT NOT NULL,
+    ticket_code VARCHAR(64) NOT NULL,
+    gate VARCHAR(64) NOT NULL,
+    scanned_at TIMESTAMP(6) NOT NULL,
+    recorded_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (event_id, ticket_code),
+    KEY idx_checkins_recorded (event_id, recorded_at)
+);
+
+-- Gate preload: registrations of one event in id order
+ALTER TABLE registrations ADD INDEX idx_registrations_event_id (event_id, id);
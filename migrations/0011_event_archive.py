@@ -0,0 +1,94 @@
+"""Archive tables for finished and canceled events, range-partitioned by event date.
+
+The live tables keep their foreign keys, which InnoDB does not allow on
+partitioned tables. So they hold the current events only, and ``archiver``
+moves the rest here. Each archive table has one partition per event year plus
+``pmax``, and ``archiver.ensure_partitions`` adds years as time passes.
+"""
+import pymysql
+
+import archiver
+
+# Table already exists: created by hand
+ALREADY_APPLIED_ERRORS = (1050,)
+
+DDL = (
+    """
+    CREATE TABLE events_archive (
+        id INT NOT NULL,
+        title VARCHAR(255) NOT NULL,
+        location VARCHAR(255) NOT NULL,
+        date DATE NOT NULL,
+        time TIME NOT NULL,
+        description TEXT NOT NULL,
+        capacity INT NOT NULL,
+        vip_tickets INT NOT NULL,
+        general_tickets INT NOT NULL,
+        vip_price DECIMAL(10, 2) NOT NULL,
+        general_price DECIMAL(10, 2) NOT NULL,
+        user_id INT,
+        status VARCHAR(20),
+        poster_path VARCHAR(255) DEFAULT NULL,
+        updated_at TIMESTAMP(6) NULL,
+        duration_minutes INT NOT NULL DEFAULT 60,
+        archived_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        PRIMARY KEY (id, date),
+        KEY idx_events_archive_user (user_id, date),
+        KEY idx_events_archive_archived (archived_at)
+    ) PARTITION BY RANGE COLUMNS (date) (PARTITION pmax VALUES LESS THAN (MAXVALUE))
+    """,
+    """
+    CREATE TABLE bookings_archive (
+        id INT NOT NULL,
+        user_id INT NOT NULL,
+        event_id INT NOT NULL,
+        vip_tickets_booked INT NOT NULL,
+        general_tickets_booked INT NOT NULL,
+        amount DECIMAL(10, 2) NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NULL,
+        ticket_code VARCHAR(64) NULL,
+        event_date DATE NOT NULL,
+        PRIMARY KEY (id, event_date),
+        KEY idx_bookings_archive_user (user_id, id),
+        KEY idx_bookings_archive_event (event_id)
+    ) PARTITION BY RANGE COLUMNS (event_date) (PARTITION pmax VALUES LESS THAN (MAXVALUE))
+    """,
+    """
+    CREATE TABLE registrations_archive (
+        id INT NOT NULL,
+        user_id INT NOT NULL,
+        event_id INT NOT NULL,
+        registration_date DATETIME NULL,
+        event_date DATE NOT NULL,
+        PRIMARY KEY (id, event_date),
+        KEY idx_registrations_archive_user (user_id),
+        KEY idx_registrations_archive_event (event_id)
+    ) PARTITION BY RANGE COLUMNS (event_date) (PARTITION pmax VALUES LESS THAN (MAXVALUE))
+    """,
+    """
+    CREATE TABLE refunds_archive (
+        id INT NOT NULL,
+        user_id INT NOT NULL,
+        booking_id INT NOT NULL,
+        event_id INT NOT NULL,
+        request_date DATETIME NULL,
+        status VARCHAR(20) NULL,
+        event_date DATE NOT NULL,
+        PRIMARY KEY (id, event_date),
+        KEY idx_refunds_archive_booking (booking_id),
+        KEY idx_refunds_archive_event (event_id)
+    ) PARTITION BY RANGE COLUMNS (event_date) (PARTITION pmax VALUES LESS THAN (MAXVALUE))
+    """,
+)
+
+
+def upgrade(cursor):
+    for statement in DDL:
+        try:
+            cursor.execute(statement)
+        except pymysql.err.MySQLError as e:
+            if not (e.args and e.args[0] in ALREADY_APPLIED_ERRORS):
+                raise
+    # One partition per year from the oldest event on, so the first archival run lands in place
+    cursor.execute("SELECT YEAR(MIN(date)) AS first_year FROM events")
+    archiver.ensure_partitions(cursor, first_year=cursor.fetchone()["first_year"])
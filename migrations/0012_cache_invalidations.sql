@@ -0,0 +1,11 @@
+-- Outbox of the MySQL cache bus (cache_bus.MySQLBus): every process appends
+-- the invalidations of its writes and polls for the others' by created_at
+CREATE TABLE cache_invalidations (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    origin VARCHAR(64) NOT NULL,
+    seq BIGINT NOT NULL,
+    topic VARCHAR(32) NOT NULL,
+    items TEXT NOT NULL,
+    created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    KEY idx_cache_invalidations_created (created_at)
+);
@@ -0,0 +1,3 @@
+-- Poster reference check on Update Event: is the replaced file still used, live or archived?
+ALTER TABLE events ADD INDEX idx_events_poster (poster_path);
+ALTER TABLE events_archive ADD INDEX idx_events_archive_poster (poster_path);
@@ -0,0 +1,11 @@
+-- Notification retries: a failing row waits next_attempt_at out instead of blocking the
+-- head of the outbox, and is dead-lettered (failed_at) after notifications.MAX_ATTEMPTS
+ALTER TABLE notification_outbox
+    ADD COLUMN next_attempt_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    ADD COLUMN failed_at TIMESTAMP(6) NULL,
+    ADD COLUMN last_error VARCHAR(255) NULL,
+    DROP INDEX idx_outbox_pending,
+    ADD INDEX idx_outbox_due (delivered_at, failed_at, next_attempt_at, id);
+
+-- Rows that already failed this often before the change
+UPDATE notification_outbox SET failed_at = CURRENT_TIMESTAMP(6) WHERE delivered_at IS NULL AND attempts >= 8;
@@ -0,0 +1,122 @@
+"""Local notification outbox.
+
+Writers add rows to ``notification_outbox`` inside their own transaction, so a
+notification exists exactly when the change it announces was committed.
+``deliver_pending()`` later claims due rows, hands them to a sender and marks
+them delivered. A failed row is retried with exponential backoff and, after
+``MAX_ATTEMPTS``, dead-lettered (``failed_at`` set, ``last_error`` kept) so it
+no longer holds up the rows behind it. Senders are pluggable; pick one with
+EMS_NOTIFY_SENDER:
+
+    log    print each notification (default)
+    file   append JSON lines to EMS_OUTBOX_DIR/notifications-YYYY-MM-DD.jsonl
+"""
+import json
+import os
+import threading
+from datetime import date
+
+DELIVERY_BATCH = 500
+MAX_ATTEMPTS = int(os.environ.get("EMS_NOTIFY_MAX_ATTEMPTS", "8"))
+# Seconds before the first retry; doubled per attempt up to RETRY_MAX
+RETRY_DELAY = 30
+RETRY_MAX = 3600
+# A claimed row whose sender never reported back (process died) is due again after this
+CLAIM_TIMEOUT = 300
+OUTBOX_DIR = os.environ.get("EMS_OUTBOX_DIR", "outbox")
+
+
+def enqueue(cursor, notifications):
+    """Queue ``(user_id, kind, payload_dict)`` tuples in the caller's transaction."""
+    if not notifications:
+        return
+    # pymysql rewrites this into one multi-row INSERT
+    cursor.executemany(
+        "INSERT INTO notification_outbox (user_id, kind, payload) VALUES (%s, %s, %s)",
+        [(user_id, kind, json.dumps(payload, default=str)) for user_id, kind, payload in notifications],
+    )
+
+
+class LogSender:
+    def send(self, notification):
+        print(f"[notify] user {notification['user_id']} {notification['kind']}: {notification['payload']}")
+
+
+class FileSender:
+    def __init__(self, directory=OUTBOX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, notification):
+        path = os.path.join(self.directory, f"notifications-{date.today().isoformat()}.jsonl")
+        line = json.dumps({
+            "id": notification["id"], "user_id": notification["user_id"], "kind": notification["kind"],
+            "payload": json.loads(notification["payload"]),
+        })
+        with self._lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+SENDERS = {"log": LogSender, "file": FileSender}
+
+
+def default_sender():
+    return SENDERS[os.environ.get("EMS_NOTIFY_SENDER", "log")]()
+
+
+def _marks(ids):
+    return ", ".join(["%s"] * len(ids))
+
+
+def deliver_pending(pool, sender, batch=DELIVERY_BATCH):
+    """Send up to ``batch`` due notifications; returns how many were delivered.
+
+    Rows are claimed (pushed ``CLAIM_TIMEOUT`` into the future) and committed
+    before sending, so no transaction is open while the sender runs.
+    """
+    with pool.connection() as conn, conn.cursor() as cursor:
+        conn.begin()
+        # SKIP LOCKED lets several processes claim from the outbox without sending twice
+        cursor.execute("""
+            SELECT id, user_id, kind, payload, attempts FROM notification_outbox
+            WHERE delivered_at IS NULL AND failed_at IS NULL AND next_attempt_at <= CURRENT_TIMESTAMP(6)
+            ORDER BY next_attempt_at, id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch,))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+        ids = [row["id"] for row in rows]
+        cursor.execute(
+            f"UPDATE notification_outbox SET attempts = attempts + 1, "
+            f"next_attempt_at = CURRENT_TIMESTAMP(6) + INTERVAL %s SECOND WHERE id IN ({_marks(ids)})",
+            (CLAIM_TIMEOUT, *ids),
+        )
+        conn.commit()
+
+        delivered = []
+        for row in rows:
+            try:
+                sender.send(row)
+                delivered.append(row["id"])
+            except Exception as e:
+                attempts = row["attempts"] + 1
+                if attempts >= MAX_ATTEMPTS:
+                    cursor.execute(
+                        "UPDATE notification_outbox SET failed_at = CURRENT_TIMESTAMP(6), last_error = %s WHERE id = %s",
+                        (str(e)[:255], row["id"]),
+                    )
+                else:
+                    cursor.execute(
+                        "UPDATE notification_outbox SET next_attempt_at = CURRENT_TIMESTAMP(6) + INTERVAL %s SECOND, "
+                        "last_error = %s WHERE id = %s",
+                        (min(RETRY_DELAY * 2 ** (attempts - 1), RETRY_MAX), str(e)[:255], row["id"]),
+                    )
+        if delivered:
+            cursor.execute(
+                f"UPDATE notification_outbox SET delivered_at = CURRENT_TIMESTAMP(6) WHERE id IN ({_marks(delivered)})",
+                delivered,
+            )
+    return len(delivered)
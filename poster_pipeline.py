@@ -0,0 +1,139 @@
+"""Poster ingest: content-addressed storage plus resized variants.
+
+Uploaded posters are stored as ``posters/<sha256>.<ext>``, so the same image
+uploaded twice is kept once and a stored file never changes (which makes it
+safe to cache forever). Thumbnails and WebP variants are generated by a
+background worker; until they exist, ``variant_path()`` falls back to the
+original. Pillow is optional: without it only the originals are served.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+POSTER_DIR = "posters"
+VARIANT_DIR = os.path.join(POSTER_DIR, "variants")
+
+# name -> (bounding box, format, file extension)
+VARIANTS = {
+    "thumb": ((400, 400), "WEBP", "webp"),
+    "thumb_jpeg": ((400, 400), "JPEG", "jpg"),
+    "large": ((1200, 1200), "WEBP", "webp"),
+}
+ALLOWED_EXTENSIONS = {".png": ".png", ".jpg": ".jpg", ".jpeg": ".jpg"}
+
+_HASHED_NAME = re.compile(r"^([0-9a-f]{64})\.\w+$")
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("EMS_POSTER_WORKERS", "2")), thread_name_prefix="poster")
+_in_flight = set()
+_legacy_hashes = {}
+_lock = threading.Lock()
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_file(digest, name):
+    _, _, ext = VARIANTS[name]
+    return os.path.join(VARIANT_DIR, f"{digest}_{name}.{ext}")
+
+
+def _generate_variants(source_path, digest):
+    try:
+        if Image is None:
+            return
+        os.makedirs(VARIANT_DIR, exist_ok=True)
+        with Image.open(source_path) as original:
+            original.load()
+            for name, (box, fmt, _) in VARIANTS.items():
+                target = variant_file(digest, name)
+                if os.path.exists(target):
+                    continue
+                image = original.copy()
+                image.thumbnail(box)
+                if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                tmp = f"{target}.tmp"
+                image.save(tmp, fmt, quality=82, optimize=True)
+                os.replace(tmp, target)
+    finally:
+        with _lock:
+            _in_flight.discard(digest)
+
+
+def _schedule(source_path, digest):
+    if Image is None:
+        return
+    with _lock:
+        if digest in _in_flight:
+            return
+        _in_flight.add(digest)
+    _executor.submit(_generate_variants, source_path, digest)
+
+
+def ingest(data, filename):
+    """Store an uploaded poster and queue its variants; returns the stored path."""
+    ext = ALLOWED_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    if ext is None:
+        raise ValueError("Posters must be PNG or JPG images.")
+    data = bytes(data)
+    digest = content_hash(data)
+    os.makedirs(POSTER_DIR, exist_ok=True)
+    path = os.path.join(POSTER_DIR, f"{digest}{ext}")
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    _schedule(path, digest)
+    return path
+
+
+def _digest_for(poster_path):
+    match = _HASHED_NAME.match(os.path.basename(poster_path))
+    if match:
+        return match.group(1)
+    # Posters saved before content addressing: hash them once per process
+    with _lock:
+        digest = _legacy_hashes.get(poster_path)
+    if digest is None and os.path.exists(poster_path):
+        with open(poster_path, "rb") as f:
+            digest = content_hash(f.read())
+        with _lock:
+            _legacy_hashes[poster_path] = digest
+    return digest
+
+
+def variant_path(poster_path, name="thumb"):
+    """Path of a poster variant, or the original until the variant is ready."""
+    if not poster_path:
+        return poster_path
+    digest = _digest_for(poster_path)
+    if digest is None:
+        return poster_path
+    target = variant_file(digest, name)
+    if os.path.exists(target):
+        return target
+    _schedule(poster_path, digest)
+    return poster_path
+
+
+def remove(poster_path):
+    """Delete a stored poster and its variants (only once nothing references it)."""
+    digest = _digest_for(poster_path)
+    paths = [poster_path] + ([variant_file(digest, name) for name in VARIANTS] if digest else [])
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    with _lock:
+        _legacy_hashes.pop(poster_path, None)
@@ -0,0 +1,245 @@
+"""Dynamic ticket pricing driven by sell-through velocity.
+
+A batch job (``recompute()``) prices every upcoming active event at once:
+
+- velocity: tickets per hour booked in the last ``WINDOW_HOURS``, per tier,
+  from ``bookings.created_at``;
+- pressure: ``velocity * hours_left / tickets_left``, i.e. how many times
+  over the remaining tickets would sell at the current pace (> 1 means the
+  tier sells out before the event starts);
+- price: ``base_price * curve(pressure)``. A curve is a piecewise-linear list
+  of ``(pressure, multiplier)`` points. Each run moves a price at most
+  ``MAX_STEP`` of its current value, so prices drift instead of jumping.
+
+The arithmetic runs as NumPy array operations over all events. Only the
+changed rows are written to ``event_prices``. Purchases read the effective
+price with a primary-key join inside the booking transaction, and Buy Ticket
+reads it from ``PriceBook``. ``PriceBook`` is an in-process cache refreshed
+incrementally, so nothing is priced per request.
+
+    python pricing.py            # one pricing run
+    python pricing.py --dry-run  # print the changes without writing them
+"""
+import argparse
+import json
+import os
+import threading
+import time as _time
+from datetime import timedelta
+
+import numpy as np
+
+WINDOW_HOURS = float(os.environ.get("EMS_PRICING_WINDOW_HOURS", "24"))
+INTERVAL = float(os.environ.get("EMS_PRICING_INTERVAL", "300"))
+MAX_STEP = float(os.environ.get("EMS_PRICING_MAX_STEP", "0.1"))
+# Pressure changes smaller than this are not written back when the price is unchanged
+PRESSURE_EPSILON = 0.05
+WRITE_BATCH = 1000
+LOCK_NAME = "event_management_pricing"
+
+# (pressure, multiplier) points; override with EMS_PRICE_CURVES='{"vip": [[0, 0.9], [1, 1], ...]}'
+DEFAULT_CURVES = {
+    "vip": ((0.0, 0.9), (1.0, 1.0), (2.0, 1.25), (4.0, 1.5)),
+    "general": ((0.0, 0.8), (0.5, 0.9), (1.0, 1.0), (2.0, 1.15), (4.0, 1.3)),
+}
+TIERS = ("vip", "general")
+
+REFRESH_INTERVAL = float(os.environ.get("EMS_PRICE_REFRESH", "5"))
+WATERMARK_OVERLAP = timedelta(seconds=5)
+
+
+def load_curves(raw=None):
+    """Curves from ``raw`` JSON (default: EMS_PRICE_CURVES), validated and as NumPy arrays."""
+    raw = raw if raw is not None else os.environ.get("EMS_PRICE_CURVES")
+    curves = dict(DEFAULT_CURVES)
+    if raw:
+        curves.update(json.loads(raw))
+    arrays = {}
+    for tier in TIERS:
+        points = np.asarray(curves[tier], dtype=float)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+            raise ValueError(f"Price curve '{tier}' needs at least two (pressure, multiplier) points.")
+        if np.any(np.diff(points[:, 0]) <= 0) or np.any(points[:, 1] <= 0):
+            raise ValueError(f"Price curve '{tier}' needs increasing pressures and positive multipliers.")
+        arrays[tier] = (points[:, 0], points[:, 1])
+    return arrays
+
+
+def _load_inputs(cursor, window_hours):
+    cursor.execute("""
+        SELECT e.id, e.vip_price, e.general_price, e.vip_tickets, e.general_tickets,
+               TIMESTAMPDIFF(MINUTE, NOW(), TIMESTAMP(e.date, e.time)) AS minutes_left,
+               p.vip_price AS vip_current, p.general_price AS general_current,
+               p.vip_pressure, p.general_pressure
+        FROM events e
+        LEFT JOIN event_prices p ON p.event_id = e.id
+        WHERE e.status = 'active' AND e.date >= CURDATE()
+    """)
+    events = [row for row in cursor.fetchall() if row["minutes_left"] > 0]
+    cursor.execute("""
+        SELECT event_id, SUM(vip_tickets_booked) AS vip_sold, SUM(general_tickets_booked) AS general_sold
+        FROM bookings
+        WHERE created_at >= NOW() - INTERVAL %s MINUTE
+        GROUP BY event_id
+    """, (int(window_hours * 60),))
+    recent = {row["event_id"]: row for row in cursor.fetchall()}
+    return events, recent
+
+
+def compute(events, recent, curves, window_hours=WINDOW_HOURS, max_step=MAX_STEP):
+    """Effective prices for all events at once; returns ``{tier: (prices, pressures)}`` arrays."""
+    hours_left = np.maximum(np.array([row["minutes_left"] for row in events], dtype=float) / 60.0, 1.0)
+    priced = {}
+    for tier in TIERS:
+        base = np.array([float(row[f"{tier}_price"]) for row in events])
+        current = np.array([float(row[f"{tier}_current"] if row[f"{tier}_current"] is not None
+                                  else row[f"{tier}_price"]) for row in events])
+        left = np.array([row[f"{tier}_tickets"] for row in events], dtype=float)
+        sold = np.array([float((recent.get(row["id"]) or {}).get(f"{tier}_sold") or 0) for row in events])
+
+        velocity = sold / window_hours
+        xs, ys = curves[tier]
+        # A sold-out tier sits at the top of its curve until tickets come back
+        pressure = np.where(left > 0, velocity * hours_left / np.maximum(left, 1.0), xs[-1])
+        target = base * np.interp(pressure, xs, ys)
+        step = current * max_step
+        priced[tier] = (np.round(np.clip(target, current - step, current + step), 2), pressure)
+    return priced
+
+
+def recompute(pool, curves=None, window_hours=WINDOW_HOURS, dry_run=False, log=print):
+    """Reprice every upcoming active event; returns the number of rows written (or that would be)."""
+    curves = curves or load_curves()
+    with pool.connection() as conn, conn.cursor() as cursor:
+        # One pricing run at a time across processes; others skip this round
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,))
+        if not cursor.fetchone()["acquired"]:
+            return 0
+        try:
+            events, recent = _load_inputs(cursor, window_hours)
+            if not events:
+                return 0
+            priced = compute(events, recent, curves, window_hours)
+            changes = []
+            for i, row in enumerate(events):
+                values = []
+                changed = row["vip_current"] is None
+                for tier in TIERS:
+                    price, pressure = priced[tier][0][i], priced[tier][1][i]
+                    previous_price = row[f"{tier}_current"]
+                    previous_pressure = row[f"{tier}_pressure"] or 0.0
+                    changed = (changed or float(previous_price) != price
+                               or abs(previous_pressure - pressure) > PRESSURE_EPSILON)
+                    values += [float(price), float(pressure)]
+                if changed:
+                    changes.append((row["id"], *values))
+            if dry_run:
+                for event_id, vip, vip_pressure, general, general_pressure in changes:
+                    log(f"event {event_id}: VIP {vip:.2f} (pressure {vip_pressure:.2f}), "
+                        f"General {general:.2f} (pressure {general_pressure:.2f})")
+                return len(changes)
+            for start in range(0, len(changes), WRITE_BATCH):
+                # pymysql rewrites this into one multi-row INSERT
+                cursor.executemany("""
+                    INSERT INTO event_prices (event_id, vip_price, vip_pressure, general_price, general_pressure)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE vip_price = VALUES(vip_price), vip_pressure = VALUES(vip_pressure),
+                        general_price = VALUES(general_price), general_pressure = VALUES(general_pressure)
+                """, changes[start:start + WRITE_BATCH])
+            return len(changes)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+
+
+class PriceBook:
+    """In-process cache of effective prices, refreshed incrementally by ``updated_at``."""
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._prices = {}
+        self._watermark = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, pool, force=False):
+        if not force and _time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        # One session refreshes; the others read the current prices
+        if not self._lock.acquire(blocking=self._watermark is None):
+            return
+        try:
+            with pool.connection() as conn, conn.cursor() as cursor:
+                if self._watermark is None:
+                    cursor.execute("SELECT * FROM event_prices")
+                else:
+                    cursor.execute("SELECT * FROM event_prices WHERE updated_at >= %s",
+                                   (self._watermark - WATERMARK_OVERLAP,))
+                for row in cursor.fetchall():
+                    self._prices[row["event_id"]] = row
+                    if self._watermark is None or row["updated_at"] > self._watermark:
+                        self._watermark = row["updated_at"]
+            self._last_refresh = _time.monotonic()
+        finally:
+            self._lock.release()
+
+    def mark_stale(self):
+        self._last_refresh = 0.0
+
+    def effective(self, event):
+        """``(vip_price, general_price)`` for an event row, falling back to its base prices."""
+        row = self._prices.get(event["id"])
+        if row is None:
+            return event["vip_price"], event["general_price"]
+        return row["vip_price"], row["general_price"]
+
+    def get(self, event_id):
+        return self._prices.get(event_id)
+
+
+class PricingJob:
+    """Background thread running ``recompute()`` every ``interval`` seconds."""
+
+    def __init__(self, pool, interval=INTERVAL, on_change=None):
+        self.pool = pool
+        self.interval = interval
+        self.on_change = on_change
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="pricing-job", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if recompute(self.pool, log=lambda message: None) and self.on_change:
+                    self.on_change()
+            except Exception as e:
+                print(f"Pricing job error: {e}")
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Recompute dynamic ticket prices")
+    parser.add_argument("--dry-run", action="store_true", help="print the new prices without writing them")
+    parser.add_argument("--window-hours", type=float, default=WINDOW_HOURS)
+    args = parser.parse_args()
+    pool = ConnectionPool(size=1)
+    try:
+        changed = recompute(pool, window_hours=args.window_hours, dry_run=args.dry_run)
+        print(f"{'Would update' if args.dry_run else 'Updated'} {changed} event price row(s).")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
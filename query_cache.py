@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+
+# Time-to-live (seconds) for each kind of cached read
+WALLET_PAGE_SIZE = 20
+USER_BOOKINGS_TTL = float(os.environ.get("EMS_CACHE_BOOKINGS_TTL", "60"))
+USER_REGISTRATIONS_TTL = float(os.environ.get("EMS_CACHE_REGISTRATIONS_TTL", "60"))
+
+
+# Cache keys (active events live in event_snapshot.EventSnapshot instead)
+def user_bookings_key(user_id, before=None, limit=WALLET_PAGE_SIZE):
+    return ("bookings", user_id, before, limit)
+
+
+def user_wallet_tag(user_id):
+    return ("wallet", user_id)
+
+
+def user_registrations_key(user_id):
+    return ("registrations", user_id)
+
+
+class QueryCache:
+    """Process-wide TTL cache for query results with targeted invalidation.
+
+    Entries are stored under tuple keys and may carry tags (for example
+    ``("event", 7)``) so that a write can drop every entry that depends on a
+    particular row without clearing unrelated entries.
+
+    An invalidation during a load must also beat the load: the loader may have
+    read the rows before the write. Every invalidation advances ``_generation``
+    and, while loads are in flight, stamps the invalidated keys and tags with
+    it. A load whose key or tags were stamped after it started is returned to
+    its caller but not cached.
+    """
+
+    _ALL = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._tags = {}
+        self._loading = {}
+        self._generation = 0
+        self._stamps = {}
+        self.bus = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            return value
+
+    def set(self, key, value, ttl, tags=()):
+        with self._lock:
+            self._store(key, value, ttl, tags)
+
+    def _store(self, key, value, ttl, tags):
+        self._drop(key)
+        self._entries[key] = (value, time.monotonic() + ttl, tuple(tags))
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def _invalidated(self, *names):
+        # Callers hold the lock
+        self._generation += 1
+        if self._loading:
+            for name in names:
+                self._stamps[name] = self._generation
+
+    def get_or_load(self, key, loader, ttl, tags=()):
+        """Return the cached value for ``key``, calling ``loader`` on a miss.
+
+        Concurrent misses for the same key wait for a single load instead of
+        all hitting the database.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            with self._lock:
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = threading.Event()
+                    started = self._generation
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                pending.wait()
+                continue
+            try:
+                self.misses += 1
+                value = loader()
+                tag_values = tags(value) if callable(tags) else tags
+                with self._lock:
+                    stale = any(self._stamps.get(name, 0) > started for name in (key, self._ALL, *tag_values))
+                    if not stale:
+                        self._store(key, value, ttl, tag_values)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                    if not self._loading:
+                        self._stamps.clear()
+                pending.set()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[2]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+    def invalidate(self, *keys):
+        self._invalidate_keys(keys)
+        if self.bus is not None and keys:
+            self.bus.publish("keys", keys)
+
+    def invalidate_tags(self, *tags):
+        self._invalidate_tags(tags)
+        if self.bus is not None and tags:
+            self.bus.publish("tags", tags)
+
+    def _invalidate_keys(self, keys):
+        with self._lock:
+            self._invalidated(*keys)
+            for key in keys:
+                self._drop(key)
+
+    def _invalidate_tags(self, tags):
+        with self._lock:
+            self._invalidated(*tags)
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def attach(self, bus):
+        """Broadcast this cache's invalidations to the other processes over ``bus``, and apply theirs."""
+        self.bus = bus
+        bus.subscribe("keys", self._invalidate_keys)
+        bus.subscribe("tags", self._invalidate_tags)
+        bus.on_resync(self.clear)
+
+    def clear(self):
+        with self._lock:
+            self._invalidated(self._ALL)
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# ✅ Cached reads
+def user_bookings(pool, cache, user_id, before=None, limit=WALLET_PAGE_SIZE):
+    """One ticket wallet page, newest booking first: ``(rows, next_before)``.
+
+    Keyset-paged on ``bookings(user_id, id)``, merged with the same index of
+    ``bookings_archive``; ``next_before`` is ``None`` on the last page. Every page of a user carries the user's wallet tag, so a
+    new booking drops them all.
+    """
+    def load():
+        keyset = " AND b.id < %s" if before is not None else ""
+        params = (user_id, before, limit + 1) if before is not None else (user_id, limit + 1)
+        with pool.read_connection(session=user_id) as conn, conn.cursor() as cursor:
+            # Each branch walks its own (user_id, id) index; archived events keep their tickets visible
+            cursor.execute(f"""
+                (SELECT b.id, b.event_id, b.vip_tickets_booked, b.general_tickets_booked, b.amount,
+                        b.ticket_code, b.created_at, e.title, e.location, e.date, e.time, e.status
+                 FROM bookings b
+                 JOIN events e ON b.event_id = e.id
+                 WHERE b.user_id = %s{keyset}
+                 ORDER BY b.id DESC LIMIT %s)
+                UNION ALL
+                (SELECT b.id, b.event_id, b.vip_tickets_booked, b.general_tickets_booked, b.amount,
+                        b.ticket_code, b.created_at, e.title, e.location, e.date, e.time, e.status
+                 FROM bookings_archive b
+                 JOIN events_archive e ON e.id = b.event_id AND e.date = b.event_date
+                 WHERE b.user_id = %s{keyset}
+                 ORDER BY b.id DESC LIMIT %s)
+                ORDER BY id DESC
+                LIMIT %s
+            """, params + params + (limit + 1,))
+            rows = cursor.fetchall()
+        return rows[:limit], (rows[limit - 1]["id"] if len(rows) > limit else None)
+    return cache.get_or_load(
+        user_bookings_key(user_id, before, limit), load, USER_BOOKINGS_TTL,
+        tags=lambda page: [user_wallet_tag(user_id)] + [("event", row["event_id"]) for row in page[0]],
+    )
+
+
+def user_registrations(pool, cache, user_id):
+    def load():
+        with pool.read_connection(session=user_id) as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT r.id, r.user_id, r.event_id, r.registration_date, e.title, e.location, e.date, e.time, e.status
+                FROM registrations r
+                JOIN events e ON r.event_id = e.id
+                WHERE r.user_id = %s
+                UNION ALL
+                SELECT r.id, r.user_id, r.event_id, r.registration_date, e.title, e.location, e.date, e.time, e.status
+                FROM registrations_archive r
+                JOIN events_archive e ON e.id = r.event_id AND e.date = r.event_date
+                WHERE r.user_id = %s
+            """, (user_id, user_id))
+            return cursor.fetchall()
+    return cache.get_or_load(
+        user_registrations_key(user_id), load, USER_REGISTRATIONS_TTL,
+        tags=lambda rows: [("event", row["event_id"]) for row in rows],
+    )
+
+
+# ✅ Invalidation after writes
+def invalidate_event(cache, event_id):
+    """An event was created, updated or canceled."""
+    if event_id is not None:
+        # Bookings/registrations lists that join this event's details
+        cache.invalidate_tags(("event", event_id))
+
+
+def invalidate_booking(cache, user_id):
+    cache.invalidate_tags(user_wallet_tag(user_id))
+
+
+def invalidate_registration(cache, user_id, event_id):
+    cache.invalidate(user_registrations_key(user_id))
@@ -0,0 +1,165 @@
+"""Per-event sales rollup (``event_sales_rollup``).
+
+The write paths call these helpers with the cursor of their own transaction,
+so a booking, registration or refund and its rollup change commit together.
+``reconcile()`` recomputes the figures from the base tables and reports (or
+fixes) any drift:
+
+    python sales_rollup.py            # report mismatches
+    python sales_rollup.py --fix      # overwrite drifted rows
+"""
+import argparse
+from decimal import Decimal
+
+ROLLUP_COLUMNS = (
+    "bookings", "vip_sold", "general_sold", "revenue", "registrations", "waitlisted", "refunds", "refunded_amount",
+)
+RECONCILE_BATCH = 1000
+
+
+def _add(cursor, event_id, **deltas):
+    columns = ", ".join(deltas)
+    marks = ", ".join(["%s"] * len(deltas))
+    updates = ", ".join(f"{column} = {column} + VALUES({column})" for column in deltas)
+    cursor.execute(
+        f"INSERT INTO event_sales_rollup (event_id, {columns}) VALUES (%s, {marks}) "
+        f"ON DUPLICATE KEY UPDATE {updates}",
+        (event_id, *deltas.values()),
+    )
+
+
+def record_event(cursor, event_id):
+    """Create the (empty) rollup row for a new event."""
+    cursor.execute("INSERT IGNORE INTO event_sales_rollup (event_id) VALUES (%s)", (event_id,))
+
+
+def record_events_since(cursor, first_id):
+    """Create the rollup rows of every event from ``first_id`` on that lacks one (after a multi-row INSERT).
+
+    The statement's ids are not necessarily consecutive (``auto_increment_increment``
+    above 1, interleaved AUTO_INCREMENT locking), so they are selected rather than
+    computed from ``first_id``.
+    """
+    cursor.execute("""
+        INSERT IGNORE INTO event_sales_rollup (event_id)
+        SELECT e.id FROM events e
+        WHERE e.id >= %s AND NOT EXISTS (SELECT 1 FROM event_sales_rollup r WHERE r.event_id = e.id)
+    """, (first_id,))
+
+
+def record_bookings(cursor, event_id, bookings, vip_tickets, general_tickets, revenue):
+    _add(cursor, event_id, bookings=bookings, vip_sold=vip_tickets, general_sold=general_tickets, revenue=revenue)
+
+
+def record_registrations(cursor, event_id, count=1):
+    _add(cursor, event_id, registrations=count)
+
+
+def record_refunds(cursor, event_id, count, amount):
+    _add(cursor, event_id, refunds=count, refunded_amount=amount)
+
+
+def ensure(cursor, event_id):
+    """Create a missing rollup row from the base tables (events inserted outside the app)."""
+    cursor.execute(_ACTUAL, (event_id, event_id) * 5)
+    actual = cursor.fetchone()
+    if actual is None:
+        return
+    columns = ", ".join(ROLLUP_COLUMNS)
+    cursor.execute(
+        f"INSERT IGNORE INTO event_sales_rollup (event_id, {columns}) VALUES (%s, {', '.join(['%s'] * len(ROLLUP_COLUMNS))})",
+        (event_id, *(actual[c] for c in ROLLUP_COLUMNS)),
+    )
+
+
+def get(cursor, event_id):
+    cursor.execute("SELECT * FROM event_sales_rollup WHERE event_id = %s", (event_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return dict(event_id=event_id, **{column: 0 for column in ROLLUP_COLUMNS})
+    return row
+
+
+_ACTUAL = """
+    SELECT e.id AS event_id,
+           COALESCE(b.bookings, 0) AS bookings, COALESCE(b.vip_sold, 0) AS vip_sold,
+           COALESCE(b.general_sold, 0) AS general_sold, COALESCE(b.revenue, 0) AS revenue,
+           COALESCE(r.registrations, 0) AS registrations, COALESCE(w.waitlisted, 0) AS waitlisted,
+           COALESCE(f.refunds, 0) AS refunds, COALESCE(f.refunded_amount, 0) AS refunded_amount
+    FROM events e
+    LEFT JOIN (
+        SELECT event_id, COUNT(*) AS bookings, SUM(vip_tickets_booked) AS vip_sold,
+               SUM(general_tickets_booked) AS general_sold, SUM(amount) AS revenue
+        FROM bookings WHERE event_id BETWEEN %s AND %s GROUP BY event_id
+    ) b ON b.event_id = e.id
+    LEFT JOIN (
+        SELECT event_id, COUNT(*) AS registrations
+        FROM registrations WHERE event_id BETWEEN %s AND %s GROUP BY event_id
+    ) r ON r.event_id = e.id
+    LEFT JOIN (
+        SELECT event_id, COUNT(*) AS waitlisted
+        FROM registration_waitlist WHERE event_id BETWEEN %s AND %s GROUP BY event_id
+    ) w ON w.event_id = e.id
+    LEFT JOIN (
+        SELECT rf.event_id, COUNT(*) AS refunds, SUM(bk.amount) AS refunded_amount
+        FROM refunds rf JOIN bookings bk ON bk.id = rf.booking_id
+        WHERE rf.status <> 'rejected' AND rf.event_id BETWEEN %s AND %s
+        GROUP BY rf.event_id
+    ) f ON f.event_id = e.id
+    WHERE e.id BETWEEN %s AND %s
+"""
+
+
+def _same(expected, actual):
+    return all(Decimal(str(expected[c])) == Decimal(str(actual[c])) for c in ROLLUP_COLUMNS)
+
+
+def reconcile(pool, fix=False, batch=RECONCILE_BATCH, log=print):
+    """Compare the rollup with the base tables in event-id ranges; returns drifted event ids."""
+    drifted = []
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM events")
+        max_id = cursor.fetchone()["max_id"]
+        for low in range(1, max_id + 1, batch):
+            high = low + batch - 1
+            cursor.execute(_ACTUAL, (low, high) * 5)
+            actual = {row["event_id"]: row for row in cursor.fetchall()}
+            cursor.execute("SELECT * FROM event_sales_rollup WHERE event_id BETWEEN %s AND %s", (low, high))
+            stored = {row["event_id"]: row for row in cursor.fetchall()}
+
+            for event_id, truth in actual.items():
+                current = stored.get(event_id)
+                if current is not None and _same(truth, current):
+                    continue
+                drifted.append(event_id)
+                log(f"event {event_id}: rollup {dict((c, current[c]) for c in ROLLUP_COLUMNS) if current else None} "
+                    f"!= actual {dict((c, truth[c]) for c in ROLLUP_COLUMNS)}")
+                if fix:
+                    columns = ", ".join(ROLLUP_COLUMNS)
+                    marks = ", ".join(["%s"] * len(ROLLUP_COLUMNS))
+                    updates = ", ".join(f"{c} = VALUES({c})" for c in ROLLUP_COLUMNS)
+                    cursor.execute(
+                        f"INSERT INTO event_sales_rollup (event_id, {columns}) VALUES (%s, {marks}) "
+                        f"ON DUPLICATE KEY UPDATE {updates}",
+                        (event_id, *(truth[c] for c in ROLLUP_COLUMNS)),
+                    )
+    return drifted
+
+
+def main():
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Reconcile event_sales_rollup against the base tables")
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted rollup rows")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(size=1)
+    try:
+        drifted = reconcile(pool, fix=args.fix)
+    finally:
+        pool.close()
+    print(f"{len(drifted)} event(s) {'fixed' if args.fix else 'drifted'}.")
+
+
+if __name__ == "__main__":
+    main()
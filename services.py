@@ -0,0 +1,475 @@
+"""Business operations of the event app, independent of any UI.
+
+``Services`` bundles the process-wide pieces (connection pool, events
+snapshot, venue index, query cache, auth service, booking queue, cache bus)
+and exposes one method per user action. The Streamlit pages and the JSON API in
+``api.py`` both call these methods; neither talks SQL for these flows.
+"""
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pymysql
+
+import archiver
+import booking_engine
+import bulk_io
+import cache_bus
+import cancellations
+import checkin
+import event_search
+import poster_pipeline
+import pricing
+import query_cache
+import sales_rollup
+import waitlist
+from auth_service import AuthService
+from event_snapshot import EventSnapshot, parse_date, parse_time
+from venue_index import MAX_DURATION_MINUTES, VenueIndex
+
+# Direct transactions by default, or EMS_BOOKING_MODE=queued to coalesce
+# concurrent buyers of the same event into batched inventory updates
+BOOKING_MODE = os.environ.get("EMS_BOOKING_MODE", "direct")
+ROLES = ("attendee", "organizer", "participant")
+# Share of a new event's capacity sold as VIP tickets
+VIP_SHARE = float(os.environ.get("EMS_VIP_SHARE", "0.3"))
+
+
+class ServiceError(Exception):
+    """Base class for requests the service refuses; the message is user-facing."""
+
+
+class InvalidInput(ServiceError):
+    pass
+
+
+class NotFound(ServiceError):
+    pass
+
+
+class Forbidden(ServiceError):
+    pass
+
+
+class Conflict(ServiceError):
+    pass
+
+
+class Services:
+    def __init__(self, pool, snapshot=None, cache=None, venues=None, auth=None, search=None, prices=None,
+                 booking_mode=BOOKING_MODE, bus=None):
+        self.pool = pool
+        self.snapshot = snapshot or EventSnapshot()
+        self.cache = cache or query_cache.QueryCache()
+        if venues is None:
+            venues = VenueIndex()
+            self.snapshot.add_listener(venues)
+        self.venues = venues
+        if search is None:
+            search = event_search.SearchIndex()
+            self.snapshot.add_listener(search)
+        self.search_index = search
+        self.prices = prices or pricing.PriceBook()
+        self.auth = auth or AuthService()
+        self.booking_mode = booking_mode
+        self._booking_queue = None
+        self._queue_lock = threading.Lock()
+        self._cancellation_worker = None
+        self._pricing_job = None
+        self._archive_job = None
+        self._gates = {}
+        self._gates_lock = threading.Lock()
+        # Other processes' writes reach this process's caches over the bus, and ours reach theirs
+        self.bus = bus
+        if bus is not None:
+            self.cache.attach(bus)
+            bus.subscribe("events", lambda event_ids: self.snapshot.mark_stale())
+            bus.subscribe("prices", lambda event_ids: self.prices.mark_stale())
+            bus.on_resync(self.snapshot.mark_stale)
+            bus.on_resync(self.prices.mark_stale)
+
+    @property
+    def booking_queue(self):
+        with self._queue_lock:
+            if self._booking_queue is None:
+                self._booking_queue = booking_engine.BookingQueue(self.pool)
+            return self._booking_queue
+
+    def start_workers(self):
+        """Start the background cancellation worker, pricing job, archiver and cache bus (idempotent)."""
+        with self._queue_lock:
+            if self._cancellation_worker is None:
+                self._cancellation_worker = cancellations.CancellationWorker(self.pool).start()
+            if self._pricing_job is None:
+                self._pricing_job = pricing.PricingJob(self.pool, on_change=self._prices_changed).start()
+            if self._archive_job is None:
+                self._archive_job = archiver.ArchiveJob(self.pool, on_change=self._events_changed).start()
+            if self.bus is not None:
+                self.bus.start()
+
+    def shutdown(self):
+        if self.bus is not None:
+            self.bus.stop()
+        with self._gates_lock:
+            gates, self._gates = list(self._gates.values()), {}
+        for _, gate in gates:
+            gate.stop()
+        if self._archive_job is not None:
+            self._archive_job.stop()
+        if self._pricing_job is not None:
+            self._pricing_job.stop()
+        if self._cancellation_worker is not None:
+            self._cancellation_worker.stop()
+        if self._booking_queue is not None:
+            self._booking_queue.shutdown()
+        self.auth.shutdown()
+
+    def _events_changed(self, *event_ids):
+        """After a committed write to ``events``: refresh the snapshot here and in the other processes."""
+        self.snapshot.mark_stale()
+        if self.bus is not None:
+            self.bus.publish("events", event_ids)
+
+    def _prices_changed(self):
+        self.prices.mark_stale()
+        if self.bus is not None:
+            self.bus.publish("prices", ())
+
+    # ✅ Events (reads come from the shared snapshot)
+    def load_snapshot(self):
+        self.snapshot.refresh(self.pool)
+        return self.snapshot
+
+    def list_events(self, after=None, limit=20):
+        return self.load_snapshot().page(after=after, limit=limit)
+
+    def get_event(self, event_id):
+        event = self.load_snapshot().get(event_id)
+        if event is None:
+            raise NotFound("Event not found or no longer active.")
+        return event
+
+    def search_events(self, text=None, locations=None, date_from=None, date_to=None, price_bands=None,
+                      available_only=False, after=None, limit=20):
+        """Full-text and faceted search; returns an ``event_search.SearchResult``."""
+        bands = {label for label, _, _ in event_search.PRICE_BANDS}
+        unknown = [band for band in price_bands or () if band not in bands]
+        if unknown:
+            raise InvalidInput(f"Unknown price band: {unknown[0]}")
+        if date_from and date_to and date_from > date_to:
+            raise InvalidInput("The start date must not be after the end date.")
+        self.load_snapshot()
+        return self.search_index.search(text, locations, date_from, date_to, price_bands,
+                                        available_only, after, limit)
+
+    def organizer_events(self, organizer_id):
+        return self.load_snapshot().by_organizer(organizer_id)
+
+    def _own_event(self, organizer_id, event_id):
+        event = self.get_event(event_id)
+        if event["user_id"] != organizer_id:
+            raise Forbidden("You can only change your own events.")
+        return event
+
+    def venue_conflicts(self, location, start, duration_minutes, exclude_id=None):
+        """Active events overlapping the slot, from the in-memory venue index."""
+        self.load_snapshot()
+        ids = self.venues.conflicts(location, start, duration_minutes, exclude_id)
+        return [row for row in map(self.snapshot.get, ids) if row is not None]
+
+    @staticmethod
+    def _venue_taken(cursor, location, start, end, exclude_id=None):
+        """Authoritative overlap check; FOR UPDATE holds the venue/date range until commit."""
+        cursor.execute("""
+            SELECT id FROM events
+            WHERE location = %s AND date BETWEEN %s AND %s AND status = 'active'
+              AND TIMESTAMP(date, time) < %s
+              AND TIMESTAMP(date, time) + INTERVAL duration_minutes MINUTE > %s
+              AND id <> %s
+            FOR UPDATE
+        """, (location, start.date() - timedelta(days=1), end.date(), end, start, exclude_id or 0))
+        return cursor.fetchone() is not None
+
+    def create_event(self, organizer_id, title, location, event_date, event_time, duration_minutes,
+                     description, capacity, vip_price, general_price):
+        """Create an active event; returns its id."""
+        if not (title and location and event_date and event_time and description and capacity
+                and vip_price and general_price):
+            raise InvalidInput("All fields are required!")
+        if event_date <= date.today():
+            raise InvalidInput("Cannot take this event date")
+        if not 15 <= duration_minutes <= MAX_DURATION_MINUTES:
+            raise InvalidInput(f"Duration must be between 15 and {MAX_DURATION_MINUTES} minutes.")
+        start = datetime.combine(event_date, event_time)
+        end = start + timedelta(minutes=duration_minutes)
+        if self.venue_conflicts(location, start, duration_minutes):
+            raise Conflict("This location is already booked for an overlapping time.")
+
+        vip_tickets = int(capacity * VIP_SHARE)
+        general_tickets = capacity - vip_tickets
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            conn.begin()
+            if self._venue_taken(cursor, location, start, end):
+                conn.rollback()
+                self.snapshot.mark_stale()
+                raise Conflict("This location is already booked for an overlapping time.")
+            cursor.execute("""
+                INSERT INTO events
+                (title, location, date, time, duration_minutes, description, capacity, vip_tickets, general_tickets, vip_price, general_price, user_id, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'active')
+            """, (
+                title, location, event_date, event_time, duration_minutes, description, capacity,
+                vip_tickets, general_tickets, vip_price, general_price, organizer_id,
+            ))
+            event_id = cursor.lastrowid
+            sales_rollup.record_event(cursor, event_id)
+            conn.commit()
+        self.pool.note_write(organizer_id)
+        query_cache.invalidate_event(self.cache, event_id)
+        self._events_changed(event_id)
+        return event_id
+
+    def update_event(self, organizer_id, event_id, title, location, description, capacity,
+                     poster=None, poster_name=None):
+        """Update an organizer's active event; returns warnings worth showing."""
+        event = self._own_event(organizer_id, event_id)
+        title, location = (title or "").strip(), (location or "").strip()
+        if not (title and location):
+            raise InvalidInput("Title and location are required!")
+        if not isinstance(capacity, int) or capacity < 1:
+            raise InvalidInput("Capacity must be a whole number of at least 1.")
+        moved = location != event["location"]
+        if moved:
+            start = datetime.combine(parse_date(event["date"]), parse_time(event["time"]))
+            end = start + timedelta(minutes=event["duration_minutes"])
+            if self.venue_conflicts(location, start, event["duration_minutes"], exclude_id=event_id):
+                raise Conflict("This location is already booked for an overlapping time.")
+        old_poster = event["poster_path"]
+        poster_path = old_poster
+        if poster is not None:
+            try:
+                # Stored under its content hash; thumbnails are generated in the background
+                poster_path = poster_pipeline.ingest(poster, poster_name or "")
+            except ValueError as e:
+                raise InvalidInput(str(e)) from None
+
+        warnings = []
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            conn.begin()
+            if moved and self._venue_taken(cursor, location, start, end, exclude_id=event_id):
+                conn.rollback()
+                self.snapshot.mark_stale()
+                raise Conflict("This location is already booked for an overlapping time.")
+            cursor.execute(
+                "UPDATE events SET title=%s, location=%s, description=%s, capacity=%s, poster_path=%s WHERE id=%s AND user_id=%s AND status = 'active'",
+                (title, location, description, capacity, poster_path, event_id, organizer_id)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                raise NotFound("No event updated. Either it doesn't exist, is canceled, or you don't have permission.")
+            conn.commit()
+            self.pool.note_write(organizer_id)
+            query_cache.invalidate_event(self.cache, event_id)
+            self._events_changed(event_id)
+            # Delete the old poster if it was replaced and no other event shares the same file
+            if old_poster and old_poster != poster_path:
+                # Archived events keep showing their posters in ticket history
+                cursor.execute("""
+                    SELECT EXISTS (SELECT 1 FROM events WHERE poster_path = %s)
+                        OR EXISTS (SELECT 1 FROM events_archive WHERE poster_path = %s) AS used
+                """, (old_poster, old_poster))
+                if not cursor.fetchone()["used"]:
+                    try:
+                        poster_pipeline.remove(old_poster)
+                    except OSError as e:
+                        warnings.append(f"Could not delete old poster: {e}")
+        if capacity > event["capacity"]:
+            self._promoted(waitlist.promote(self.pool, event_id))
+        return warnings
+
+    def effective_prices(self, event):
+        """Current ``(vip_price, general_price)``, from the cached price book."""
+        self.prices.refresh(self.pool)
+        return self.prices.effective(event)
+
+    def pricing_overview(self, organizer_id):
+        """Base vs. effective prices and demand pressure of the organizer's active events."""
+        self.prices.refresh(self.pool)
+        overview = []
+        for event in self.organizer_events(organizer_id):
+            current = self.prices.get(event["id"]) or {}
+            vip_price, general_price = self.prices.effective(event)
+            overview.append({
+                "title": event["title"], "date": event["date"],
+                "vip_base": event["vip_price"], "vip_price": vip_price,
+                "vip_pressure": current.get("vip_pressure", 0.0),
+                "general_base": event["general_price"], "general_price": general_price,
+                "general_pressure": current.get("general_pressure", 0.0),
+            })
+        return overview
+
+    def booking_count(self, event_id):
+        with self.pool.read_connection() as conn, conn.cursor() as cursor:
+            return sales_rollup.get(cursor, event_id)["bookings"]
+
+    def cancel_event(self, organizer_id, event_id):
+        """Cancel the event now and queue its refunds; returns the cancellation job id."""
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            conn.begin()
+            job_id = cancellations.request(cursor, event_id, organizer_id)
+            if job_id is None:
+                conn.rollback()
+                raise NotFound("No event canceled. Either it doesn't exist, is already canceled, or you don't have permission.")
+            conn.commit()
+        self.pool.note_write(organizer_id)
+        query_cache.invalidate_event(self.cache, event_id)
+        self._events_changed(event_id)
+        if event_id in self._gates:
+            self.load_snapshot()
+            self._evict_gates()
+        if self._cancellation_worker is not None:
+            self._cancellation_worker.wake()
+        return job_id
+
+    def cancellation_jobs(self, organizer_id):
+        return cancellations.jobs_for(self.pool, organizer_id)
+
+    def cancellation_job(self, organizer_id, job_id):
+        job = cancellations.get_job(self.pool, job_id, session=organizer_id)
+        if job is None or job["requested_by"] != organizer_id:
+            raise NotFound("Cancellation not found.")
+        return job
+
+    def import_events(self, organizer_id, stream, fmt):
+        report = bulk_io.import_file(self.pool, "events", stream, fmt, organizer_id=organizer_id)
+        self.pool.note_write(organizer_id)
+        self._events_changed()
+        return report
+
+    def export_events(self, organizer_id, out, fmt="csv"):
+        return bulk_io.export_rows(self.pool, "events", out, fmt, organizer_id=organizer_id)
+
+    # ✅ Tickets and registrations
+    def book(self, user_id, event_id, vip_tickets, general_tickets):
+        """Book tickets; raises ``booking_engine.BookingError`` subclasses when it can't."""
+        try:
+            if self.booking_mode == "queued":
+                booking = self.booking_queue.book(user_id, event_id, vip_tickets, general_tickets)
+            else:
+                booking = booking_engine.book_tickets(self.pool, user_id, event_id, vip_tickets, general_tickets)
+        except booking_engine.SoldOut:
+            self.snapshot.mark_stale()
+            raise
+        self.pool.note_write(user_id)
+        query_cache.invalidate_booking(self.cache, user_id)
+        # Ticket counts changed
+        self._events_changed(event_id)
+        return booking
+
+    def register(self, user_id, event_id):
+        """Take a place, or a waitlist spot when the event is full; returns ``waitlist.REGISTERED`` / ``WAITLISTED``."""
+        try:
+            outcome = waitlist.register(self.pool, user_id, event_id)
+            self.pool.note_write(user_id)
+        except waitlist.EventUnavailable as e:
+            raise NotFound(str(e)) from None
+        except waitlist.AlreadyRegistered as e:
+            raise Conflict(str(e)) from None
+        finally:
+            query_cache.invalidate_registration(self.cache, user_id, event_id)
+        if outcome == waitlist.WAITLISTED:
+            # Places freed by a promotion that never ran (a crash after the cancel) go to the queue in order
+            promotion = waitlist.promote(self.pool, event_id)
+            self._promoted(promotion)
+            if user_id in promotion.user_ids:
+                outcome = waitlist.REGISTERED
+        return outcome
+
+    def cancel_registration(self, user_id, event_id):
+        promotion = waitlist.cancel(self.pool, user_id, event_id)
+        if promotion is not None:
+            self.pool.note_write(user_id)
+        query_cache.invalidate_registration(self.cache, user_id, event_id)
+        if promotion is None:
+            raise NotFound("You are not registered or waitlisted for this event.")
+        self._promoted(promotion)
+
+    def _promoted(self, promotion):
+        self.pool.note_write(*promotion.user_ids)
+        for promoted_user in promotion.user_ids:
+            query_cache.invalidate_registration(self.cache, promoted_user, promotion.event_id)
+
+    def my_waitlist(self, user_id):
+        return waitlist.user_waitlist(self.pool, user_id)
+
+    def is_registered(self, user_id, event_id):
+        return any(reg["event_id"] == event_id for reg in self.my_registrations(user_id))
+
+    def my_bookings(self, user_id, before=None, limit=query_cache.WALLET_PAGE_SIZE):
+        """One ticket wallet page: ``(rows, next_before)``."""
+        return query_cache.user_bookings(self.pool, self.cache, user_id, before, limit)
+
+    def my_registrations(self, user_id):
+        return query_cache.user_registrations(self.pool, self.cache, user_id)
+
+    # ✅ Door check-in
+    def _evict_gates(self):
+        """Stop the gates of events that left the snapshot (canceled or archived)."""
+        with self._gates_lock:
+            event_ids = list(self._gates)
+        gone = [event_id for event_id in event_ids if self.snapshot.get(event_id) is None]
+        with self._gates_lock:
+            evicted = [self._gates.pop(event_id) for event_id in gone if event_id in self._gates]
+        for _, gate in evicted:
+            gate.stop()
+
+    def checkin_gate(self, organizer_id, event_id):
+        """This process's check-in gate for an organizer's event, loaded on first use."""
+        self._evict_gates()
+        with self._gates_lock:
+            owner, gate = self._gates.get(event_id, (None, None))
+        if gate is None:
+            # Ownership is checked once; scans after that keep working without MySQL
+            owner = self._own_event(organizer_id, event_id)["user_id"]
+            loaded = checkin.Gate(self.pool, event_id).load()
+            with self._gates_lock:
+                if event_id not in self._gates:
+                    self._gates[event_id] = (owner, loaded.start())
+                owner, gate = self._gates[event_id]
+            if gate is not loaded:
+                # Another request loaded this event's gate first
+                loaded.stop()
+        if owner != organizer_id:
+            raise Forbidden("You can only check in tickets for your own events.")
+        return gate
+
+    def check_in(self, organizer_id, event_id, code):
+        """Admit or refuse one ticket code at the door; returns a ``checkin.ScanResult``."""
+        if not (code or "").strip():
+            raise InvalidInput("Scan or enter a ticket code.")
+        return self.checkin_gate(organizer_id, event_id).scan(code)
+
+    # ✅ Accounts
+    def sign_up(self, name, email, password, role):
+        """Create an account; raises ``auth_service.AuthThrottled`` when hashing is saturated."""
+        role = role.lower()
+        if not (name and email and password):
+            raise InvalidInput("All fields are required!")
+        if role not in ROLES:
+            raise InvalidInput(f"Role must be one of: {', '.join(ROLES)}.")
+        hashed_pw = self.auth.hash_password(password)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s)",
+                    (name, email, hashed_pw, role)
+                )
+                return cursor.lastrowid
+        except pymysql.err.IntegrityError:
+            raise Conflict("Email already exists!") from None
+
+    def login(self, email, password):
+        """The user row for valid credentials, else ``None``."""
+        if not (email and password):
+            raise InvalidInput("Please enter both email and password!")
+        return self.auth.login(self.pool, email, password)
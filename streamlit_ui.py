@@ -1,9 +1,28 @@
 import streamlit as st
-import pymysql
-import bcrypt
+import pandas as pd
 from datetime import datetime, time, date, timedelta
-from collections import defaultdict
 import calendar
+import collections
+import io
+import os
+
+from db_pool import ConnectionPool
+import cache_bus
+import db_router
+import analytics
+import instrumentation
+import booking_engine
+import migrate
+import poster_pipeline
+import query_cache
+import tickets
+from event_snapshot import EventSnapshot
+from services import Services, ServiceError, VIP_SHARE
+import waitlist
+from auth_service import AuthService, AuthThrottled
+from calendar_service import CalendarService
+from event_search import SearchIndex, PRICE_BANDS
+from venue_index import VenueIndex, MAX_DURATION_MINUTES
 
 # Apply Custom Styling
 st.markdown(
@@ -21,15 +40,158 @@ st.markdown(
     unsafe_allow_html=True, 
 )
 
-def get_db_connection(): 
-    return pymysql.connect( 
-        host="localhost", 
-        user="root", 
-        password="akshay_babu_007",
-        database="event_management",
-        autocommit=True, 
-        cursorclass=pymysql.cursors.DictCursor 
+# ✅ One connection pool per server process, shared by every session
+@st.cache_resource
+def get_pool():
+    # Instrumented: every query and checkout is recorded for the Performance page (EMS_INSTRUMENT=0 to turn off)
+    # Reads of the history pages go to replicas when EMS_DB_REPLICAS is set
+    pool = db_router.from_env(instrumentation.InstrumentedPool if instrumentation.ENABLED else ConnectionPool)
+    # Bring the schema up to date once per process (EMS_AUTO_MIGRATE=0 to run `python migrate.py` by hand)
+    if os.environ.get("EMS_AUTO_MIGRATE", "1") == "1":
+        migrate.apply_pending(pool)
+    return pool
+
+# ✅ Query results cache, shared by every session and invalidated per key on writes
+@st.cache_resource
+def get_query_cache():
+    return query_cache.QueryCache()
+
+# ✅ Active events snapshot: one incremental refresh query serves every session
+@st.cache_resource
+def get_event_snapshot():
+    return EventSnapshot()
+
+# ✅ Per-venue interval index of active events, kept in sync by the snapshot
+@st.cache_resource
+def get_venue_index():
+    venues = VenueIndex()
+    get_event_snapshot().add_listener(venues)
+    return venues
+
+# ✅ Full-text and facet index of active events, kept in sync by the snapshot
+@st.cache_resource
+def get_search_index():
+    search = SearchIndex()
+    get_event_snapshot().add_listener(search)
+    return search
+
+# ✅ Recent sampled profiles of script runs (Performance page toggle)
+@st.cache_resource
+def get_profiles():
+    return collections.deque(maxlen=10)
+
+# ✅ Organizer calendar months, rendered once per (month, year, snapshot version)
+@st.cache_resource
+def get_calendar_service():
+    return CalendarService()
+
+# ✅ bcrypt hashing in a bounded process pool (cost: EMS_BCRYPT_ROUNDS)
+@st.cache_resource
+def get_auth_service():
+    return AuthService()
+
+# ✅ Business operations shared with the JSON API (api.py); pages only render
+@st.cache_resource
+def get_services():
+    services = Services(
+        get_pool(), snapshot=get_event_snapshot(), cache=get_query_cache(),
+        venues=get_venue_index(), auth=get_auth_service(), search=get_search_index(),
+        # With several server processes, EMS_CACHE_BUS carries each one's invalidations to the others
+        bus=cache_bus.from_env(get_pool()),
     )
+    # Refunds for canceled events and dynamic repricing run on this process's background workers
+    services.start_workers()
+    return services
+
+def load_event_snapshot():
+    return get_services().load_snapshot()
+
+# ✅ Poster bytes: stored posters are content-addressed and never change, so they are cached for the process lifetime
+@st.cache_data(max_entries=500, show_spinner=False)
+def load_poster(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def show_poster(poster_path, variant="thumb", **image_kwargs):
+    st.image(load_poster(poster_pipeline.variant_path(poster_path, variant)), **image_kwargs)
+
+# ✅ Paginated event lists: only the pages the user has loaded are fetched and rendered
+PAGE_SIZES = [5, 10, 20, 50]
+
+def load_event_pages(key, snapshot):
+    """Rows for the pages loaded so far in this session, and whether more remain"""
+    page_size = st.selectbox("Events per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    if st.session_state.get(f"{key}_loaded_size") != page_size:
+        st.session_state[f"{key}_loaded_size"] = page_size
+        st.session_state[f"{key}_pages"] = 1
+
+    rows, cursor = [], None
+    for _ in range(st.session_state[f"{key}_pages"]):
+        page, cursor = snapshot.page(after=cursor, limit=page_size)
+        rows.extend(page)
+        if cursor is None:
+            break
+    return rows, cursor is not None
+
+def load_more_button(key):
+    if st.button("⬇️ Load more", key=f"{key}_load_more"):
+        st.session_state[f"{key}_pages"] += 1
+        st.rerun()
+
+# ✅ Event picker backed by the search index: text query, facets and paged results
+def search_event_picker(key):
+    """Search form plus result selector; returns the chosen event row or ``None``"""
+    text = st.text_input("🔎 Search events", key=f"{key}_q", placeholder="Title or description")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        date_range = st.date_input("Dates", value=(), key=f"{key}_dates")
+    with col3:
+        available_only = st.checkbox("Tickets left", key=f"{key}_available")
+    filters = dict(
+        text=text,
+        date_from=date_range[0] if len(date_range) > 0 else None,
+        date_to=date_range[1] if len(date_range) > 1 else None,
+        locations=st.session_state.get(f"{key}_locations"),
+        price_bands=st.session_state.get(f"{key}_bands"),
+        available_only=available_only,
+    )
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_pages"] = 1
+
+    services = get_services()
+    rows, cursor = [], None
+    for _ in range(st.session_state[f"{key}_pages"]):
+        result = services.search_events(after=cursor, limit=PAGE_SIZES[2], **filters)
+        rows.extend(result.rows)
+        cursor = result.next_cursor
+        if cursor is None:
+            break
+
+    with col2:
+        location_counts = result.facets["location"]
+        st.multiselect(
+            "Location", sorted(set(location_counts) | set(filters["locations"] or ())), key=f"{key}_locations",
+            format_func=lambda location: f"{location} ({location_counts.get(location, 0)})",
+        )
+    band_counts = result.facets["price"]
+    st.multiselect(
+        "Price (cheapest ticket)", [label for label, _, _ in PRICE_BANDS], key=f"{key}_bands",
+        format_func=lambda band: f"{band} ({band_counts[band]})",
+    )
+
+    if not rows:
+        st.info("📢 No events match your search.")
+        return None
+    st.caption(f"{result.total} matching event(s)")
+    by_id = {row['id']: row for row in rows}
+    selected = st.selectbox(
+        "Select Event", list(by_id), key=f"{key}_selected",
+        format_func=lambda event_id: f"{by_id[event_id]['title']} | 📍 {by_id[event_id]['location']} | 📅 {by_id[event_id]['date']} {by_id[event_id]['time'].strftime('%I:%M %p')}",
+    )
+    if cursor is not None:
+        load_more_button(key)
+    return by_id[selected]
 
 # ✅ Initialize session state
 if "logged_in" not in st.session_state: 
@@ -40,29 +202,45 @@ if "logged_in" not in st.session_state:
 # ✅ Sidebar Navigation
 if st.session_state.logged_in:
     if st.session_state.role == "organizer":
-        menu = st.sidebar.radio("Organizer Panel", ["Home", "Create Event", "View Events", "Update Event", "Cancel Event", "Logout"], key="organizer_menu")
+        menu = st.sidebar.radio("Organizer Panel", ["Home", "Create Event", "View Events", "Update Event", "Cancel Event", "Check-in", "Insights", "Logout"], key="organizer_menu")
     elif st.session_state.role == "attendee":
         menu = st.sidebar.radio("Attendee Panel", ["Home", "View Events", "Buy Ticket", "View My Tickets", "Logout"], key="user_menu")
     elif st.session_state.role == "participant":
         menu = st.sidebar.radio("Participant Panel", ["Home", "View Events", "Register for Event", "View My Registrations", "Logout"], key="participant_menu")
+    elif st.session_state.role == "admin":
+        menu = st.sidebar.radio("Admin Panel", ["Home", "View Events", "Performance", "Logout"], key="admin_menu")
     else:
         st.error("⚠️ Invalid role detected. Please log in again.")
         menu = "Logout"
 else:
     menu = st.sidebar.radio("Navigation", ["Home", "Register", "Login"], key="nav_menu")
 
+# ✅ Instrumentation: this rerun is recorded under its page (ended at the bottom of the script)
+instrumentation.REGISTRY.begin(menu)
+# A profiler left running by a rerun that was cut short is stopped here
+if st.session_state.get("run_profiler") is not None:
+    st.session_state.run_profiler.stop()
+st.session_state.run_profiler = instrumentation.SamplingProfiler().start() if st.session_state.get("profile_runs") else None
+
+# ✅ Connection pool metrics (used to size EMS_DB_POOL_SIZE)
+if st.session_state.role in ("organizer", "admin"):
+    with st.sidebar.expander("🔌 Connection Pool"):
+        pool_stats = get_pool().stats()
+        st.write(f"Checkouts: {pool_stats['checkouts']}")
+        st.write(f"Connections created: {pool_stats['connections_created']} (open: {pool_stats['opened']}/{pool_stats['size']}, idle: {pool_stats['idle']})")
+        st.write(f"Wait time: avg {pool_stats['avg_wait_ms']:.1f} ms, max {pool_stats['max_wait_ms']:.1f} ms")
+        st.write(f"Peak in use: {pool_stats['peak_in_use']} | Timeouts: {pool_stats['timeouts']} | Failed pings: {pool_stats['failed_pings']}")
+
 # ✅ Home Page (Show active events with posters)
 if menu == "Home":
     st.subheader("🎉 Upcoming Events")
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT title, location, date, time, description, poster_path FROM events WHERE status = 'active'")
-            events = cursor.fetchall()
+        snapshot = load_event_snapshot()
 
-        if not events:
+        if not len(snapshot):
             st.info("📢 No upcoming events at the moment.")
         else:
+            events, has_more = load_event_pages("home", snapshot)
             for event in events:
                 event_date = event['date'].strftime("%Y-%m-%d") if isinstance(event['date'], datetime) else event['date']
                 event_time = event['time'].strftime("%I:%M %p") if isinstance(event['time'], time) else event['time']
@@ -73,7 +251,7 @@ if menu == "Home":
                 with col1:
                     if event['poster_path']:
                         try:
-                            st.image(event['poster_path'], use_container_width=True)
+                            show_poster(event['poster_path'], use_container_width=True)
                         except FileNotFoundError:
                             st.warning("⚠️ Poster not found.")
                     else:
@@ -91,10 +269,10 @@ if menu == "Home":
                         unsafe_allow_html=True,
                     )
                 st.markdown("<hr>", unsafe_allow_html=True)  # Separator between events
+            if has_more:
+                load_more_button("home")
     except Exception as e:
         st.error(f"⚠️ Error fetching events: {str(e)}")
-    finally:
-        conn.close()
 
 # ✅ User Login
 if menu == "Login": 
@@ -105,23 +283,20 @@ if menu == "Login":
     if st.button("Login"): 
         if email and password: 
             try:
-                conn = get_db_connection() 
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT id, password, role FROM users WHERE email = %s", (email,)) 
-                    user = cursor.fetchone() 
-
-                    if user and bcrypt.checkpw(password.encode(), user['password'].encode()): 
-                        st.session_state.logged_in = True 
-                        st.session_state.user_id = user["id"] 
-                        st.session_state.role = user["role"] 
-                        st.success("✅ Login successful! Redirecting...")
-                        st.rerun() 
-                    else:
-                        st.error("❌ Invalid credentials!")
+                user = get_services().login(email, password)
+
+                if user: 
+                    st.session_state.logged_in = True 
+                    st.session_state.user_id = user["id"] 
+                    st.session_state.role = user["role"] 
+                    st.success("✅ Login successful! Redirecting...")
+                    st.rerun() 
+                else:
+                    st.error("❌ Invalid credentials!")
+            except AuthThrottled as e:
+                st.warning(f"⏳ {str(e)}")
             except Exception as e: 
                 st.error(f"⚠️ Error: {str(e)}") 
-            finally: 
-                conn.close()
         else:
             st.error("❌ Please enter both email and password!")
 
@@ -135,21 +310,15 @@ if menu == "Register":
 
     if st.button("Register"):
         if name and email and password:
-            hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
             try:
-                conn = get_db_connection()
-                with conn.cursor() as cursor:
-                    cursor.execute(
-                        "INSERT INTO users (name, email, password, role) VALUES (%s, %s, %s, %s)",
-                        (name, email, hashed_pw, role.lower())
-                    )
+                get_services().sign_up(name, email, password, role)
                 st.success("✅ Registration successful! Please login.")
-            except pymysql.err.IntegrityError:
-                st.error("❌ Email already exists!")
+            except ServiceError as e:
+                st.error(f"❌ {str(e)}")
+            except AuthThrottled as e:
+                st.warning(f"⏳ {str(e)}")
             except Exception as e:
                 st.error(f"⚠️ Error: {str(e)}")
-            finally:
-                conn.close()
         else:
             st.error("❌ All fields are required!")
 
@@ -168,460 +337,282 @@ if menu == "Create Event":
         ]
         location = st.selectbox("Select Location", predefined_locations)
 
-        event_date = st.date_input("Event Date")
-        event_time = st.time_input("Event Time")
+        if "create_event_date" not in st.session_state:
+            st.session_state.create_event_date = date.today() + timedelta(days=1)
+            st.session_state.create_event_time = time(10, 0)
+        event_date = st.date_input("Event Date", key="create_event_date")
+        event_time = st.time_input("Event Time", key="create_event_time")
+        duration = st.number_input("Duration (minutes)", min_value=15, max_value=MAX_DURATION_MINUTES, value=60, step=15)
         description = st.text_area("Description")
         capacity = st.number_input("Total Capacity", min_value=1, step=1)
 
         vip_price = st.number_input("VIP Ticket Price", min_value=0.0, step=0.01)
         general_price = st.number_input("General Ticket Price", min_value=0.0, step=0.01)
 
-        vip_tickets = int(capacity * 0.3)
+        vip_tickets = int(capacity * VIP_SHARE)
         general_tickets = capacity - vip_tickets
 
         st.write(f"🎟️ VIP Tickets: {vip_tickets}, General Tickets: {general_tickets}")
 
+        # 🔍 Venue availability from the in-memory interval index
+        load_event_snapshot()
+        venues = get_venue_index()
+        desired_start = datetime.combine(event_date, event_time)
+        earliest_start = datetime.combine(date.today() + timedelta(days=1), time(0))
+        clashes = get_services().venue_conflicts(location, desired_start, duration)
+        if clashes:
+            clash_titles = ", ".join(event['title'] for event in clashes)
+            st.warning(f"⚠️ {location} is already booked at that time ({clash_titles}).")
+            suggestion = venues.nearest_free_slot(location, desired_start, duration, earliest=earliest_start)
+            if suggestion:
+                st.info(f"💡 Nearest free slot: {suggestion.strftime('%a %d %b %Y, %I:%M %p')}")
+                st.button(
+                    "Use suggested slot",
+                    on_click=lambda: st.session_state.update(create_event_date=suggestion.date(), create_event_time=suggestion.time()),
+                )
+
+        with st.expander(f"📆 Free slots at {location} this week"):
+            week_start = max(datetime.combine(event_date - timedelta(days=event_date.weekday()), time(0)), earliest_start)
+            week_end = datetime.combine(event_date - timedelta(days=event_date.weekday()) + timedelta(days=7), time(0))
+            free = venues.free_slots(location, week_start, week_end, duration)
+            if free:
+                st.markdown("<br>".join(
+                    f"{start.strftime('%a %d %b')}: {start.strftime('%I:%M %p')} – {end.strftime('%I:%M %p')}" for start, end in free
+                ), unsafe_allow_html=True)
+            else:
+                st.write("No free slots of that length this week.")
+
         if st.button("Create Event"):
             user_id = st.session_state.get("user_id")
-            current_date = date.today()
 
             if not user_id:
                 st.error("⚠️ User ID not found. Please log in again.")
-            elif title and location and event_date and event_time and description and capacity and vip_price and general_price:
-                if event_date <= current_date:
-                    st.error("❌ Cannot take this event date")
-                else:
-                    try:
-                        conn = get_db_connection()
-                        with conn.cursor() as cursor:
-                            # 🔍 Check for location conflict regardless of user
-                            cursor.execute("""
-                                SELECT COUNT(*) FROM events
-                                WHERE location = %s AND date = %s AND time = %s AND status = 'active'
-                            """, (location, event_date, event_time))
-                            conflict_count = cursor.fetchone()[0]
-
-                            if conflict_count > 0:
-                                st.error("❌ This location is already booked for the selected date and time.")
-                            else:
-                                cursor.execute("""
-                                    INSERT INTO events 
-                                    (title, location, date, time, description, capacity, vip_tickets, general_tickets, vip_price, general_price, user_id, status)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'active')
-                                """, (
-                                    title, location, event_date, event_time, description, capacity,
-                                    vip_tickets, general_tickets, vip_price, general_price, user_id
-                                ))
-                                conn.commit()
-                                st.success("✅ Event created successfully!")
-
-                    except Exception as e:
-                        st.error(f"⚠️ Error creating event: {str(e)}")
-                    finally:
-                        conn.close()
             else:
-                st.error("❌ All fields are required!")
+                try:
+                    get_services().create_event(
+                        user_id, title, location, event_date, event_time, duration,
+                        description, capacity, vip_price, general_price,
+                    )
+                    st.success("✅ Event created successfully!")
+                except ServiceError as e:
+                    st.error(f"❌ {str(e)}")
+                except Exception as e:
+                    st.error(f"⚠️ Error creating event: {str(e)}")
 
-def get_month_dates(year, month):
-    """Returns all dates in a given month"""
-    num_days = calendar.monthrange(year, month)[1]
-    return [date(year, month, day) for day in range(1, num_days + 1)]
+        # 📥 Bulk import: a whole programme from CSV / JSON, validated chunk by chunk
+        with st.expander("📥 Import events from a file"):
+            st.caption(
+                "Columns: title, location, date (YYYY-MM-DD), time (HH:MM), description, capacity, "
+                "vip_price, general_price; optional duration_minutes, vip_tickets, general_tickets."
+            )
+            upload = st.file_uploader("CSV or JSON file", type=["csv", "json", "jsonl"])
+            if upload is not None and st.button("Import Events"):
+                fmt = "csv" if upload.name.lower().endswith(".csv") else "json"
+                try:
+                    stream = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+                    report = get_services().import_events(st.session_state.user_id, stream, fmt)
+                    if report.inserted:
+                        st.success(f"✅ Imported {report.inserted} event(s).")
+                    if report.errors:
+                        st.warning(f"⚠️ {len(report.errors)} row(s) were rejected.")
+                        st.dataframe(pd.DataFrame(report.errors, columns=["Line", "Problem"]), hide_index=True)
+                except (ValueError, UnicodeDecodeError) as e:
+                    st.error(f"⚠️ Could not read the file: {str(e)}")
+                except Exception as e:
+                    st.error(f"⚠️ Error importing events: {str(e)}")
 
 # ✅ View Events (Only show active events)
 if menu == "View Events":
     st.subheader("🎟 Available Events")
 
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM events WHERE status = 'active'")
-            events = cursor.fetchall()
-
-            if not events:
-                st.info("No upcoming events found.")
-            elif st.session_state.role == "organizer":
-                st.subheader("📅 Monthly Calendar View")
-
-                # Month selector
-                today = datetime.today()
-                current_month = today.month
-                current_year = today.year
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    selected_month = st.selectbox("Select Month", list(calendar.month_name)[1:], index=current_month - 1)
-                with col2:
-                    selected_year = st.selectbox("Select Year", list(range(current_year, current_year + 2)))
-
-                month_index = list(calendar.month_name).index(selected_month)
-                month_dates = get_month_dates(selected_year, month_index)
-
-                # Group events by date
-                calendar_map = defaultdict(list)
-                for event in events:
-                    event_date = event['date']
-                    if isinstance(event_date, str):
-                        event_date = datetime.strptime(event_date, "%Y-%m-%d").date()
-                    elif isinstance(event_date, datetime):
-                        event_date = event_date.date()
-
-                    event_time = event['time']
-                    if isinstance(event_time, str):
-                        try:
-                            event['time'] = datetime.strptime(event_time, "%H:%M:%S").time()
-                        except:
-                            event['time'] = datetime.strptime(event_time, "%H:%M").time()
-                    elif isinstance(event_time, datetime):
-                        event['time'] = event_time.time()
-
-                    calendar_map[event_date].append(event)
-
-                # Show in calendar grid (7 days per row)
-                weeks = [month_dates[i:i + 7] for i in range(0, len(month_dates), 7)]
-
-                for week in weeks:
-                    cols = st.columns(7)
-                    for i, day in enumerate(week):
-                        with cols[i]:
-                            st.markdown(f"### {day.strftime('%d %a')}")
-                            if calendar_map.get(day):
-                                for ev in sorted(calendar_map[day], key=lambda x: x['time']):
-                                    ev_time = ev['time'].strftime("%I:%M %p") if isinstance(ev['time'], time) else str(ev['time'])
-                                    st.markdown(
-                                        f"""
-                                        <div style="background-color: #e8f0fe; border-left: 5px solid #4285f4; padding: 8px; margin-bottom: 10px; border-radius: 6px; color: #0b5394;">
-                                            <strong>{ev['title']}</strong><br>
-                                            🕒 {ev_time}<br>
-                                            📍 {ev['location']}<br>
-                                            <span style="font-size: small;">{ev['description']}</span>
-                                        </div>
-                                        """,
-                                        unsafe_allow_html=True
-                                    )
-                            else:
-                                st.markdown("<span style='color: gray;'>No events</span>", unsafe_allow_html=True)
+        snapshot = load_event_snapshot()
+        if not len(snapshot):
+            st.info("No upcoming events found.")
+        elif st.session_state.role == "organizer":
+            st.subheader("📅 Monthly Calendar View")
+
+            # Month selector
+            today = datetime.today()
+            current_month = today.month
+            current_year = today.year
+
+            col1, col2 = st.columns(2)
+            with col1:
+                selected_month = st.selectbox("Select Month", list(calendar.month_name)[1:], index=current_month - 1)
+            with col2:
+                selected_year = st.selectbox("Select Year", list(range(current_year, current_year + 2)))
+
+            month_index = list(calendar.month_name).index(selected_month)
+
+            # One HTML payload per week, built from this month's events only and cached across reruns
+            for week_html in get_calendar_service().month_weeks(snapshot, selected_year, month_index):
+                st.markdown(week_html, unsafe_allow_html=True)
+
+            # 📤 Export this organizer's events (built on demand; `python bulk_io.py export` streams to disk)
+            if st.button("Prepare CSV export"):
+                export_file = io.StringIO()
+                get_services().export_events(st.session_state.user_id, export_file)
+                st.download_button("Download events.csv", export_file.getvalue(), file_name="events.csv", mime="text/csv")
 
-            else:
-                st.subheader("📋 Event List for Attendees")
-                for event in events:
-                    event_date = event['date']
-                    if isinstance(event_date, str):
-                        event_date = datetime.strptime(event_date, "%Y-%m-%d").date()
-                    elif isinstance(event_date, datetime):
-                        event_date = event_date.date()
-
-                    event_time = event['time']
-                    if isinstance(event_time, str):
-                        try:
-                            event_time = datetime.strptime(event_time, "%H:%M:%S").time()
-                        except:
-                            event_time = datetime.strptime(event_time, "%H:%M").time()
-                    elif isinstance(event_time, datetime):
-                        event_time = event_time.time()
-
-                    st.markdown(
-                        f"""
-                        <div style="background-color: #e8f0fe; border-left: 5px solid #4285f4; padding: 8px; margin-bottom: 10px; border-radius: 6px; color: #0b5394;">
-                            <strong>{event['title']}</strong><br>
-                            🕒 {event_time}<br>
-                            📍 {event['location']}<br>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+        else:
+            st.subheader("📋 Event List for Attendees")
+            events, has_more = load_event_pages("event_list", snapshot)
+            # One markdown payload for the whole list instead of one per event
+            st.markdown(
+                "".join(
+                    f"""
+                    <div style="background-color: #e8f0fe; border-left: 5px solid #4285f4; padding: 8px; margin-bottom: 10px; border-radius: 6px; color: #0b5394;">
+                        <strong>{event['title']}</strong><br>
+                        🕒 {event['time']}<br>
+                        📍 {event['location']}<br>
+                    </div>
+                    """
+                    for event in events
+                ),
+                unsafe_allow_html=True
+            )
+            if has_more:
+                load_more_button("event_list")
 
     except Exception as e:
         st.error(f"⚠️ Error fetching events: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 # ✅ Register for Event (Only for Participants, only active events)
 if menu == "Register for Event" and st.session_state.role == "participant":
     st.subheader("📋 Register for Event")
     
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM events WHERE status = 'active'")
-        events = cursor.fetchall()
-    conn.close()
-
-    if not events:
-        st.info("📢 No active events available.")
-    else:
-        event_options = {event['title']: event for event in events}
-        selected_event = st.selectbox("Select Event", list(event_options.keys()))
-        event = event_options[selected_event]
+    event = search_event_picker("register_search")
 
+    if event is not None:
         # Check if already registered
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT COUNT(*) as count FROM registrations WHERE user_id = %s AND event_id = %s",
-                (st.session_state.user_id, event['id'])
-            )
-            already_registered = cursor.fetchone()['count'] > 0
-        conn.close()
-
-        if already_registered:
+        if get_services().is_registered(st.session_state.user_id, event['id']):
             st.warning("⚠️ You are already registered for this event.")
         else:
             st.write(f"Event: {event['title']} | 📍 {event['location']} | 📅 {event['date']} | 🕒 {event['time']}")
             if st.button("Register"):
                 try:
-                    conn = get_db_connection()
-                    with conn.cursor() as cursor:
-                        cursor.execute(
-                            "INSERT INTO registrations (user_id, event_id) VALUES (%s, %s)",
-                            (st.session_state.user_id, event['id'])
-                        )
-                        conn.commit()
+                    outcome = get_services().register(st.session_state.user_id, event['id'])
+                    if outcome == waitlist.WAITLISTED:
+                        st.info(f"⏳ {event['title']} is full. You're on the waitlist and will be registered automatically when a place frees up.")
+                    else:
                         st.success(f"✅ Successfully registered for {event['title']}!")
-                except pymysql.err.IntegrityError:
-                    st.error("⚠️ You are already registered for this event.")
+                except ServiceError as e:
+                    st.error(f"⚠️ {str(e)}")
                 except Exception as e:
                     st.error(f"⚠️ Error registering for event: {str(e)}")
-                finally:
-                    conn.close()
-
-st.cache_data.clear()
-st.experimental_rerun()
-
-# ✅ View Events (Only show active events)
-if menu == "View Events":
-    st.subheader("🎟 Available Events")
-
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM events WHERE status = 'active'")
-            events = cursor.fetchall()
-
-            if not events:
-                st.info("No upcoming events found.")
-            elif st.session_state.role == "organizer":
-                st.subheader("📅 Monthly Calendar View")
-
-                today = datetime.today()
-                current_month = today.month
-                current_year = today.year
-
-                col1, col2 = st.columns(2)
-                with col1:
-                    selected_month = st.selectbox("Select Month", list(calendar.month_name)[1:], index=current_month - 1)
-                with col2:
-                    selected_year = st.selectbox("Select Year", list(range(current_year, current_year + 2)))
-
-                month_index = list(calendar.month_name).index(selected_month)
-                month_dates = get_month_dates(selected_year, month_index)
-
-                calendar_map = defaultdict(list)
-                for event in events:
-                    event_date = event['date']
-                    if isinstance(event_date, str):
-                        event_date = datetime.strptime(event_date, "%Y-%m-%d").date()
-                    elif isinstance(event_date, datetime):
-                        event_date = event_date.date()
-
-                    event_time = event['time']
-                    if isinstance(event_time, str):
-                        try:
-                            event['time'] = datetime.strptime(event_time, "%H:%M:%S").time()
-                        except:
-                            event['time'] = datetime.strptime(event_time, "%H:%M").time()
-                    elif isinstance(event_time, datetime):
-                        event['time'] = event_time.time()
-
-                    # ❌ Remove description so it's not used anywhere
-                    event.pop('description', None)
-
-                    calendar_map[event_date].append(event)
-
-                weeks = [month_dates[i:i + 7] for i in range(0, len(month_dates), 7)]
-
-                for week in weeks:
-                    cols = st.columns(7)
-                    for i, day in enumerate(week):
-                        with cols[i]:
-                            st.markdown(f"### {day.strftime('%d %a')}")
-                            if calendar_map.get(day):
-                                for ev in sorted(calendar_map[day], key=lambda x: x['time']):
-                                    ev_time = ev['time'].strftime("%I:%M %p") if isinstance(ev['time'], time) else str(ev['time'])
-                                    st.markdown(
-                                        f"""
-                                        <div style="background-color: #e8f0fe; 
-                                                    border-left: 5px solid #4285f4; 
-                                                    padding: 12px; 
-                                                    margin-bottom: 12px; 
-                                                    border-radius: 10px; 
-                                                    color: #0b5394;
-                                                    width: 95%;
-                                                    max-width: 220px;
-                                                    min-width: 150px;
-                                                    font-size: 14px;">
-                                            <strong style="font-size: 16px;">{ev['title']}</strong><br>
-                                            🕒 {ev_time}<br>
-                                            📍 {ev['location']}
-                                        </div>
-                                        """,
-                                        unsafe_allow_html=True
-                                    )
-                            else:
-                                st.markdown("<span style='color: gray;'>No events</span>", unsafe_allow_html=True)
-
-            else:
-                st.subheader("📋 Event List for Attendees")
-                for event in events:
-                    event_date = event['date']
-                    if isinstance(event_date, str):
-                        event_date = datetime.strptime(event_date, "%Y-%m-%d").date()
-                    elif isinstance(event_date, datetime):
-                        event_date = event_date.date()
-
-                    event_time = event['time']
-                    if isinstance(event_time, str):
-                        try:
-                            event_time = datetime.strptime(event_time, "%H:%M:%S").time()
-                        except:
-                            event_time = datetime.strptime(event_time, "%H:%M").time()
-                    elif isinstance(event_time, datetime):
-                        event_time = event_time.time()
-
-                    # ❌ Remove description
-                    event.pop('description', None)
-
-                    st.markdown(
-                        f"""
-                        <div style="background-color: #e8f0fe; 
-                                    border-left: 5px solid #4285f4; 
-                                    padding: 10px; 
-                                    margin-bottom: 12px; 
-                                    border-radius: 8px; 
-                                    color: #0b5394;
-                                    width: 100%;
-                                    font-size: 14px;">
-                            <strong style="font-size: 16px;">{event['title']}</strong><br>
-                            🕒 {event_time}<br>
-                            📍 {event['location']}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-
-    except Exception as e:
-        st.error(f"⚠️ Error fetching events: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 # ✅ View My Registrations (Only for Participants)
 if menu == "View My Registrations" and st.session_state.role == "participant":
     st.subheader("📋 My Registered Events")
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT r.*, e.title, e.location, e.date, e.time, e.status 
-                FROM registrations r 
-                JOIN events e ON r.event_id = e.id 
-                WHERE r.user_id = %s
-            """, (st.session_state.user_id,))
-            registrations = cursor.fetchall()
-
-            if not registrations:
-                st.info("📢 You have not registered for any events yet.")
-            else:
-                for reg in registrations:
-                    event_date = reg['date'].strftime("%Y-%m-%d") if isinstance(reg['date'], datetime) else reg['date']
-                    event_time = reg['time'].strftime("%I:%M %p") if isinstance(reg['time'], time) else reg['time']
-                    status_note = "(Event Canceled)" if reg['status'] == 'canceled' else ""
-                    
-                    st.markdown(
-                        f"""
-                        <div style="background-color: white; padding: 15px; border-radius: 10px; box-shadow: 2px 2px 10px gray; margin-bottom: 10px; color: black;">
-                            <h2 style="color: black;">{reg['title']} {status_note}</h2>
-                            <p style="color: black;">📍 {reg['location']} | 📅 {event_date} | 🕒 {event_time}</p>
-                            <p style="color: black;">📋 Registered on: {reg['registration_date'].strftime('%Y-%m-%d %H:%M:%S')}</p>
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
+        registrations = get_services().my_registrations(st.session_state.user_id)
+        waitlisted = get_services().my_waitlist(st.session_state.user_id)
+        if not registrations and not waitlisted:
+            st.info("📢 You have not registered for any events yet.")
+        else:
+            for reg in registrations:
+                event_date = reg['date'].strftime("%Y-%m-%d") if isinstance(reg['date'], datetime) else reg['date']
+                event_time = reg['time'].strftime("%I:%M %p") if isinstance(reg['time'], time) else reg['time']
+                status_note = {"canceled": "(Event Canceled)", "finished": "(Past Event)"}.get(reg['status'], "")
+                
+                st.markdown(
+                    f"""
+                    <div style="background-color: white; padding: 15px; border-radius: 10px; box-shadow: 2px 2px 10px gray; margin-bottom: 10px; color: black;">
+                        <h2 style="color: black;">{reg['title']} {status_note}</h2>
+                        <p style="color: black;">📍 {reg['location']} | 📅 {event_date} | 🕒 {event_time}</p>
+                        <p style="color: black;">📋 Registered on: {reg['registration_date'].strftime('%Y-%m-%d %H:%M:%S')}</p>
+                        <p style="color: black;">🔐 Entry code: <code>{tickets.registration_code(reg['event_id'], reg['id'])}</code></p>
+                    </div>
+                    """,
+                    unsafe_allow_html=True,
+                )
+                if reg['status'] == 'active' and st.button("Cancel registration", key=f"unregister_{reg['event_id']}"):
+                    get_services().cancel_registration(st.session_state.user_id, reg['event_id'])
+                    st.rerun()
+
+            if waitlisted:
+                st.markdown("#### ⏳ Waitlist")
+                for entry in waitlisted:
+                    st.write(f"{entry['title']} | 📍 {entry['location']} | 📅 {entry['date']} — waiting since {entry['created_at'].strftime('%Y-%m-%d %H:%M')}")
+                    if st.button("Leave waitlist", key=f"leave_waitlist_{entry['event_id']}"):
+                        get_services().cancel_registration(st.session_state.user_id, entry['event_id'])
+                        st.rerun()
     except Exception as e:
         st.error(f"⚠️ Error fetching registered events: {str(e)}")
-    finally:
-        conn.close()
 
 # ✅ Buy Tickets (Only for Attendees, only active events)
 if menu == "Buy Ticket" and st.session_state.role == "attendee":
     st.subheader("🎟 Book Your Ticket")
     
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM events WHERE status = 'active'")
-        events = cursor.fetchall()
-    conn.close()
+    event = search_event_picker("ticket_search")
+
+    if event is not None:
+        # Current prices from the dynamic pricing job (cached, refreshed every few seconds)
+        vip_price, general_price = get_services().effective_prices(event)
 
-    if not events:
-        st.info("📢 No active events available.")
-    else:
-        event_options = {event['title']: event for event in events}
-        selected_event = st.selectbox("Select Event", list(event_options.keys()))
-        event = event_options[selected_event]
-        
         # Display remaining tickets and input fields side by side
         col1, col2 = st.columns(2)
         with col1:
-            st.write(f"Remaining VIP Tickets: {event['vip_tickets']} (Price: ${event['vip_price']:.2f})")
+            st.write(f"Remaining VIP Tickets: {event['vip_tickets']} (Price: ${vip_price:.2f})")
             vip_tickets = st.number_input("VIP Tickets", min_value=0, max_value=event['vip_tickets'], step=1, key="vip_input")
         with col2:
-            st.write(f"Remaining General Tickets: {event['general_tickets']} (Price: ${event['general_price']:.2f})")
+            st.write(f"Remaining General Tickets: {event['general_tickets']} (Price: ${general_price:.2f})")
             general_tickets = st.number_input("General Tickets", min_value=0, max_value=event['general_tickets'], step=1, key="general_input")
 
         total_tickets = vip_tickets + general_tickets
-        total_cost = (vip_tickets * event['vip_price']) + (general_tickets * event['general_price'])
+        total_cost = (vip_tickets * vip_price) + (general_tickets * general_price)
         if total_tickets > 0:
             st.write(f"Total Cost: ${total_cost:.2f}")
+            st.caption("Prices follow demand; you pay the price current when the booking is confirmed.")
 
         if st.button("Book Ticket"):
             if total_tickets == 0: 
                 st.warning("⚠️ Please select at least one ticket.")
             else:
                 try:
-                    conn = get_db_connection()
-                    with conn.cursor() as cursor:
-                        print(f"Booking for Event ID: {event['id']}, User ID: {st.session_state.user_id}")
-
-                        cursor.execute("""
-                            UPDATE events 
-                            SET vip_tickets = vip_tickets - %s, general_tickets = general_tickets - %s 
-                            WHERE id = %s AND status = 'active'
-                        """, (vip_tickets, general_tickets, event['id']))
-                        
-                        if cursor.rowcount == 0:
-                            st.error("⚠️ Event not found, already canceled, or tickets not available!")
-                            conn.rollback()
-                            st.stop()
-
-                        cursor.execute("""
-                            INSERT INTO bookings (user_id, event_id, vip_tickets_booked, general_tickets_booked) 
-                            VALUES (%s, %s, %s, %s)
-                        """, (st.session_state.user_id, event['id'], vip_tickets, general_tickets))
-
-                        if cursor.rowcount == 0:
-                            st.error("⚠️ Booking failed. Please try again.")
-                            conn.rollback()
-                        else:
-                            conn.commit()
-                            st.success(f"✅ Successfully booked {vip_tickets} VIP and {general_tickets} General ticket(s)! Total Cost: ${total_cost:.2f}")
-                            print("✅ Booking confirmed in the database!")
-
+                    booking = get_services().book(st.session_state.user_id, event['id'], vip_tickets, general_tickets)
+                    st.success(f"✅ Successfully booked {vip_tickets} VIP and {general_tickets} General ticket(s)! Total Cost: ${booking.amount:.2f}")
+                except booking_engine.SoldOut as e:
+                    st.error(f"⚠️ Tickets not available: {str(e)}")
+                except booking_engine.BookingError as e:
+                    st.error(f"⚠️ {str(e)}")
                 except Exception as e:
-                    conn.rollback()
                     st.error(f"⚠️ Error booking tickets: {str(e)}")
-                    print(f"Error: {str(e)}")
 
-                finally:
-                    conn.close()
+# ✅ View My Tickets (Only for Attendees): keyset-paged wallet, newest booking first
+if menu == "View My Tickets" and st.session_state.role == "attendee":
+    st.subheader("🎫 My Tickets")
+    try:
+        if "wallet_pages" not in st.session_state:
+            st.session_state.wallet_pages = 1
+        bookings, before = [], None
+        for _ in range(st.session_state.wallet_pages):
+            page, before = get_services().my_bookings(st.session_state.user_id, before=before)
+            bookings.extend(page)
+            if before is None:
+                break
+
+        if not bookings:
+            st.info("📢 You have not booked any tickets yet.")
+        for booking in bookings:
+            event_date = booking['date'].strftime("%Y-%m-%d") if isinstance(booking['date'], datetime) else booking['date']
+            status_note = {"canceled": "(Event Canceled — refunded)", "finished": "(Past Event)"}.get(booking['status'], "")
+            st.markdown(
+                f"""
+                <div style="background-color: white; padding: 15px; border-radius: 10px; box-shadow: 2px 2px 10px gray; margin-bottom: 10px; color: black;">
+                    <h2 style="color: black;">{booking['title']} {status_note}</h2>
+                    <p style="color: black;">📍 {booking['location']} | 📅 {event_date} | 🎟️ VIP: {booking['vip_tickets_booked']}, General: {booking['general_tickets_booked']} | 💵 ${booking['amount']:.2f}</p>
+                    <p style="color: black;">🔐 Ticket code: <code>{booking['ticket_code'] or '—'}</code></p>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
+        if before is not None and st.button("⬇️ Load more", key="wallet_load_more"):
+            st.session_state.wallet_pages += 1
+            st.rerun()
+    except Exception as e:
+        st.error(f"⚠️ Error fetching tickets: {str(e)}")
 
 # ✅ Update Event (Only for Organizers, restricted to their own active events)
 if menu == "Update Event":
@@ -629,11 +620,7 @@ if menu == "Update Event":
         st.error("❌ Only organizers can update events.")
     else:
         st.subheader("✏️ Update Event")
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM events WHERE user_id = %s AND status = 'active'", (st.session_state.user_id,))
-        events = cursor.fetchall()
-    conn.close()
+    events = load_event_snapshot().by_organizer(st.session_state.user_id)
     
     if not events:
         st.info("📢 You have no active events to update.")
@@ -646,7 +633,7 @@ if menu == "Update Event":
         if event['poster_path']:
                 st.write("Current Poster:")
                 try:
-                    st.image(event['poster_path'], use_container_width=True, width=200)
+                    show_poster(event['poster_path'], width=200)
                 except FileNotFoundError:
                     st.warning("⚠️ Current poster not found.")
         else:
@@ -662,45 +649,18 @@ if menu == "Update Event":
         
         if st.button("Update Event"):
             try:
-                conn = get_db_connection()
-                with conn.cursor() as cursor:
-                    # Initialize poster_path
-                    poster_path = event['poster_path']
-                    old_poster_path = poster_path  # Store for potential deletion
-                    # Handle new poster upload
-                    if new_poster_file:
-                            import os
-                            from datetime import datetime
-                            # Create unique filename with timestamp to avoid conflicts
-                            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                            file_extension = os.path.splitext(new_poster_file.name)[1]
-                            poster_filename = f"event_{event['id']}_{timestamp}{file_extension}"
-                            poster_path = os.path.join("posters", poster_filename)
-                                    
-                            # Save the new poster
-                            os.makedirs("posters", exist_ok=True)
-                            with open(poster_path, "wb") as f:
-                                f.write(new_poster_file.getbuffer())    
-
-                    cursor.execute(
-                        "UPDATE events SET title=%s, location=%s, description=%s, capacity=%s, poster_path=%s WHERE id=%s AND user_id=%s AND status = 'active'",
-                        (new_title, new_location, new_description, new_capacity, poster_path, event['id'], st.session_state.user_id)
-                    )
-                    if cursor.rowcount == 0:
-                        st.error("⚠️ No event updated. Either it doesn't exist, is canceled, or you don't have permission.")
-                    else:
-                        conn.commit()
-                        # Delete old poster if a new one was uploaded and old one exists
-                        if new_poster_file and old_poster_path and os.path.exists(old_poster_path):
-                                try:
-                                    os.remove(old_poster_path)
-                                except Exception as e:
-                                    st.warning(f"⚠️ Could not delete old poster: {str(e)}")
-                        st.success("✅ Event updated successfully!")
+                warnings = get_services().update_event(
+                    st.session_state.user_id, event['id'], new_title, new_location, new_description, new_capacity,
+                    poster=new_poster_file.getbuffer() if new_poster_file else None,
+                    poster_name=new_poster_file.name if new_poster_file else None,
+                )
+                for warning in warnings:
+                    st.warning(f"⚠️ {warning}")
+                st.success("✅ Event updated successfully!")
+            except ServiceError as e:
+                st.error(f"⚠️ {str(e)}")
             except Exception as e:
                 st.error(f"⚠️ Error updating event: {str(e)}")
-            finally:
-                conn.close()
 
 # ✅ Cancel Event (Only for Organizers, restricted to their own events)
 if menu == "Cancel Event":
@@ -709,11 +669,7 @@ if menu == "Cancel Event":
     else:
         # Existing code for canceling events...
         st.subheader("❌ Cancel Event")
-    conn = get_db_connection()
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM events WHERE user_id = %s AND status = 'active'", (st.session_state.user_id,))
-        events = cursor.fetchall()
-    conn.close()
+    events = load_event_snapshot().by_organizer(st.session_state.user_id)
     
     if not events:
         st.info("📢 You have no active events to cancel.")
@@ -723,36 +679,193 @@ if menu == "Cancel Event":
         event = event_options[selected_event]
         
         # Check if there are bookings for this event
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) as booking_count FROM bookings WHERE event_id = %s", (event['id'],))
-            booking_count = cursor.fetchone()['booking_count']
-        conn.close()
+        booking_count = get_services().booking_count(event['id'])
 
-        st.write(f"This event has {booking_count} booking(s). Canceling it will mark it as canceled, but bookings will remain.")
+        st.write(f"This event has {booking_count} booking(s). Canceling it takes effect immediately; every booking is refunded and its holder notified in the background.")
         
         if st.button("Cancel Event"):
             try:
-                conn = get_db_connection()
-                with conn.cursor() as cursor:
-                    # Update the event status to 'canceled'
-                    cursor.execute(
-                        "UPDATE events SET status = 'canceled' WHERE id = %s AND user_id = %s AND status = 'active'",
-                        (event['id'], st.session_state.user_id)
-                    )
-                    if cursor.rowcount == 0:
-                        st.error("⚠️ No event canceled. Either it doesn't exist, is already canceled, or you don't have permission.")
-                    else:
-                        conn.commit()
-                        st.success("✅ Event marked as canceled successfully!")
+                job_id = get_services().cancel_event(st.session_state.user_id, event['id'])
+                st.success(f"✅ Event canceled! Refunds are being processed (job #{job_id}).")
+            except ServiceError as e:
+                st.error(f"⚠️ {str(e)}")
             except Exception as e:
                 st.error(f"⚠️ Error canceling event: {str(e)}")
-            finally:
-                conn.close()
-    
+
+    # ✅ Cancellation progress (refund jobs run in the background and resume after restarts)
+    if st.session_state.role == "organizer":
+        jobs = get_services().cancellation_jobs(st.session_state.user_id)
+        if jobs:
+            st.subheader("🔄 Refund Progress")
+            st.button("Refresh")
+            for job in jobs:
+                total = max(job['total_bookings'], job['processed'], 1)
+                label = f"{job['title']}: {job['processed']}/{job['total_bookings']} bookings, {job['refunds_created']} refund(s) — {job['status']}"
+                st.progress(1.0 if job['status'] == "done" else min(job['processed'] / total, 1.0), text=label)
+                if job['error']:
+                    st.warning(f"⚠️ Last error: {job['error']}")
+
+
+# ✅ Check-in (Organizers): validate ticket codes at the door; keeps working if MySQL drops out
+if menu == "Check-in" and st.session_state.role == "organizer":
+    st.subheader("🚪 Door Check-in")
+    events = load_event_snapshot().by_organizer(st.session_state.user_id)
+    if not events:
+        st.info("📢 You have no active events to check in.")
+    else:
+        event_options = {event['title']: event for event in events}
+        event = event_options[st.selectbox("Event", list(event_options.keys()), key="checkin_event")]
+        # Scanners type the code and press Enter, which submits the form
+        with st.form("checkin_form", clear_on_submit=True):
+            code = st.text_input("Ticket code")
+            scanned = st.form_submit_button("Check in")
+        try:
+            if scanned:
+                result = get_services().check_in(st.session_state.user_id, event['id'], code)
+                messages = {
+                    "admitted": (st.success, "✅ Admitted"),
+                    "already_used": (st.error, "⛔ Already checked in"),
+                    "unknown": (st.warning, "⚠️ Not a valid ticket for this event (refunded, or sold after the last sync)"),
+                    "wrong_event": (st.error, "⛔ Ticket is for a different event"),
+                    "invalid": (st.error, "⛔ Invalid ticket code"),
+                }
+                show, message = messages[result.status]
+                show(f"{message}: {result.code}")
+            stats = get_services().checkin_gate(st.session_state.user_id, event['id']).stats()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Checked in", f"{stats['checked_in']} / {stats['tickets']}")
+            col2.metric("Refused here", stats['already_used'] + stats['unknown'] + stats['wrong_event'] + stats['invalid'])
+            col3.metric("Waiting to sync", stats['pending'])
+            if not stats['online']:
+                st.warning("📴 Database unreachable: checking in from the local snapshot; scans will sync when it is back.")
+            if stats['conflicts']:
+                st.warning(f"⚠️ {stats['conflicts']} ticket(s) were also admitted at another gate while offline.")
+        except ServiceError as e:
+            st.error(f"⚠️ {str(e)}")
+        except Exception as e:
+            st.error(f"⚠️ Check-in error: {str(e)}")
+
+# ✅ Insights (Organizers): the notebook's metrics, aggregated in MySQL
+if menu == "Insights" and st.session_state.role == "organizer":
+    st.subheader("📊 Insights")
+    scope = st.radio("Events", ["My events", "All events"], horizontal=True)
+    organizer_id = st.session_state.user_id if scope == "My events" else None
+
+    try:
+        data = get_query_cache().get_or_load(
+            ("insights", organizer_id), lambda: analytics.insights(get_pool(), organizer_id), ttl=60
+        )
+
+        st.markdown("#### 🎟️ Total Tickets Booked per Event")
+        ticket_totals = data["tickets"]
+        if ticket_totals["title"]:
+            st.bar_chart(pd.DataFrame(
+                {"VIP": ticket_totals["vip_total"], "General": ticket_totals["general_total"]}, index=ticket_totals["title"]
+            ))
+        else:
+            st.info("No bookings yet.")
+
+        st.markdown("#### 📈 Event Capacity vs Tickets Booked")
+        capacity = data["capacity"]
+        st.write(f"{capacity['events']} event(s) | average fill rate {capacity['mean_fill_rate']:.0%} | "
+                 f"trend: booked ≈ {capacity['slope']:.2f} × capacity + {capacity['intercept']:.1f}")
+        if len(capacity["capacity"]):
+            st.scatter_chart(pd.DataFrame({
+                "Capacity": capacity["capacity"], "Tickets Booked": capacity["booked"],
+            }), x="Capacity", y="Tickets Booked")
+
+        st.markdown("#### 💲 Ticket Price Distribution")
+        prices = data["prices"]
+        if len(prices["edges"]):
+            labels = [f"{lo:.0f}–{hi:.0f}" for lo, hi in zip(prices["edges"][:-1], prices["edges"][1:])]
+            st.bar_chart(pd.DataFrame(
+                {"VIP": prices["vip_price"], "General": prices["general_price"]}, index=labels
+            ))
+
+        st.markdown("#### 📉 Dynamic Pricing (my events)")
+        overview = get_services().pricing_overview(st.session_state.user_id)
+        if overview:
+            st.caption("Pressure > 1 means the tier sells out before the event at the current pace.")
+            st.dataframe(pd.DataFrame(overview), hide_index=True)
+
+        st.markdown("#### 🔥 Ticket Bookings by User and Event")
+        heatmap = data["heatmap"]
+        if heatmap["users"]:
+            st.dataframe(pd.DataFrame(heatmap["matrix"], index=heatmap["users"], columns=heatmap["events"]))
+
+        st.markdown("#### 👥 User Role Distribution")
+        roles = data["roles"]
+        st.bar_chart(pd.DataFrame({"Users": roles["users"]}, index=roles["role"]))
+    except Exception as e:
+        st.error(f"⚠️ Error computing insights: {str(e)}")
+
+# ✅ Performance (Admins): slowest pages and queries recorded by the instrumented pool
+if menu == "Performance" and st.session_state.role == "admin":
+    st.subheader("⏱️ Performance")
+    registry = instrumentation.REGISTRY
+    if not instrumentation.ENABLED:
+        st.info("Instrumentation is off (EMS_INSTRUMENT=0).")
+    st.caption(f"Since {datetime.fromtimestamp(registry.started_at).strftime('%Y-%m-%d %H:%M:%S')}, all sessions of this server process.")
+
+    st.markdown("#### 🐢 Slowest pages (by p95)")
+    pages = registry.slowest_pages()
+    if pages:
+        st.dataframe(pd.DataFrame(pages), hide_index=True)
+    else:
+        st.info("No page runs recorded yet.")
+
+    st.markdown("#### 🗄️ Most expensive queries (by total time)")
+    queries = registry.slowest_queries()
+    if queries:
+        st.dataframe(pd.DataFrame(queries), hide_index=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("⬇️ Prometheus metrics", registry.prometheus(), file_name="metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("Reset counters"):
+            registry.reset()
+            st.rerun()
+    with col3:
+        st.toggle("Profile my page runs", key="profile_runs",
+                  help="Samples the script thread's stack every few milliseconds while your pages run.")
+    if instrumentation.METRICS_LOG:
+        st.caption(f"Each run is also appended to {instrumentation.METRICS_LOG} as JSON.")
+
+    if isinstance(get_pool(), db_router.RoutedPool):
+        routing = get_pool().status()
+        st.markdown("#### 🔀 Read replicas")
+        st.caption(f"Read-your-writes: {routing['mode'] or 'no writes yet'}. "
+                   f"Replicas more than {db_router.MAX_LAG:.0f}s behind are skipped.")
+        st.dataframe(pd.DataFrame(routing["replicas"]), hide_index=True)
+        if routing["reads"]:
+            st.dataframe(pd.DataFrame([{"routed to": where, "reads": n} for where, n in routing["reads"].items()]),
+                         hide_index=True)
+
+    bus = get_services().bus
+    if bus is not None:
+        st.markdown("#### 📡 Cache bus")
+        st.caption("Invalidations exchanged with the other server processes; a resync clears this process's caches.")
+        st.dataframe(pd.DataFrame([bus.status()]), hide_index=True)
+
+    profiles = get_profiles()
+    if profiles:
+        st.markdown("#### 🔬 Sampled profiles of recent runs")
+        for page, finished, samples, top in reversed(profiles):
+            with st.expander(f"{page} at {finished.strftime('%H:%M:%S')} ({samples} samples)"):
+                st.dataframe(pd.DataFrame(top), hide_index=True)
 
 # ✅ Logout
 if menu == "Logout":
+    if st.session_state.get("run_profiler") is not None:
+        st.session_state.run_profiler.stop()
     st.session_state.clear()
     st.success("✅ Logged out!")
     st.rerun()
+
+# ✅ Close this rerun's instrumentation (reruns cut short by st.rerun()/st.stop() are not recorded)
+instrumentation.REGISTRY.end()
+if st.session_state.get("run_profiler") is not None:
+    run_profiler = st.session_state.run_profiler.stop()
+    st.session_state.run_profiler = None
+    get_profiles().append((menu, datetime.now(), run_profiler.samples, run_profiler.top()))
@@ -0,0 +1,56 @@
+"""Signed ticket codes.
+
+Every booking gets one code when it is made, stored in ``bookings.ticket_code``:
+
+    <event_id>-<nonce>-<mac>
+
+``nonce`` is random and ``mac`` is a truncated HMAC-SHA256 of
+``<event_id>-<nonce>`` under EMS_TICKET_SECRET. A code can therefore be
+checked for authenticity, and for the event it admits to, without a database
+lookup. The stored column is what makes it unique and ties it to a booking.
+
+Registrations have no stored code: ``registration_code()`` derives one from
+the registration id (nonce ``R<id>``), so it needs no column and is the same
+every time it is shown.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+
+# Must be the same for every process that issues or checks tickets; set it in production
+TICKET_SECRET = os.environ.get("EMS_TICKET_SECRET", "event-management-dev-ticket-secret").encode()
+NONCE_BYTES = 9
+MAC_BYTES = 12
+
+
+def _b32(raw):
+    return base64.b32encode(raw).decode().rstrip("=")
+
+
+def _mac(event_id, nonce, secret=TICKET_SECRET):
+    return _b32(hmac.new(secret, f"{event_id}-{nonce}".encode(), hashlib.sha256).digest()[:MAC_BYTES])
+
+
+def issue(event_id, secret=TICKET_SECRET):
+    """A fresh code for a ticket to ``event_id``."""
+    nonce = _b32(secrets.token_bytes(NONCE_BYTES))
+    return f"{event_id}-{nonce}-{_mac(event_id, nonce, secret)}"
+
+
+def registration_code(event_id, registration_id, secret=TICKET_SECRET):
+    """The entry code of a registration, derived from its id."""
+    nonce = f"R{registration_id}"
+    return f"{event_id}-{nonce}-{_mac(event_id, nonce, secret)}"
+
+
+def verify(code, secret=TICKET_SECRET):
+    """The event id a genuine code admits to, or ``None`` for a forged or malformed code."""
+    parts = (code or "").strip().upper().split("-")
+    if len(parts) != 3 or not parts[0].isdigit():
+        return None
+    event_id, nonce, mac = parts
+    if not hmac.compare_digest(mac, _mac(int(event_id), nonce, secret)):
+        return None
+    return int(event_id)
@@ -0,0 +1,185 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, time, timedelta
+
+# Venues are bookable between these hours when looking for free slots
+DAY_OPENS = time(8, 0)
+DAY_CLOSES = time(22, 0)
+SLOT_STEP = timedelta(minutes=15)
+MAX_DURATION_MINUTES = 24 * 60
+
+
+def event_interval(row):
+    start = datetime.combine(row.date, row.time)
+    return start, start + timedelta(minutes=row.duration_minutes or 60)
+
+
+def _round_up(moment, step=SLOT_STEP):
+    midnight = datetime.combine(moment.date(), time(0))
+    steps = -(-(moment - midnight) // step)
+    return midnight + steps * step
+
+
+class VenueSchedule:
+    """Active bookings of one venue as a sorted interval list.
+
+    ``entries`` is sorted by start; ``max_end[i]`` is the latest end among
+    ``entries[:i + 1]``, so "does anything overlap [start, end)?" is one
+    bisect plus one comparison. Legacy data may contain overlapping events,
+    which the prefix maximum handles correctly.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.max_end = []
+
+    @classmethod
+    def build(cls, entries):
+        """A schedule of ``(start, end, event_id)`` entries: one sort and one prefix-max pass."""
+        schedule = cls()
+        schedule.entries = sorted(entries)
+        running = None
+        for _, end, _ in schedule.entries:
+            running = end if running is None or end > running else running
+            schedule.max_end.append(running)
+        return schedule
+
+    def _rebuild_max_end(self, from_index):
+        running = self.max_end[from_index - 1] if from_index > 0 else None
+        del self.max_end[from_index:]
+        for _, end, _ in self.entries[from_index:]:
+            running = end if running is None or end > running else running
+            self.max_end.append(running)
+
+    def add(self, start, end, event_id):
+        """Insert one event; O(n) for the prefix maximum, so bulk loads use ``build()``."""
+        entry = (start, end, event_id)
+        insort(self.entries, entry)
+        self._rebuild_max_end(bisect_left(self.entries, entry))
+
+    def remove(self, start, end, event_id):
+        entry = (start, end, event_id)
+        pos = bisect_left(self.entries, entry)
+        if pos < len(self.entries) and self.entries[pos] == entry:
+            del self.entries[pos]
+            self._rebuild_max_end(pos)
+
+    def overlaps(self, start, end):
+        idx = bisect_left(self.entries, (end,))
+        return idx > 0 and self.max_end[idx - 1] > start
+
+    def conflicts(self, start, end):
+        """Event ids overlapping [start, end), latest start first."""
+        found = []
+        j = bisect_left(self.entries, (end,)) - 1
+        while j >= 0 and self.max_end[j] > start:
+            if self.entries[j][1] > start:
+                found.append(self.entries[j][2])
+            j -= 1
+        return found
+
+    def busy_between(self, window_start, window_end):
+        """Merged busy intervals intersecting the window."""
+        k = bisect_left(self.entries, (window_end,))
+        # max_end never decreases, so everything before j ends before the window
+        j = bisect_right(self.max_end, window_start, 0, k)
+        merged = []
+        for start, end, _ in self.entries[j:k]:
+            if end <= window_start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+
+class VenueIndex:
+    """Per-location schedules of active events, kept in sync with an EventSnapshot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._venues = {}
+        self._intervals = {}
+
+    # EventSnapshot listener interface
+    def snapshot_reset(self, rows):
+        # Built outside the lock, then swapped in; readers keep the old schedules meanwhile
+        intervals, by_location = {}, {}
+        for row in rows:
+            start, end = event_interval(row)
+            intervals[row.id] = (row.location, start, end)
+            by_location.setdefault(row.location, []).append((start, end, row.id))
+        venues = {location: VenueSchedule.build(entries) for location, entries in by_location.items()}
+        with self._lock:
+            self._venues = venues
+            self._intervals = intervals
+
+    def snapshot_changed(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old.id)
+            if new is not None:
+                self._add(new)
+
+    def _add(self, row):
+        start, end = event_interval(row)
+        self._venues.setdefault(row.location, VenueSchedule()).add(start, end, row.id)
+        self._intervals[row.id] = (row.location, start, end)
+
+    def _remove(self, event_id):
+        known = self._intervals.pop(event_id, None)
+        if known is not None:
+            location, start, end = known
+            self._venues[location].remove(start, end, event_id)
+
+    # Queries
+    def conflicts(self, location, start, duration_minutes, exclude_id=None):
+        end = start + timedelta(minutes=duration_minutes)
+        with self._lock:
+            schedule = self._venues.get(location)
+            if schedule is None or not schedule.overlaps(start, end):
+                return []
+            return [event_id for event_id in schedule.conflicts(start, end) if event_id != exclude_id]
+
+    def free_slots(self, location, window_start, window_end, duration_minutes,
+                   day_opens=DAY_OPENS, day_closes=DAY_CLOSES):
+        """Free ``(start, end)`` gaps of at least ``duration_minutes`` within opening hours."""
+        duration = timedelta(minutes=duration_minutes)
+        with self._lock:
+            schedule = self._venues.get(location)
+            busy = schedule.busy_between(window_start, window_end) if schedule else []
+        slots = []
+        day = window_start.date()
+        while day <= window_end.date():
+            opens = max(datetime.combine(day, day_opens), window_start)
+            closes = min(datetime.combine(day, day_closes), window_end)
+            cursor = _round_up(opens)
+            for start, end in busy:
+                if end <= cursor or start >= closes:
+                    continue
+                if start - cursor >= duration:
+                    slots.append((cursor, start))
+                cursor = max(cursor, _round_up(end))
+            if closes - cursor >= duration:
+                slots.append((cursor, closes))
+            day += timedelta(days=1)
+        return slots
+
+    def nearest_free_slot(self, location, desired_start, duration_minutes, earliest=None, search_days=7):
+        """Free start time closest to ``desired_start`` (not before ``earliest``)."""
+        duration = timedelta(minutes=duration_minutes)
+        window_start = desired_start - timedelta(days=search_days)
+        if earliest is not None:
+            window_start = max(window_start, earliest)
+        window_end = desired_start + timedelta(days=search_days)
+        best = None
+        for gap_start, gap_end in self.free_slots(location, window_start, window_end, duration_minutes):
+            latest = gap_end - duration
+            candidate = min(max(desired_start, gap_start), latest)
+            candidate = _round_up(candidate)
+            if candidate > latest:
+                candidate = gap_start
+            if best is None or abs(candidate - desired_start) < abs(best - desired_start):
+                best = candidate
+        return best
@@ -0,0 +1,183 @@
+"""Capacity-aware registration with a FIFO waitlist.
+
+``event_sales_rollup.registrations`` is the per-event counter: a
+registration claims a place with one guarded increment (``registrations <
+capacity``) instead of counting rows, so confirming costs the same at ten
+or ten thousand registrations. When the guard fails the participant joins
+``registration_waitlist``; ``promote()`` moves the head of the waitlist into
+``registrations`` in batches whenever places free up. While anyone is
+waiting, new registrants queue behind them even if a place is free, so a
+place freed by a cancellation or a capacity increase goes to the waitlist
+head.
+"""
+from collections import namedtuple
+
+import pymysql
+
+import sales_rollup
+
+PROMOTE_BATCH = 200
+
+REGISTERED = "registered"
+WAITLISTED = "waitlisted"
+
+Promotion = namedtuple("Promotion", ["event_id", "user_ids"])
+
+
+class RegistrationError(Exception):
+    """Base class for registrations that could not be made."""
+
+
+class EventUnavailable(RegistrationError):
+    """The event does not exist or is no longer active."""
+
+
+class AlreadyRegistered(RegistrationError):
+    """The participant already holds a place or a waitlist entry."""
+
+
+def _claim_place(cursor, event_id):
+    cursor.execute("""
+        UPDATE event_sales_rollup r
+        JOIN events e ON e.id = r.event_id
+        SET r.registrations = r.registrations + 1
+        WHERE r.event_id = %s AND e.status = 'active' AND r.registrations < e.capacity AND r.waitlisted = 0
+    """, (event_id,))
+    return cursor.rowcount == 1
+
+
+def register(pool, user_id, event_id):
+    """Register, or join the waitlist if the event is full; returns ``REGISTERED`` or ``WAITLISTED``."""
+    with pool.connection() as conn, conn.cursor() as cursor:
+        conn.begin()
+        try:
+            claimed = _claim_place(cursor, event_id)
+            if not claimed:
+                cursor.execute("""
+                    SELECT e.status, r.event_id AS rollup_id
+                    FROM events e LEFT JOIN event_sales_rollup r ON r.event_id = e.id
+                    WHERE e.id = %s
+                """, (event_id,))
+                event = cursor.fetchone()
+                if event is None or event["status"] != "active":
+                    raise EventUnavailable("Event not found or already canceled.")
+                if event["rollup_id"] is None:
+                    # Without its counter row the guard matches nothing and everyone would be waitlisted
+                    sales_rollup.ensure(cursor, event_id)
+                    claimed = _claim_place(cursor, event_id)
+            if claimed:
+                cursor.execute("INSERT INTO registrations (user_id, event_id) VALUES (%s, %s)", (user_id, event_id))
+                conn.commit()
+                return REGISTERED
+
+            cursor.execute("SELECT 1 FROM registrations WHERE user_id = %s AND event_id = %s", (user_id, event_id))
+            if cursor.fetchone():
+                raise AlreadyRegistered("You are already registered for this event.")
+            cursor.execute("INSERT INTO registration_waitlist (event_id, user_id) VALUES (%s, %s)", (event_id, user_id))
+            cursor.execute(
+                "UPDATE event_sales_rollup SET waitlisted = waitlisted + 1 WHERE event_id = %s", (event_id,)
+            )
+            conn.commit()
+            return WAITLISTED
+        except pymysql.err.IntegrityError:
+            conn.rollback()
+            raise AlreadyRegistered("You are already registered or waitlisted for this event.") from None
+        except RegistrationError:
+            conn.rollback()
+            raise
+
+
+def cancel(pool, user_id, event_id, batch=PROMOTE_BATCH):
+    """Give up a place or a waitlist entry; a freed place goes to the waitlist head.
+
+    Returns the ``Promotion`` made (possibly with no users), or ``None`` if
+    the participant held neither.
+    """
+    with pool.connection() as conn, conn.cursor() as cursor:
+        conn.begin()
+        cursor.execute("DELETE FROM registrations WHERE user_id = %s AND event_id = %s", (user_id, event_id))
+        freed_place = cursor.rowcount == 1
+        if freed_place:
+            cursor.execute(
+                "UPDATE event_sales_rollup SET registrations = registrations - 1 WHERE event_id = %s", (event_id,)
+            )
+            left_waitlist = False
+        else:
+            cursor.execute(
+                "DELETE FROM registration_waitlist WHERE user_id = %s AND event_id = %s", (user_id, event_id)
+            )
+            left_waitlist = cursor.rowcount == 1
+            if left_waitlist:
+                cursor.execute(
+                    "UPDATE event_sales_rollup SET waitlisted = waitlisted - 1 WHERE event_id = %s", (event_id,)
+                )
+        conn.commit()
+    # Promote on a fresh connection once this one is back in the pool
+    if freed_place:
+        return promote(pool, event_id, batch)
+    return Promotion(event_id, []) if left_waitlist else None
+
+
+def promote(pool, event_id, batch=PROMOTE_BATCH):
+    """Fill free places from the head of the waitlist, ``batch`` entries per transaction."""
+    promoted = []
+    while True:
+        with pool.connection() as conn, conn.cursor() as cursor:
+            conn.begin()
+            # Locking the counter row serialises promotion with new registrations
+            cursor.execute("""
+                SELECT r.registrations, r.waitlisted, e.capacity, e.status
+                FROM event_sales_rollup r JOIN events e ON e.id = r.event_id
+                WHERE r.event_id = %s FOR UPDATE
+            """, (event_id,))
+            state = cursor.fetchone()
+            if state is None or state["status"] != "active" or not state["waitlisted"]:
+                conn.rollback()
+                break
+            free = state["capacity"] - state["registrations"]
+            if free <= 0:
+                conn.rollback()
+                break
+
+            cursor.execute("""
+                SELECT id, user_id FROM registration_waitlist
+                WHERE event_id = %s ORDER BY id LIMIT %s FOR UPDATE
+            """, (event_id, min(free, batch)))
+            head = cursor.fetchall()
+            if not head:
+                cursor.execute("UPDATE event_sales_rollup SET waitlisted = 0 WHERE event_id = %s", (event_id,))
+                conn.commit()
+                break
+
+            # pymysql rewrites this into one multi-row INSERT
+            cursor.executemany(
+                "INSERT IGNORE INTO registrations (user_id, event_id) VALUES (%s, %s)",
+                [(entry["user_id"], event_id) for entry in head],
+            )
+            placed = cursor.rowcount
+            cursor.execute(
+                f"DELETE FROM registration_waitlist WHERE id IN ({', '.join(['%s'] * len(head))})",
+                [entry["id"] for entry in head],
+            )
+            cursor.execute("""
+                UPDATE event_sales_rollup
+                SET registrations = registrations + %s, waitlisted = waitlisted - %s
+                WHERE event_id = %s
+            """, (placed, len(head), event_id))
+            conn.commit()
+        promoted.extend(entry["user_id"] for entry in head)
+        if len(head) < batch:
+            break
+    return Promotion(event_id, promoted)
+
+
+def user_waitlist(pool, user_id):
+    with pool.read_connection(session=user_id) as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT w.event_id, w.created_at, e.title, e.location, e.date, e.time, e.status
+            FROM registration_waitlist w
+            JOIN events e ON e.id = w.event_id
+            WHERE w.user_id = %s
+            ORDER BY w.id
+        """, (user_id,))
+        return cursor.fetchall()